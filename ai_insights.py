@@ -4,37 +4,36 @@ import re
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Optional, Tuple
-from openai import OpenAI
-import anthropic
 import streamlit as st
 
-# Initialize API clients
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
+from llm_client import LLMRequest, complete, complete_many, default_provider, provider_available
+from prompt_context import build_context, summarize_dataset
+from profiler import ColumnProfile, profile_dataset
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
-
-def generate_enhanced_insights(data: pd.DataFrame, provider: str = "openai") -> Dict[str, Any]:
+def generate_enhanced_insights(data: pd.DataFrame, provider: str = "openai",
+                               profiles: Optional[Dict[str, ColumnProfile]] = None,
+                               fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Generate AI-enhanced insights from data using the specified AI provider.
     
     Args:
         data: Input DataFrame
         provider: AI provider to use ("openai" or "anthropic")
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
     Returns:
         Dictionary containing enhanced insights
     """
     # Quick validation
-    if provider == "openai" and not OPENAI_API_KEY:
+    if provider == "openai" and not provider_available("openai"):
         return {"error": "OpenAI API key not set. Please configure the OPENAI_API_KEY environment variable."}
     
-    if provider == "anthropic" and not ANTHROPIC_API_KEY:
+    if provider == "anthropic" and not provider_available("anthropic"):
         return {"error": "Anthropic API key not set. Please configure the ANTHROPIC_API_KEY environment variable."}
     
     # Prepare data information
-    data_info = _prepare_data_info(data)
+    data_info = summarize_dataset(data, profiles, fingerprints)
     
     # Generate insights using the selected provider
     if provider == "anthropic":
@@ -44,106 +43,12 @@ def generate_enhanced_insights(data: pd.DataFrame, provider: str = "openai") ->
     
     return insights
 
-def _prepare_data_info(data: pd.DataFrame) -> Dict[str, Any]:
-    """
-    Prepare a comprehensive summary of the DataFrame structure for AI models.
-    """
-    # Basic DataFrame info
-    info = {
-        "rows": len(data),
-        "columns": list(data.columns),
-        "column_types": {col: str(dtype) for col, dtype in data.dtypes.items()},
-        "column_examples": {},
-        "column_stats": {},
-        "missing_values": {col: int(data[col].isna().sum()) for col in data.columns},
-        "missing_percentage": {col: float(data[col].isna().mean() * 100) for col in data.columns}
-    }
-    
-    # Generate examples and stats for each column
-    for col in data.columns:
-        # Get examples
-        non_null_vals = data[col].dropna()
-        if not non_null_vals.empty:
-            examples = non_null_vals.sample(min(3, len(non_null_vals))).tolist()
-            info["column_examples"][col] = examples
-        
-        # Generate stats for numeric columns
-        if pd.api.types.is_numeric_dtype(data[col]):
-            numeric_data = data[col].dropna()
-            if not numeric_data.empty:
-                info["column_stats"][col] = {
-                    "min": float(numeric_data.min()),
-                    "max": float(numeric_data.max()),
-                    "mean": float(numeric_data.mean()),
-                    "median": float(numeric_data.median()),
-                    "std": float(numeric_data.std()),
-                    "skew": float(numeric_data.skew()) if len(numeric_data) > 2 else 0,
-                    "unique_count": int(numeric_data.nunique()),
-                    "zeros_count": int((numeric_data == 0).sum()),
-                    "zeros_percentage": float(((numeric_data == 0).sum() / len(numeric_data)) * 100)
-                }
-            
-        # Generate stats for categorical columns
-        elif pd.api.types.is_object_dtype(data[col]):
-            cat_data = data[col].dropna()
-            if not cat_data.empty:
-                value_counts = cat_data.value_counts().head(5).to_dict()
-                info["column_stats"][col] = {
-                    "unique_count": int(cat_data.nunique()),
-                    "top_values": {str(k): int(v) for k, v in value_counts.items()},
-                    "unique_percentage": float((cat_data.nunique() / len(cat_data)) * 100)
-                }
-            
-        # Generate stats for datetime columns
-        elif pd.api.types.is_datetime64_dtype(data[col]):
-            date_data = data[col].dropna()
-            if not date_data.empty:
-                info["column_stats"][col] = {
-                    "min": str(date_data.min()),
-                    "max": str(date_data.max()),
-                    "range_days": int((date_data.max() - date_data.min()).days),
-                    "unique_dates": int(date_data.dt.date.nunique()),
-                    "weekday_distribution": date_data.dt.dayofweek.value_counts().to_dict(),
-                    "unique_percentage": float((date_data.nunique() / len(date_data)) * 100)
-                }
-    
-    # Calculate correlations for numeric columns
-    numeric_cols = data.select_dtypes(include=['number']).columns.tolist()
-    if len(numeric_cols) > 1:
-        try:
-            corr_matrix = data[numeric_cols].corr().round(2)
-            # Filter to significant correlations (absolute value > 0.5)
-            significant_corrs = []
-            for i, col1 in enumerate(corr_matrix.columns):
-                for j, col2 in enumerate(corr_matrix.columns):
-                    if i < j:  # Only take pairs once and ignore self-correlations
-                        corr_val = corr_matrix.iloc[i, j]
-                        if abs(corr_val) > 0.5:  # Significant threshold
-                            significant_corrs.append({
-                                "col1": col1, 
-                                "col2": col2, 
-                                "correlation": float(corr_val),
-                                "correlation_type": "positive" if corr_val > 0 else "negative"
-                            })
-            
-            info["correlations"] = significant_corrs
-        except:
-            info["correlations"] = []
-    else:
-        info["correlations"] = []
-    
-    return info
-
 def _generate_openai_insights(data_info: Dict[str, Any], data: pd.DataFrame) -> Dict[str, Any]:
     """
     Generate insights using OpenAI API.
     """
-    # Create a small sample of the data as context
-    try:
-        sample_rows = min(5, len(data))
-        data_sample = data.head(sample_rows).to_string()
-    except:
-        data_sample = "Error creating data sample"
+    # Compact, token-budgeted summary of the most notable columns
+    context = build_context(data_info, data)
     
     # Prepare the system message with detailed instructions
     system_message = f"""
@@ -184,41 +89,24 @@ def _generate_openai_insights(data_info: Dict[str, Any], data: pd.DataFrame) ->
     
     Here is the data information:
     
-    Dataset Size: {data_info['rows']} rows with {len(data_info['columns'])} columns
-    
-    Column Types:
-    {json.dumps(data_info['column_types'], indent=2)}
-    
-    Column Statistics:
-    {json.dumps(data_info['column_stats'], indent=2)}
-    
-    Missing Values:
-    {json.dumps(data_info['missing_values'], indent=2)}
-    
-    Correlations:
-    {json.dumps(data_info['correlations'], indent=2)}
-    
-    Here's a sample of the data:
-    {data_sample}
+{context.text}
     """
     
     # Generate insights using OpenAI
+    request = LLMRequest.create(
+        "openai",
+        "Generate comprehensive data insights based on the provided information.",
+        system=system_message,
+        json_mode=True,
+        temperature=0.2,
+        max_tokens=1500
+    )
     try:
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": "Generate comprehensive data insights based on the provided information."}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.2,
-            max_tokens=1500
-        )
+        content = complete(request)
         
         # Parse the response JSON
-        insights_json = json.loads(response.choices[0].message.content)
+        insights_json = json.loads(content)
+        insights_json["prompt_tokens"] = request.prompt_tokens
         return insights_json
     except Exception as e:
         return {
@@ -230,12 +118,8 @@ def _generate_anthropic_insights(data_info: Dict[str, Any], data: pd.DataFrame)
     """
     Generate insights using Anthropic API.
     """
-    # Create a small sample of the data as context
-    try:
-        sample_rows = min(5, len(data))
-        data_sample = data.head(sample_rows).to_string()
-    except:
-        data_sample = "Error creating data sample"
+    # Compact, token-budgeted summary of the most notable columns
+    context = build_context(data_info, data)
     
     # Prepare the prompt with detailed instructions
     prompt = f"""
@@ -276,37 +160,19 @@ def _generate_anthropic_insights(data_info: Dict[str, Any], data: pd.DataFrame)
     
     Here is the data information:
     
-    Dataset Size: {data_info['rows']} rows with {len(data_info['columns'])} columns
-    
-    Column Types:
-    {json.dumps(data_info['column_types'], indent=2)}
-    
-    Column Statistics:
-    {json.dumps(data_info['column_stats'], indent=2)}
-    
-    Missing Values:
-    {json.dumps(data_info['missing_values'], indent=2)}
-    
-    Correlations:
-    {json.dumps(data_info['correlations'], indent=2)}
-    
-    Here's a sample of the data:
-    {data_sample}
+{context.text}
     """
     
     # Generate insights using Anthropic
+    request = LLMRequest.create(
+        "anthropic",
+        prompt,
+        system="You are an expert data analyst. Provide detailed insights only based on the data provided. Present your analysis in well-structured JSON format.",
+        temperature=0.2,
+        max_tokens=1500
+    )
     try:
-        # the newest Anthropic model is "claude-3-5-sonnet-20241022" which was released October 22, 2024
-        message = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1500,
-            temperature=0.2,
-            system="You are an expert data analyst. Provide detailed insights only based on the data provided. Present your analysis in well-structured JSON format.",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        # Extract and parse the JSON response
-        content = message.content[0].text
+        content = complete(request)
         
         # Try to extract JSON from the response if it's wrapped in code blocks
         if "```json" in content:
@@ -315,7 +181,8 @@ def _generate_anthropic_insights(data_info: Dict[str, Any], data: pd.DataFrame)
         else:
             # Otherwise try to parse the entire response as JSON
             insights_json = json.loads(content)
-            
+        
+        insights_json["prompt_tokens"] = request.prompt_tokens
         return insights_json
     except Exception as e:
         return {
@@ -366,6 +233,10 @@ def format_insights_for_display(insights: Dict[str, Any]) -> Dict[str, Any]:
     if "recommendations" in insights:
         formatted["recommendations"] = insights["recommendations"]
     
+    # Keep the estimated prompt size for display
+    if "prompt_tokens" in insights:
+        formatted["prompt_tokens"] = insights["prompt_tokens"]
+    
     # Format visualization suggestions
     if "potential_visualizations" in insights:
         formatted["visualizations"] = []
@@ -390,10 +261,10 @@ def generate_insight_highlights(data: pd.DataFrame, max_insights: int = 3) -> Li
     Returns:
         List of key insight strings
     """
-    if not openai_client and not anthropic_client:
+    provider = default_provider()
+    if provider is None:
         return ["AI insights unavailable - please configure API keys."]
     
-    provider = "anthropic" if anthropic_client else "openai"
     insights = generate_enhanced_insights(data, provider)
     
     # Extract key highlights from insights
@@ -434,39 +305,79 @@ def get_column_recommendations(data: pd.DataFrame, column_name: str) -> List[str
     Returns:
         List of recommendations for this column
     """
-    if not openai_client and not anthropic_client:
-        return ["AI recommendations unavailable - please configure API keys."]
+    return get_columns_recommendations(data, [column_name])[column_name]
+
+def get_columns_recommendations(data: pd.DataFrame, columns: List[str],
+                                profiles: Optional[Dict[str, ColumnProfile]] = None,
+                                fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, List[str]]:
+    """
+    Get AI-powered recommendations for several columns, requested concurrently.
     
-    provider = "anthropic" if anthropic_client else "openai"
+    Args:
+        data: Input DataFrame
+        columns: Names of the columns to analyze
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
+        
+    Returns:
+        Dictionary mapping each column to its list of recommendations
+    """
+    provider = default_provider()
+    if provider is None:
+        return {col: ["AI recommendations unavailable - please configure API keys."] for col in columns}
+    
+    if profiles is None:
+        profiles = profile_dataset(data[columns], fingerprints=fingerprints)
     
-    # Extract column-specific information
-    column_type = str(data[column_name].dtype)
+    requests = [
+        LLMRequest.create(provider, _column_prompt(col, str(data[col].dtype), profiles[col]),
+                          temperature=0.2, max_tokens=500)
+        for col in columns
+    ]
     
+    try:
+        responses = complete_many(requests)
+    except Exception as e:
+        return {col: [f"Error generating recommendations: {str(e)}"] for col in columns}
+    
+    recommendations = {}
+    for col, response in zip(columns, responses):
+        if isinstance(response, Exception):
+            recommendations[col] = [f"Error generating recommendations: {str(response)}"]
+        else:
+            recommendations[col] = _clean_recommendations(response)
+    
+    return recommendations
+
+def _column_prompt(column_name: str, column_type: str, profile: ColumnProfile) -> str:
+    """
+    Build the recommendation prompt for a single column from its profile.
+    """
     # Prepare column-specific statistics
-    if pd.api.types.is_numeric_dtype(data[column_name]):
+    if profile.is_numeric:
         stats = {
-            "min": data[column_name].min(),
-            "max": data[column_name].max(),
-            "mean": data[column_name].mean(),
-            "median": data[column_name].median(),
-            "std": data[column_name].std(),
-            "missing": data[column_name].isna().sum()
+            "min": float(profile.min) if profile.min is not None else None,
+            "max": float(profile.max) if profile.max is not None else None,
+            "mean": profile.mean,
+            "median": profile.median,
+            "std": profile.std,
+            "missing": profile.missing_count
         }
-    elif pd.api.types.is_object_dtype(data[column_name]):
+    elif profile.kind == 'categorical':
         stats = {
-            "unique_values": data[column_name].nunique(),
-            "most_common": data[column_name].value_counts().head(3).to_dict(),
-            "missing": data[column_name].isna().sum()
+            "unique_values": profile.unique_count,
+            "most_common": {str(k): int(v) for k, v in list(profile.top_values.items())[:3]},
+            "missing": profile.missing_count
         }
     else:
         # Datetime or other type
         stats = {
-            "unique_values": data[column_name].nunique(),
-            "missing": data[column_name].isna().sum()
+            "unique_values": profile.unique_count,
+            "missing": profile.missing_count
         }
     
     # Generate column-specific prompt
-    prompt = f"""
+    return f"""
     Analyze this column from the dataset and provide specific recommendations:
     
     Column Name: {column_name}
@@ -476,34 +387,17 @@ def get_column_recommendations(data: pd.DataFrame, column_name: str) -> List[str
     Provide 3-5 specific recommendations for further analysis or data cleaning for this column.
     Focus on actionable advice based on the column's characteristics.
     """
-    
-    try:
-        if provider == "anthropic":
-            message = anthropic_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=500,
-                temperature=0.2,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            recommendations = message.content[0].text.split("\n")
-        else:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=500
-            )
-            recommendations = response.choices[0].message.content.split("\n")
-        
-        # Clean up the recommendations
-        clean_recommendations = []
-        for rec in recommendations:
-            rec = rec.strip()
-            if rec and not rec.startswith("#") and len(rec) > 10:
-                # Remove numbering if present (e.g., "1.", "1)", etc.)
-                rec = re.sub(r"^\d+[\.\)\-]\s*", "", rec)
-                clean_recommendations.append(rec)
-        
-        return clean_recommendations
-    except Exception as e:
-        return [f"Error generating recommendations: {str(e)}"]
\ No newline at end of file
+
+def _clean_recommendations(response: str) -> List[str]:
+    """
+    Split a recommendation response into individual recommendations.
+    """
+    clean_recommendations = []
+    for rec in response.split("\n"):
+        rec = rec.strip()
+        if rec and not rec.startswith("#") and len(rec) > 10:
+            # Remove numbering if present (e.g., "1.", "1)", etc.)
+            rec = re.sub(r"^\d+[\.\)\-]\s*", "", rec)
+            clean_recommendations.append(rec)
+    
+    return clean_recommendations
@@ -7,17 +7,30 @@ import plotly.express as px
 
 from data_processor import process_data, filter_data, get_basic_stats
 from insights_generator import generate_automated_insights, extract_key_metrics
-from visualization import create_trend_chart, create_correlation_heatmap, create_distribution_plot
-from chatbot import process_query
-from utils import get_file_extension, show_error, show_success
+from visualization import create_trend_chart, create_correlation_heatmap, create_distribution_plot, scatter_figure, aggregated_bar_figure, box_figure
+from chatbot import chat_prompt_tokens, process_query, stream_query
+from profiler import profile_dataset
+from utils import column_fingerprints, get_file_extension, show_chart, show_error, show_success, show_info
+from data_loader import (
+    load_dataset,
+    list_local_datasets,
+    open_local_dataset,
+    read_columnar_schema,
+    overview_metrics,
+    LARGE_FILE_BYTES,
+    COLUMNAR_EXTENSIONS,
+    SUPPORTED_EXTENSIONS,
+    LOCAL_DATA_DIR
+)
 
 # Import AI-powered insights mechanism
 from ai_insights import (
     generate_enhanced_insights, 
     format_insights_for_display, 
     generate_insight_highlights,
-    get_column_recommendations
+    get_columns_recommendations
 )
+from llm_client import provider_available
 
 # Set page configuration
 st.set_page_config(
@@ -36,6 +49,36 @@ if 'insights' not in st.session_state:
     st.session_state.insights = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'overview' not in st.session_state:
+    st.session_state.overview = None
+if 'memory_report' not in st.session_state:
+    st.session_state.memory_report = None
+
+
+def store_dataset(data: pd.DataFrame, file_name: str, dataset_key: str,
+                  overview=None, memory_report=None) -> None:
+    """
+    Store a loaded dataset in session state, resetting insights when the data changed.
+    
+    Args:
+        data: Loaded DataFrame
+        file_name: Name shown in the overview header
+        dataset_key: Key identifying the dataset contents
+        overview: Optional streaming overview metrics
+        memory_report: Optional dtype optimization report
+    """
+    st.session_state.data = data
+    # Hashed once per loaded dataset version; every cache below is keyed on these
+    st.session_state.fingerprints = column_fingerprints(data)
+    st.session_state.file_name = file_name
+    st.session_state.overview = overview
+    st.session_state.memory_report = memory_report
+    
+    # Reset insights only when the dataset actually changed
+    if st.session_state.get('dataset_key') != dataset_key:
+        st.session_state.dataset_key = dataset_key
+        st.session_state.insights = None
+        st.session_state.chat_history = []
 
 
 def main():
@@ -44,31 +87,89 @@ def main():
         st.title("📊 Data Insights Explorer")
         st.markdown("---")
         
-        # Data upload section
-        st.header("Upload Your Data")
-        uploaded_file = st.file_uploader("Choose a CSV or Excel file", type=['csv', 'xlsx', 'xls'])
+        # Data source selection (local mode only when a data directory is configured)
+        data_source = "Upload file"
+        if LOCAL_DATA_DIR:
+            data_source = st.radio("Data source", ["Upload file", "Local data directory"], horizontal=True)
+        
+        uploaded_file = None
+        if data_source == "Local data directory":
+            st.header("Open Local Data")
+            local_files = list_local_datasets()
+            if local_files:
+                local_file = st.selectbox("Choose a memory-mapped file (Arrow, Feather or .npy)", local_files)
+                if st.session_state.get('upload_id') != ('local', local_file):
+                    try:
+                        data, dataset_key = open_local_dataset(local_file)
+                        store_dataset(data, local_file, dataset_key)
+                        st.session_state.source_columns = None
+                        st.session_state.upload_id = ('local', local_file)
+                    except Exception as e:
+                        show_error(f"Error opening file: {str(e)}")
+            else:
+                show_info(f"No Arrow, Feather or .npy files found in {LOCAL_DATA_DIR}")
+        else:
+            # Data upload section
+            st.header("Upload Your Data")
+            uploaded_file = st.file_uploader("Choose a CSV, Excel, Parquet or Arrow file", type=SUPPORTED_EXTENSIONS)
         
         if uploaded_file is not None:
             try:
                 file_extension = get_file_extension(uploaded_file.name)
                 
-                if file_extension == 'csv':
-                    data = pd.read_csv(uploaded_file)
-                elif file_extension in ['xlsx', 'xls']:
-                    data = pd.read_excel(uploaded_file)
-                else:
-                    show_error("Unsupported file format. Please upload a CSV or Excel file.")
+                if file_extension not in SUPPORTED_EXTENSIONS:
+                    show_error("Unsupported file format. Please upload a CSV, Excel, Parquet or Arrow file.")
                     return
                 
-                # Store data in session state
-                st.session_state.data = data
-                st.session_state.file_name = uploaded_file.name
+                stream_mode = False
+                if file_extension == 'csv':
+                    # Stream large CSV files in chunks to keep memory bounded
+                    stream_mode = st.checkbox(
+                        "Chunked streaming mode (large CSV files)",
+                        value=uploaded_file.size > LARGE_FILE_BYTES
+                    )
                 
-                # Reset insights when new data is uploaded
-                st.session_state.insights = None
-                st.session_state.chat_history = []
+                projected_columns = None
+                if file_extension in COLUMNAR_EXTENSIONS:
+                    # Read only the schema up front; data columns are projected at read time
+                    if st.session_state.get('source_file_id') != uploaded_file.file_id:
+                        source_columns = read_columnar_schema(uploaded_file, file_extension)
+                        st.session_state.source_file_id = uploaded_file.file_id
+                        st.session_state.source_columns = source_columns
+                        # Large files start with the default column selection instead of every column
+                        if uploaded_file.size > LARGE_FILE_BYTES and len(source_columns) > 5:
+                            st.session_state.projected_columns = source_columns[:5]
+                        else:
+                            st.session_state.projected_columns = None
+                    projected_columns = st.session_state.projected_columns
+                else:
+                    st.session_state.source_file_id = None
+                    st.session_state.source_columns = None
                 
-                show_success(f"Successfully loaded {uploaded_file.name} with {len(data)} rows and {len(data.columns)} columns")
+                # Only (re)load when the upload or its parse options change; reruns reuse session state
+                upload_id = (uploaded_file.file_id, stream_mode, tuple(projected_columns) if projected_columns else None)
+                if st.session_state.get('upload_id') != upload_id:
+                    progress_bar = st.progress(0.0, text="Reading file...") if stream_mode else None
+                    data, overview, memory_report, dataset_key = load_dataset(
+                        uploaded_file,
+                        uploaded_file.name,
+                        stream_mode=stream_mode,
+                        columns=projected_columns,
+                        progress_callback=(lambda fraction: progress_bar.progress(fraction, text="Reading file...")) if progress_bar else None
+                    )
+                    if progress_bar:
+                        progress_bar.empty()
+                    
+                    # Store data in session state
+                    store_dataset(data, uploaded_file.name, dataset_key, overview, memory_report)
+                    st.session_state.upload_id = upload_id
+                
+                data = st.session_state.data
+                overview = st.session_state.overview
+                row_count = overview['row_count'] if overview else len(data)
+                show_success(f"Successfully loaded {uploaded_file.name} with {row_count} rows and {len(data.columns)} columns")
+                if overview and overview['sampled']:
+                    show_info(f"Analysis uses a random sample of {len(data):,} rows")
             except Exception as e:
                 show_error(f"Error loading file: {str(e)}")
         
@@ -77,12 +178,17 @@ def main():
             st.markdown("---")
             st.header("Data Filtering")
             
-            # Select columns to use
-            all_columns = st.session_state.data.columns.tolist()
+            # Select columns to use (Parquet/Arrow files offer every column in the file)
+            source_columns = st.session_state.get('source_columns')
+            all_columns = source_columns or st.session_state.data.columns.tolist()
+            if source_columns and st.session_state.get('projected_columns'):
+                default_columns = st.session_state.data.columns.tolist()
+            else:
+                default_columns = all_columns[:5] if len(all_columns) > 5 else all_columns
             selected_columns = st.multiselect(
                 "Select columns to analyze",
                 options=all_columns,
-                default=all_columns[:5] if len(all_columns) > 5 else all_columns
+                default=default_columns
             )
             
             # Filter for numerical analysis
@@ -95,30 +201,50 @@ def main():
             
             # Apply filters button
             if st.button("Apply Filters"):
-                if selected_columns:
+                if selected_columns and source_columns:
+                    # Re-read only the selected columns from the Parquet/Arrow file
+                    st.session_state.projected_columns = selected_columns
+                    st.rerun()
+                elif selected_columns:
                     st.session_state.data = filter_data(st.session_state.data, selected_columns)
+                    st.session_state.fingerprints = column_fingerprints(
+                        st.session_state.data, st.session_state.get('fingerprints'))
                     show_success("Filters applied successfully")
                 else:
                     show_error("Please select at least one column")
+            
+            # Sketch-based statistics trade exactness for speed on very large tables
+            st.checkbox(
+                "Approximate statistics (very large tables)",
+                key='approximate_stats',
+                help="Estimate quantiles, distinct counts and top values with sketches; estimates are shown with their error bounds"
+            )
     
     # Main content area
     if st.session_state.data is not None:
         data = st.session_state.data
+        fingerprints = st.session_state.get('fingerprints')
+        if fingerprints is None or list(fingerprints) != list(data.columns):
+            fingerprints = st.session_state.fingerprints = column_fingerprints(data, fingerprints)
         
         # Quick stats row
         st.header(f"📊 Data Overview: {st.session_state.file_name}")
         
+        # Profile every column once; the overview, summaries and insights read from it
+        profiles = profile_dataset(data, approximate=st.session_state.get('approximate_stats', False),
+                                   fingerprints=fingerprints)
+        
         # Data summary metrics in columns
+        metrics = overview_metrics(data, st.session_state.overview, profiles)
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Rows", f"{data.shape[0]:,}")
+            st.metric("Rows", f"{metrics['row_count']:,}")
         with col2:
-            st.metric("Columns", data.shape[1])
+            st.metric("Columns", metrics['column_count'])
         with col3:
-            st.metric("Numeric Columns", len(data.select_dtypes(include=['number']).columns))
+            st.metric("Numeric Columns", metrics['numeric_columns'])
         with col4:
-            missing_percentage = round((data.isna().sum().sum() / (data.shape[0] * data.shape[1])) * 100, 2)
-            st.metric("Missing Values", f"{missing_percentage}%")
+            st.metric("Missing Values", f"{metrics['missing_percentage']}%")
         
         # Data exploration tab area
         tab1, tab2, tab3, tab4 = st.tabs(["Data Explorer", "Automated Insights", "Visualizations", "Chat with Data"])
@@ -136,14 +262,14 @@ def main():
                 st.write("Numerical Columns Summary")
                 st.dataframe(numeric_summary, use_container_width=True)
             
-            categorical_cols = data.select_dtypes(include=['object']).columns
+            categorical_cols = data.select_dtypes(include=['object', 'category']).columns
             if len(categorical_cols) > 0:
                 st.write("Categorical Columns Summary")
                 cat_summary = pd.DataFrame({
                     'Column': categorical_cols,
-                    'Unique Values': [data[col].nunique() for col in categorical_cols],
-                    'Most Common': [data[col].value_counts().index[0] if not data[col].value_counts().empty else None for col in categorical_cols],
-                    'Most Common Count': [data[col].value_counts().iloc[0] if not data[col].value_counts().empty else 0 for col in categorical_cols],
+                    'Unique Values': [profiles[col].unique_count for col in categorical_cols],
+                    'Most Common': [next(iter(profiles[col].top_values), None) for col in categorical_cols],
+                    'Most Common Count': [next(iter(profiles[col].top_values.values()), 0) for col in categorical_cols],
                 })
                 st.dataframe(cat_summary, use_container_width=True)
             
@@ -157,11 +283,19 @@ def main():
             
             with col2:
                 st.write("Missing Values")
+                missing_counts = pd.Series(metrics['missing_values'])
                 missing_data = pd.DataFrame({
-                    'Missing Values': data.isna().sum(),
-                    'Percentage': round(data.isna().sum() / len(data) * 100, 2)
+                    'Missing Values': missing_counts,
+                    'Percentage': round(missing_counts / max(metrics['row_count'], 1) * 100, 2)
                 })
                 st.dataframe(missing_data, use_container_width=True)
+            
+            # Memory saved by dtype optimization at load time
+            memory_report = st.session_state.memory_report
+            if memory_report is not None and not memory_report.empty:
+                saved_mb = memory_report['bytes_saved'].sum() / (1024 * 1024)
+                with st.expander(f"Memory Optimization ({saved_mb:,.1f} MB saved)"):
+                    st.dataframe(memory_report.set_index('column'), use_container_width=True)
         
         # Tab 2: Automated Insights
         with tab2:
@@ -176,7 +310,7 @@ def main():
                     with st.spinner("Generating basic insights..."):
                         if st.session_state.insights is None:
                             # Store insights in session state to avoid regenerating on rerun
-                            st.session_state.insights = generate_automated_insights(data)
+                            st.session_state.insights = generate_automated_insights(data, profiles, fingerprints=fingerprints)
                         
                         insights = st.session_state.insights
                         
@@ -203,8 +337,7 @@ def main():
                 ai_provider = st.radio("Select AI Provider:", ["OpenAI", "Anthropic"], horizontal=True)
                 
                 # Check if API keys are configured
-                if (ai_provider == "OpenAI" and not os.environ.get("OPENAI_API_KEY")) or \
-                   (ai_provider == "Anthropic" and not os.environ.get("ANTHROPIC_API_KEY")):
+                if not provider_available(ai_provider.lower()):
                     st.warning(f"{ai_provider} API key not configured. Please set up the appropriate API key in the environment variables.")
                 else:
                     # Store AI insights in session state
@@ -218,7 +351,7 @@ def main():
                             
                             if st.session_state.ai_insights is None:
                                 # Generate new insights
-                                raw_insights = generate_enhanced_insights(data, provider)
+                                raw_insights = generate_enhanced_insights(data, provider, profiles, fingerprints)
                                 st.session_state.ai_insights = format_insights_for_display(raw_insights)
                             
                             ai_insights = st.session_state.ai_insights
@@ -268,16 +401,26 @@ def main():
                                             st.markdown(f"**Type**: {viz['type']}")
                                             if viz['columns']:
                                                 st.markdown(f"**Columns**: {', '.join(viz['columns'])}")
+                                
+                                if "prompt_tokens" in ai_insights:
+                                    st.caption(f"Prompt: ~{ai_insights['prompt_tokens']:,} tokens")
                     
                     # Add a section for column-specific recommendations
                     st.markdown("### 🔍 Column-Specific Recommendations")
-                    col_for_analysis = st.selectbox("Select a column for detailed AI analysis:", data.columns.tolist())
+                    cols_for_analysis = st.multiselect(
+                        "Select columns for detailed AI analysis:",
+                        data.columns.tolist(),
+                        default=data.columns.tolist()[:1]
+                    )
                     
-                    if st.button("Analyze Column"):
-                        with st.spinner(f"Analyzing column '{col_for_analysis}'..."):
-                            recommendations = get_column_recommendations(data, col_for_analysis)
-                            
-                            for rec in recommendations:
+                    if st.button("Analyze Columns") and cols_for_analysis:
+                        with st.spinner(f"Analyzing {len(cols_for_analysis)} column(s)..."):
+                            # Columns are analyzed concurrently
+                            recommendations = get_columns_recommendations(data, cols_for_analysis, profiles, fingerprints)
+                        
+                        for col in cols_for_analysis:
+                            st.markdown(f"**{col}**")
+                            for rec in recommendations[col]:
                                 st.markdown(f"- {rec}")
         
         # Tab 3: Visualizations
@@ -299,13 +442,15 @@ def main():
             
             # Get numerical and categorical columns
             numeric_cols = data.select_dtypes(include=['number']).columns.tolist()
-            categorical_cols = data.select_dtypes(include=['object']).columns.tolist()
+            categorical_cols = data.select_dtypes(include=['object', 'category']).columns.tolist()
             
             if vis_type == "Distribution Plot":
                 if numeric_cols:
                     selected_col = st.selectbox("Select column", options=numeric_cols)
-                    fig = create_distribution_plot(data, selected_col)
-                    st.plotly_chart(fig, use_container_width=True)
+                    auto_bins = st.checkbox("Automatic bin width (Freedman-Diaconis)", value=True)
+                    bins = None if auto_bins else st.slider("Number of bins", 5, 200, 30)
+                    fig = create_distribution_plot(data, selected_col, bins, fingerprints=fingerprints)
+                    show_chart(fig)
                 else:
                     st.warning("No numerical columns available for distribution plot")
             
@@ -313,15 +458,15 @@ def main():
                 if len(numeric_cols) > 0 and len(categorical_cols) > 0:
                     x_col = st.selectbox("Select X-axis (categorical/date)", options=categorical_cols)
                     y_col = st.selectbox("Select Y-axis (numerical)", options=numeric_cols)
-                    fig = create_trend_chart(data, x_col, y_col)
-                    st.plotly_chart(fig, use_container_width=True)
+                    fig = create_trend_chart(data, x_col, y_col, fingerprints=fingerprints)
+                    show_chart(fig)
                 else:
                     st.warning("Need at least one numeric and one categorical/date column for trend analysis")
             
             elif vis_type == "Correlation Heatmap":
                 if len(numeric_cols) > 1:
-                    fig = create_correlation_heatmap(data, numeric_cols)
-                    st.plotly_chart(fig, use_container_width=True)
+                    fig = create_correlation_heatmap(data, numeric_cols, fingerprints=fingerprints)
+                    show_chart(fig)
                 else:
                     st.warning("Need at least two numerical columns for correlation heatmap")
             
@@ -339,8 +484,9 @@ def main():
                         if color_col == "None":
                             color_col = None
                     
-                    fig = px.scatter(data, x=x_col, y=y_col, color=color_col, title=f"{y_col} vs {x_col}")
-                    st.plotly_chart(fig, use_container_width=True)
+                    fig = scatter_figure(data, x_col, y_col, color_col, title=f"{y_col} vs {x_col}",
+                                         fingerprints=fingerprints)
+                    show_chart(fig)
                 else:
                     st.warning("Need at least two numerical columns for scatter plot")
             
@@ -357,12 +503,16 @@ def main():
                             if color_col == "None":
                                 color_col = None
                         
-                        fig = px.bar(data, x=x_col, y=y_col, color=color_col, title=f"{y_col} by {x_col}")
-                        st.plotly_chart(fig, use_container_width=True)
+                        agg_func = st.selectbox("Aggregation", options=["Sum", "Mean", "Count"])
+                        
+                        # Bars are aggregated per category and color before plotting
+                        fig = aggregated_bar_figure(data, x_col, y_col, color_col, agg=agg_func.lower(),
+                                                    title=f"{agg_func} of {y_col} by {x_col}", fingerprints=fingerprints)
+                        show_chart(fig)
                     else:
                         # Simple count-based bar chart if no numeric columns
-                        fig = px.histogram(data, x=x_col, title=f"Count by {x_col}")
-                        st.plotly_chart(fig, use_container_width=True)
+                        fig = aggregated_bar_figure(data, x_col, title=f"Count by {x_col}", fingerprints=fingerprints)
+                        show_chart(fig)
                 else:
                     st.warning("Need at least one categorical column for bar chart")
             
@@ -371,8 +521,9 @@ def main():
                     y_col = st.selectbox("Select Value (Y-axis)", options=numeric_cols)
                     x_col = st.selectbox("Select Category (X-axis)", options=categorical_cols)
                     
-                    fig = px.box(data, x=x_col, y=y_col, title=f"Distribution of {y_col} by {x_col}")
-                    st.plotly_chart(fig, use_container_width=True)
+                    fig = box_figure(data, x_col, y_col, title=f"Distribution of {y_col} by {x_col}",
+                                     fingerprints=fingerprints)
+                    show_chart(fig)
                 else:
                     st.warning("Need at least one numerical and one categorical column for box plot")
         
@@ -388,23 +539,41 @@ def main():
                 else:
                     st.markdown(f"**Assistant:** {message['content']}")
                     if "chart" in message:
-                        st.plotly_chart(message["chart"], use_container_width=True)
+                        show_chart(message["chart"])
+                    if "prompt_tokens" in message:
+                        st.caption(f"Prompt: ~{message['prompt_tokens']:,} tokens")
             
             # Chat input
             user_query = st.text_input("Ask a question about your data:", key="user_query")
+            stream_responses = st.checkbox("Stream responses", value=True, key="stream_responses")
             
             if st.button("Ask") and user_query:
                 # Add user message to chat history
                 st.session_state.chat_history.append({"role": "user", "content": user_query})
                 
                 # Process the query and get response
-                with st.spinner("Processing your question..."):
-                    response, chart = process_query(user_query, data)
+                if stream_responses:
+                    # Render the answer as it arrives, and its chart as soon as it is built
+                    st.markdown(f"**You:** {user_query}")
+                    response_placeholder = st.empty()
+                    chart_placeholder = st.empty()
+                    response, chart = "", None
+                    for response, streamed_chart in stream_query(user_query, data, profiles, fingerprints):
+                        response_placeholder.markdown(f"**Assistant:** {response}▌")
+                        if streamed_chart is not None and chart is None:
+                            chart = streamed_chart
+                            show_chart(chart, chart_placeholder.container())
+                    response_placeholder.markdown(f"**Assistant:** {response}")
+                else:
+                    with st.spinner("Processing your question..."):
+                        response, chart = process_query(user_query, data, profiles, fingerprints)
                 
                 # Add response to chat history
                 response_msg = {"role": "assistant", "content": response}
                 if chart is not None:
                     response_msg["chart"] = chart
+                if provider_available("openai"):
+                    response_msg["prompt_tokens"] = chat_prompt_tokens(user_query, data, profiles, fingerprints)
                 
                 st.session_state.chat_history.append(response_msg)
                 
@@ -425,7 +594,7 @@ def main():
         - Create visualizations to understand trends
         - Ask questions about your data in plain English
         
-        Upload a CSV or Excel file from the sidebar to begin.
+        Upload a CSV, Excel, Parquet or Arrow file from the sidebar to begin.
         """)
         
         # Example layout with empty placeholders
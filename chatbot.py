@@ -4,39 +4,44 @@ import os
 import re
 import plotly.express as px
 import plotly.graph_objects as go
-from typing import Tuple, Dict, List, Any, Optional, Union
+from typing import Tuple, Dict, List, Any, Optional, Union, Iterator
 import json
-from openai import OpenAI
 import streamlit as st
 
-# Initialize OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+from correlation import correlation_matrix
+from llm_client import LLMRequest, complete, provider_available, stream
+from profiler import ColumnProfile
+from prompt_context import build_context, summarize_dataset
+from visualization import box_figure, encode_figure, line_figure, scatter_figure
 
-def process_query(user_query: str, data: pd.DataFrame) -> Tuple[str, Optional[go.Figure]]:
+def process_query(user_query: str, data: pd.DataFrame,
+                  profiles: Optional[Dict[str, ColumnProfile]] = None,
+                  fingerprints: Optional[Dict[str, str]] = None) -> Tuple[str, Optional[go.Figure]]:
     """
     Process a natural language query about the data and return a response with optional visualization.
     
     Args:
         user_query: The user's question or command
         data: The DataFrame being analyzed
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
     Returns:
         Tuple containing the text response and an optional Plotly figure
     """
-    if not OPENAI_API_KEY:
+    if not provider_available("openai"):
         return ("Please set up the OPENAI_API_KEY environment variable to enable the chat functionality. " +
                 "Contact your administrator for more information."), None
     
     try:
         # Prepare data information for the model
-        data_info = _prepare_data_info(data)
+        data_info = summarize_dataset(data, profiles, fingerprints)
         
         # Generate response using OpenAI
         response = _generate_ai_response(user_query, data_info, data)
         
         # Parse the response to extract any visualization requests
-        text_response, visualization = _parse_visualization_request(response, data)
+        text_response, visualization = _parse_visualization_request(response, data, fingerprints)
         
         return text_response, visualization
     
@@ -44,68 +49,162 @@ def process_query(user_query: str, data: pd.DataFrame) -> Tuple[str, Optional[go
         error_message = f"Sorry, I encountered an error while processing your request: {str(e)}"
         return error_message, None
 
-def _prepare_data_info(data: pd.DataFrame) -> Dict[str, Any]:
+def stream_query(user_query: str, data: pd.DataFrame,
+                 profiles: Optional[Dict[str, ColumnProfile]] = None,
+                 fingerprints: Optional[Dict[str, str]] = None) -> Iterator[Tuple[str, Optional[go.Figure]]]:
     """
-    Prepare a summary of the DataFrame structure for the model.
+    Process a query like process_query, streaming the response as it is generated.
+    
+    The visualization block is parsed as the text arrives: it is hidden from the
+    streamed text, and its chart is built as soon as the block's closing fence arrives.
+    
+    Args:
+        user_query: The user's question or command
+        data: The DataFrame being analyzed
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
+        
+    Yields:
+        Tuples of the response text so far and the chart (None until it is built)
+    """
+    if not provider_available("openai"):
+        yield ("Please set up the OPENAI_API_KEY environment variable to enable the chat functionality. " +
+               "Contact your administrator for more information."), None
+        return
+    
+    parser = _VisualizationStream()
+    chart = None
+    visualized = False
+    try:
+        # Prepare data information for the model
+        data_info = summarize_dataset(data, profiles, fingerprints)
+        
+        for chunk in stream(_chat_request(user_query, data_info, data)):
+            parser.feed(chunk)
+            if parser.spec is not None and not visualized:
+                # The block just closed: build its chart, then consume the rest of the chunk
+                chart = _build_streamed_visualization(parser, data, fingerprints)
+                visualized = True
+                parser.feed("")
+            yield parser.text, chart
+        
+        parser.finish()
+        yield parser.text, chart
+    
+    except Exception as e:
+        error_message = f"Sorry, I encountered an error while processing your request: {str(e)}"
+        yield error_message, None
+
+def chat_prompt_tokens(user_query: str, data: pd.DataFrame,
+                       profiles: Optional[Dict[str, ColumnProfile]] = None,
+                       fingerprints: Optional[Dict[str, str]] = None) -> int:
     """
-    # Basic DataFrame info
-    info = {
-        "rows": len(data),
-        "columns": list(data.columns),
-        "column_types": {col: str(dtype) for col, dtype in data.dtypes.items()},
-        "column_examples": {},
-        "column_stats": {}
-    }
-    
-    # Generate examples and stats for each column
-    for col in data.columns:
-        # Get examples
-        non_null_vals = data[col].dropna()
-        if not non_null_vals.empty:
-            examples = non_null_vals.sample(min(3, len(non_null_vals))).tolist()
-            info["column_examples"][col] = examples
+    Estimate the size of the prompt sent for a query, as reported under the chat answer.
+    
+    Args:
+        user_query: The user's question or command
+        data: The DataFrame being analyzed
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
-        # Generate stats for numeric columns
-        if pd.api.types.is_numeric_dtype(data[col]):
-            info["column_stats"][col] = {
-                "min": float(data[col].min()) if not pd.isna(data[col].min()) else None,
-                "max": float(data[col].max()) if not pd.isna(data[col].max()) else None,
-                "mean": float(data[col].mean()) if not pd.isna(data[col].mean()) else None,
-                "median": float(data[col].median()) if not pd.isna(data[col].median()) else None,
-                "missing_count": int(data[col].isna().sum()),
-                "missing_percentage": float(data[col].isna().mean() * 100)
-            }
-        # Generate stats for categorical columns
-        elif pd.api.types.is_object_dtype(data[col]):
-            value_counts = data[col].value_counts().head(5).to_dict()
-            info["column_stats"][col] = {
-                "unique_count": int(data[col].nunique()),
-                "top_values": {str(k): int(v) for k, v in value_counts.items()},
-                "missing_count": int(data[col].isna().sum()),
-                "missing_percentage": float(data[col].isna().mean() * 100)
-            }
-        # Generate stats for datetime columns
-        elif pd.api.types.is_datetime64_dtype(data[col]):
-            info["column_stats"][col] = {
-                "min": str(data[col].min()) if not pd.isna(data[col].min()) else None,
-                "max": str(data[col].max()) if not pd.isna(data[col].max()) else None,
-                "missing_count": int(data[col].isna().sum()),
-                "missing_percentage": float(data[col].isna().mean() * 100)
-            }
-    
-    return info
+    Returns:
+        Estimated number of prompt tokens
+    """
+    data_info = summarize_dataset(data, profiles, fingerprints)
+    return _chat_request(user_query, data_info, data).prompt_tokens
+
+class _VisualizationStream:
+    """Incremental parser separating the visualization block from streamed response text."""
+    
+    OPENING_FENCE = "```visualization_json"
+    CLOSING_FENCE = "```"
+    
+    def __init__(self):
+        self.text = ""
+        self.spec = None
+        self.error = None
+        self._pending = ""
+        self._in_block = False
+    
+    def feed(self, chunk: str) -> None:
+        """Consume a chunk of the response, stopping early once the visualization block closes."""
+        self._pending += chunk
+        
+        while True:
+            if self._in_block:
+                end = self._pending.find(self.CLOSING_FENCE)
+                if end < 0:
+                    return
+                self.spec = self._pending[:end].strip()
+                self._pending = self._pending[end + len(self.CLOSING_FENCE):]
+                self._in_block = False
+                # Stop at the closed block so its chart can be built before more text is added
+                return
+            elif self.spec is None:
+                start = self._pending.find(self.OPENING_FENCE)
+                if start >= 0:
+                    self.text += self._pending[:start]
+                    self._pending = self._pending[start + len(self.OPENING_FENCE):]
+                    self._in_block = True
+                    continue
+                
+                # Hold back a trailing partial fence until the next chunk
+                held = _partial_prefix_length(self._pending, self.OPENING_FENCE)
+                self.text += self._pending[:len(self._pending) - held]
+                self._pending = self._pending[len(self._pending) - held:]
+                return
+            else:
+                # Only the first visualization block is used; the rest is plain text
+                self.text += self._pending
+                self._pending = ""
+                return
+    
+    def finish(self) -> None:
+        """Flush the remaining text at the end of the response."""
+        if self._in_block:
+            # An unterminated block is left in the text, as in the non-streaming parser
+            self.text += self.OPENING_FENCE
+            self._in_block = False
+        self.text += self._pending
+        self._pending = ""
+        if self.error:
+            self.text += self.error
+            self.error = None
+
+def _partial_prefix_length(text: str, fence: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of fence."""
+    for length in range(min(len(fence) - 1, len(text)), 0, -1):
+        if text.endswith(fence[:length]):
+            return length
+    return 0
+
+def _build_streamed_visualization(parser: _VisualizationStream, data: pd.DataFrame,
+                                  fingerprints: Optional[Dict[str, str]] = None) -> Optional[go.Figure]:
+    """Build the chart of a completed visualization block, keeping the block in the text on failure."""
+    try:
+        return _create_visualization(json.loads(parser.spec), data, fingerprints)
+    except Exception as e:
+        # As in _parse_visualization_request, the spec stays in the text with an error note
+        parser.text += f"{parser.OPENING_FENCE}\n{parser.spec}\n{parser.CLOSING_FENCE}"
+        parser.error = f"\n\nNote: I tried to create a visualization but encountered an error: {str(e)}"
+        return None
 
 def _generate_ai_response(query: str, data_info: Dict[str, Any], data: pd.DataFrame) -> str:
     """
     Generate a response using the OpenAI API.
     """
-    # Create a simplified dataset sample for context
+    # Generate the AI response (identical questions about identical data are served from the cache)
     try:
-        # Create a small sample of the data as context
-        sample_rows = min(5, len(data))
-        data_sample = data.head(sample_rows).to_string()
-    except:
-        data_sample = "Error creating data sample"
+        return complete(_chat_request(query, data_info, data))
+    except Exception as e:
+        raise Exception(f"Error generating AI response: {str(e)}")
+
+def _chat_request(query: str, data_info: Dict[str, Any], data: pd.DataFrame) -> LLMRequest:
+    """
+    Build the chat completion request for a question about the data.
+    """
+    # Compact, token-budgeted summary of the columns most relevant to the question
+    context = build_context(data_info, data, query)
     
     # Prepare the system message with instructions
     system_message = f"""
@@ -126,37 +225,20 @@ def _generate_ai_response(query: str, data_info: Dict[str, Any], data: pd.DataFr
     Use proper data analysis terminology and provide specific insights from the data.
     
     Here is the data information:
-    - Rows: {data_info['rows']}
-    - Columns: {', '.join(data_info['columns'])}
-    
-    Column details:
-    {json.dumps(data_info['column_types'], indent=2)}
     
-    Statistical information:
-    {json.dumps(data_info['column_stats'], indent=2)}
-    
-    Here's a sample of the data:
-    {data_sample}
+{context.text}
     """
     
-    # Generate the AI response
-    try:
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.3,
-            max_tokens=800
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        raise Exception(f"Error generating AI response: {str(e)}")
+    return LLMRequest.create(
+        "openai",
+        query,
+        system=system_message,
+        temperature=0.3,
+        max_tokens=800
+    )
 
-def _parse_visualization_request(response: str, data: pd.DataFrame) -> Tuple[str, Optional[go.Figure]]:
+def _parse_visualization_request(response: str, data: pd.DataFrame,
+                                 fingerprints: Optional[Dict[str, str]] = None) -> Tuple[str, Optional[go.Figure]]:
     """
     Parse the AI response to extract any visualization requests and generate the appropriate chart.
     """
@@ -173,7 +255,7 @@ def _parse_visualization_request(response: str, data: pd.DataFrame) -> Tuple[str
         viz_spec = json.loads(viz_json_str)
         
         # Create the visualization
-        chart = _create_visualization(viz_spec, data)
+        chart = _create_visualization(viz_spec, data, fingerprints)
         
         # Remove the JSON spec from the response
         clean_response = response.replace(viz_match.group(0), "")
@@ -186,7 +268,8 @@ def _parse_visualization_request(response: str, data: pd.DataFrame) -> Tuple[str
         error_note = f"\n\nNote: I tried to create a visualization but encountered an error: {str(e)}"
         return response + error_note, None
 
-def _create_visualization(viz_spec: Dict[str, Any], data: pd.DataFrame) -> go.Figure:
+def _create_visualization(viz_spec: Dict[str, Any], data: pd.DataFrame,
+                          fingerprints: Optional[Dict[str, str]] = None) -> go.Figure:
     """
     Create a visualization based on the specification.
     """
@@ -208,29 +291,29 @@ def _create_visualization(viz_spec: Dict[str, Any], data: pd.DataFrame) -> go.Fi
     
     # Create the appropriate chart
     if chart_type == "scatter":
-        fig = px.scatter(data, x=x_col, y=y_col, color=color_col, title=title)
+        fig = scatter_figure(data, x_col, y_col, color_col, title=title, fingerprints=fingerprints)
     
     elif chart_type == "bar":
         fig = px.bar(data, x=x_col, y=y_col, color=color_col, title=title)
     
     elif chart_type == "line":
-        fig = px.line(data, x=x_col, y=y_col, color=color_col, title=title)
+        fig = line_figure(data, x_col, y_col, color_col, title=title, fingerprints=fingerprints)
     
     elif chart_type == "histogram":
         fig = px.histogram(data, x=x_col, color=color_col, title=title)
     
     elif chart_type == "box":
-        fig = px.box(data, x=x_col, y=y_col, color=color_col, title=title)
+        # A box without a y column shows the distribution of x
+        fig = box_figure(data, x_col if y_col else None, y_col or x_col, color_col, title=title,
+                         fingerprints=fingerprints)
     
     elif chart_type == "heatmap":
         # For heatmap, we need to prepare a correlation matrix
         if not y_col:
             # If y_col is not specified, create a correlation heatmap
-            numeric_data = data.select_dtypes(include=['number'])
-            if numeric_data.empty:
+            corr_matrix = correlation_matrix(data, fingerprints=fingerprints)
+            if corr_matrix.empty:
                 raise ValueError("No numeric columns available for correlation heatmap")
-            
-            corr_matrix = numeric_data.corr()
             fig = px.imshow(
                 corr_matrix,
                 text_auto='.2f',
@@ -251,4 +334,5 @@ def _create_visualization(viz_spec: Dict[str, Any], data: pd.DataFrame) -> go.Fi
         hovermode='closest'
     )
     
-    return fig
+    # Chat charts are built once per answer, so their payload size is always recorded
+    return encode_figure(fig, measure=True)
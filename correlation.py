@@ -0,0 +1,272 @@
+"""
+Blocked correlation engine for wide and tall datasets.
+
+Columns are standardized once, then rows are streamed in chunks of float32 values and
+the correlation matrix is accumulated tile by tile (upper-triangle column blocks) with
+BLAS matrix products. Results are cached by column content, so the heatmap, the
+automated insights and the AI prompts share a single computation.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple, Union
+
+from utils import LRUCache, column_fingerprint
+
+# Float32 cells per row chunk; the chunk height adapts to the number of columns
+CORR_CHUNK_CELLS = 8_000_000
+
+# Columns per tile of the matrix product
+CORR_BLOCK_COLUMNS = 512
+
+# Correlation matrices kept across reruns, bounded by their size in memory
+CORR_CACHE_ENTRIES = 16
+CORR_CACHE_BYTES = 512 * 1024 * 1024
+
+# Correlation methods computed by the blocked engine; others fall back to pandas
+BLOCKED_METHODS = ['pearson', 'spearman']
+
+# Correlation matrices keyed by (method, ((column, fingerprint), ...))
+_corr_cache = LRUCache(
+    max_entries=CORR_CACHE_ENTRIES,
+    max_bytes=CORR_CACHE_BYTES,
+    sizeof=lambda matrix: int(matrix.values.nbytes)
+)
+
+def correlation_matrix(data: pd.DataFrame,
+                       columns: Optional[List[str]] = None,
+                       method: str = 'pearson',
+                       use_cache: bool = True,
+                       fingerprints: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Compute the correlation matrix of numeric columns.
+
+    Missing values are handled pairwise, as in DataFrame.corr. When the matrix of the
+    dataset's numeric columns is already cached, a subset of columns is sliced from it
+    instead of being recomputed.
+
+    Args:
+        data: Input DataFrame
+        columns: Columns to correlate (defaults to all numeric columns); non-numeric ones are skipped
+        method: 'pearson' or 'spearman' (blocked engine), or any other DataFrame.corr method
+        use_cache: Reuse and store matrices in the shared correlation cache
+        fingerprints: Column fingerprints already computed for this version of the data
+
+    Returns:
+        Correlation matrix as a DataFrame
+    """
+    # Dtype selection on an empty slice avoids copying the data
+    numeric_columns = data.iloc[:0].select_dtypes(include=['number']).columns.tolist()
+    if columns is None:
+        columns = numeric_columns
+    else:
+        numeric = set(numeric_columns)
+        columns = [col for col in columns if col in numeric]
+
+    if not use_cache:
+        return _compute_correlation(data, columns, method)
+
+    # Only numeric columns take part in the cache keys
+    fingerprints = fingerprints or {}
+    fingerprints = {col: fingerprints[col] if col in fingerprints else column_fingerprint(data[col])
+                    for col in numeric_columns}
+    key = _cache_key(columns, fingerprints, method)
+    matrix = _corr_cache.get(key)
+
+    if matrix is None and columns != numeric_columns:
+        # A subset of the dataset's full matrix needs no computation
+        full_matrix = _corr_cache.get(_cache_key(numeric_columns, fingerprints, method))
+        if full_matrix is not None:
+            return full_matrix.loc[columns, columns]
+
+    if matrix is None:
+        matrix = _compute_correlation(data, columns, method)
+        _corr_cache.put(key, matrix)
+
+    return matrix.copy()
+
+def _cache_key(columns: List[str], fingerprints: Dict[str, str], method: str) -> Tuple:
+    """Cache key of a correlation matrix over the given columns."""
+    return (method, tuple((col, fingerprints[col]) for col in columns))
+
+def _compute_correlation(data: pd.DataFrame, columns: List[str], method: str) -> pd.DataFrame:
+    """Compute the correlation matrix of the given numeric columns."""
+    if method not in BLOCKED_METHODS:
+        return data[columns].corr(method=method)
+
+    if method == 'spearman':
+        # Ranks are taken per column over its non-missing values; pairs whose missing
+        # rows differ are re-ranked over their common rows below
+        numeric_data = data[columns].rank()
+    elif list(data.columns) == columns:
+        numeric_data = data
+    else:
+        # Row chunks select their columns, so the data is never copied as a whole
+        numeric_data = _ColumnView(data, columns)
+
+    k = len(columns)
+    columns = pd.Index(columns)
+    if k == 0:
+        return pd.DataFrame(index=columns, columns=columns, dtype='float64')
+    if numeric_data.shape[0] == 0:
+        # No rows, no correlations (as DataFrame.corr)
+        return pd.DataFrame(np.nan, index=columns, columns=columns)
+
+    # Standardize once so float32 products keep their precision
+    means, stds, has_missing = _column_moments(numeric_data)
+
+    if has_missing:
+        matrix = _pairwise_correlation(numeric_data, means, stds)
+        if method == 'spearman':
+            _rerank_pairs(data, columns, matrix)
+    else:
+        products = _accumulate(numeric_data, means, stds, lambda z, valid: [(z, z)])[0]
+        n = numeric_data.shape[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Products are already centered; normalizing by the diagonal yields correlations
+            variances = np.diag(products)
+            matrix = products / np.sqrt(np.outer(variances, variances))
+            matrix[:, variances <= n * 1e-12] = np.nan
+            matrix[variances <= n * 1e-12, :] = np.nan
+
+    matrix = np.clip(matrix, -1.0, 1.0)
+    diagonal = np.diag(matrix).copy()
+    np.fill_diagonal(matrix, np.where(np.isnan(diagonal), np.nan, 1.0))
+    return pd.DataFrame(matrix, index=columns, columns=columns)
+
+class _ColumnView:
+    """Column subset of a DataFrame whose row chunks are selected lazily."""
+
+    def __init__(self, data: pd.DataFrame, columns: List[str]):
+        self.data = data
+        self.positions = [data.columns.get_loc(col) for col in columns]
+        self.shape = (len(data), len(columns))
+
+def _row_chunk(numeric_data: Union[pd.DataFrame, _ColumnView], start: int, rows: int) -> np.ndarray:
+    """Rows [start, start + rows) of the numeric data as a float64 array (missing values as NaN)."""
+    if isinstance(numeric_data, _ColumnView):
+        chunk = numeric_data.data.iloc[start:start + rows, numeric_data.positions]
+    else:
+        chunk = numeric_data.iloc[start:start + rows]
+    return chunk.to_numpy(dtype='float64', na_value=np.nan)
+
+def _column_moments(numeric_data: Union[pd.DataFrame, _ColumnView]) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """Column means and standard deviations in one chunked pass, and whether any value is missing."""
+    n, k = numeric_data.shape
+    chunk_rows = max(CORR_CHUNK_CELLS // k, 1024)
+    counts = np.zeros(k)
+    means = np.zeros(k)
+    m2 = np.zeros(k)
+
+    for start in range(0, n, chunk_rows):
+        chunk = _row_chunk(numeric_data, start, chunk_rows)
+        valid = ~np.isnan(chunk)
+        if valid.all():
+            chunk_counts = np.full(k, len(chunk))
+            chunk_means = chunk.mean(axis=0)
+            deviations = chunk - chunk_means
+        else:
+            chunk_counts = valid.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                chunk_means = np.where(chunk_counts > 0, np.where(valid, chunk, 0).sum(axis=0) / chunk_counts, 0)
+            deviations = np.where(valid, chunk - chunk_means, 0)
+
+        # Merge the chunk moments into the running ones (Chan et al.)
+        total = counts + chunk_counts
+        delta = chunk_means - means
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(total > 0, means + delta * chunk_counts / total, 0)
+            m2 = np.where(total > 0, m2 + (deviations ** 2).sum(axis=0) + delta ** 2 * counts * chunk_counts / total, 0)
+        counts = total
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stds = np.sqrt(m2 / counts)
+    stds = np.where((stds > 0) & np.isfinite(stds), stds, 1.0)
+    return means, stds, bool((counts < n).any())
+
+def _pairwise_correlation(numeric_data: Union[pd.DataFrame, _ColumnView], means: np.ndarray, stds: np.ndarray) -> np.ndarray:
+    """Pearson correlation over pairwise-complete rows, from masked sums and products."""
+    # Each pair (i, j) only uses rows where both columns are present
+    counts, sums, squares, products = _accumulate(
+        numeric_data, means, stds,
+        lambda z, valid: [(valid, valid), (z, valid), (z * z, valid), (z, z)]
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - sums * sums.T / counts
+        variance_i = squares - sums * sums / counts
+        variance_j = variance_i.T
+        matrix = covariance / np.sqrt(variance_i * variance_j)
+        matrix[(counts < 2) | (variance_i <= counts * 1e-12) | (variance_j <= counts * 1e-12)] = np.nan
+    return matrix
+
+def _rerank_pairs(data: pd.DataFrame, columns: pd.Index, matrix: np.ndarray) -> None:
+    """
+    Recompute, in place, the Spearman correlations of column pairs whose missing rows differ.
+
+    Ranks over each column's own non-missing values are only exact for pairs that share
+    the same non-missing rows; the other pairs are re-ranked over their common rows,
+    as DataFrame.corr does.
+    """
+    valid = {col: data[col].notna().to_numpy() for col in columns}
+    masks = [np.packbits(valid[col]).tobytes() for col in columns]
+    values = {}
+
+    for i, j in zip(*np.triu_indices(len(columns), 1)):
+        if masks[i] == masks[j]:
+            continue
+        common = valid[columns[i]] & valid[columns[j]]
+        correlation = np.nan
+        if common.sum() >= 2:
+            for col in (columns[i], columns[j]):
+                if col not in values:
+                    values[col] = data[col].to_numpy(dtype='float64', na_value=np.nan)
+            x = pd.Series(values[columns[i]][common]).rank().to_numpy()
+            y = pd.Series(values[columns[j]][common]).rank().to_numpy()
+            x, y = x - x.mean(), y - y.mean()
+            denominator = np.sqrt((x * x).sum() * (y * y).sum())
+            if denominator > 0:
+                correlation = (x * y).sum() / denominator
+        matrix[i, j] = matrix[j, i] = correlation
+
+def _accumulate(numeric_data: Union[pd.DataFrame, _ColumnView], means: np.ndarray, stds: np.ndarray, terms) -> List[np.ndarray]:
+    """
+    Stream row chunks and accumulate k x k matrix products tile by tile.
+
+    Args:
+        numeric_data: All-numeric DataFrame or column view
+        means: Column means used for standardization
+        stds: Column standard deviations used for standardization
+        terms: Function of a standardized chunk (missing values zeroed) and its validity mask,
+            returning the (left, right) operand pairs whose products are accumulated
+
+    Returns:
+        One float64 k x k matrix per operand pair
+    """
+    n, k = numeric_data.shape
+    chunk_rows = max(CORR_CHUNK_CELLS // k, 1024)
+    blocks = [slice(start, min(start + CORR_BLOCK_COLUMNS, k)) for start in range(0, k, CORR_BLOCK_COLUMNS)]
+    results = None
+
+    for start in range(0, n, chunk_rows):
+        chunk = _row_chunk(numeric_data, start, chunk_rows)
+        valid = ~np.isnan(chunk)
+        # Standardize before narrowing, so large offsets do not swallow the variance
+        z = ((chunk - means) / stds).astype('float32')
+        z[~valid] = 0
+        pairs = terms(z, valid.astype('float32'))
+        if results is None:
+            results = [np.zeros((k, k), dtype='float64') for _ in pairs]
+
+        for result, (left, right) in zip(results, pairs):
+            # Symmetric products only need the upper-triangle tiles
+            symmetric = left is right
+            for i, rows in enumerate(blocks):
+                for cols in (blocks[i:] if symmetric else blocks):
+                    result[rows, cols] += left[:, rows].T @ right[:, cols]
+
+    for result, (left, right) in zip(results, pairs):
+        if left is right:
+            lower = np.tril_indices(k, -1)
+            result[lower] = result.T[lower]
+    return results
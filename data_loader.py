@@ -0,0 +1,399 @@
+import os
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from typing import Dict, List, Any, Optional, Tuple, Callable, IO
+
+from utils import LRUCache, get_file_extension, hash_file
+from data_processor import optimize_dtypes
+from profiler import ColumnProfile, profile_dataset, profiles_of_kind
+
+# Number of rows parsed per chunk in streaming mode
+CSV_CHUNK_SIZE = 100_000
+
+# Maximum number of rows kept in memory for analysis when streaming
+STREAM_SAMPLE_ROWS = 200_000
+
+# Uploads larger than this default to streaming mode
+LARGE_FILE_BYTES = 200 * 1024 * 1024
+
+# File extensions read through Apache Arrow, which support column projection at read time
+PARQUET_EXTENSIONS = ['parquet', 'pq']
+ARROW_IPC_EXTENSIONS = ['feather', 'arrow', 'ipc']
+COLUMNAR_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_IPC_EXTENSIONS
+
+SUPPORTED_EXTENSIONS = ['csv', 'xlsx', 'xls'] + COLUMNAR_EXTENSIONS
+
+# Directory with large datasets opened in place through memory mapping (disabled if empty)
+LOCAL_DATA_DIR = os.environ.get("DATA_INSIGHTS_DATA_DIR", "")
+
+# Local file formats that can be memory-mapped
+MMAP_EXTENSIONS = ARROW_IPC_EXTENSIONS + ['npy']
+
+# Parsed datasets are shared across reruns and sessions, keyed on content hash
+DATASET_CACHE_ENTRIES = 8
+DATASET_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+def _cached_nbytes(entry: Tuple[pd.DataFrame, Optional[Dict[str, Any]], pd.DataFrame]) -> int:
+    """Approximate in-memory size of a cached dataset."""
+    return int(entry[0].memory_usage(index=True, deep=True).sum())
+
+_dataset_cache = LRUCache(
+    max_entries=DATASET_CACHE_ENTRIES,
+    max_bytes=DATASET_CACHE_BYTES,
+    sizeof=_cached_nbytes
+)
+
+def load_dataset(file: IO,
+                 file_name: str,
+                 stream_mode: bool = False,
+                 optimize: bool = True,
+                 columns: Optional[List[str]] = None,
+                 filters: Optional[List[Tuple[str, str, Any]]] = None,
+                 progress_callback: Optional[Callable[[float], None]] = None) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]], pd.DataFrame, str]:
+    """
+    Load an uploaded dataset, reusing the parsed result when the same bytes were loaded before.
+    
+    The cache key is a hash of the file contents plus the parse options, so Streamlit
+    reruns and other sessions uploading the same file skip parsing entirely.
+    
+    Args:
+        file: Binary file-like object (e.g. a Streamlit UploadedFile)
+        file_name: Name of the uploaded file, used to pick the parser
+        stream_mode: Read CSV files in chunks (see stream_csv)
+        optimize: Downcast column dtypes after parsing (see optimize_dtypes)
+        columns: Optional columns to read from Parquet/Arrow files (all columns if None)
+        filters: Optional row filters for Parquet/Arrow files (see read_columnar)
+        progress_callback: Optional function called with the fraction read (0-1)
+        
+    Returns:
+        Tuple containing the DataFrame, the streaming overview (or None),
+        the per-column memory report and the dataset key
+    """
+    file_extension = get_file_extension(file_name)
+    options = {
+        'format': file_extension,
+        'stream_mode': stream_mode and file_extension == 'csv',
+        'optimize': optimize,
+        'columns': tuple(columns) if columns is not None else None,
+        'filters': tuple(filters) if filters else None
+    }
+    key = hash_file(file, options)
+    
+    def parse() -> Tuple[pd.DataFrame, Optional[Dict[str, Any]], pd.DataFrame]:
+        overview = None
+        if file_extension == 'csv':
+            if options['stream_mode']:
+                data, overview = stream_csv(file, total_bytes=getattr(file, 'size', None), progress_callback=progress_callback)
+            else:
+                data = pd.read_csv(file)
+        elif file_extension in ['xlsx', 'xls']:
+            data = pd.read_excel(file)
+        elif file_extension in COLUMNAR_EXTENSIONS:
+            data = read_columnar(file, file_extension, columns=columns, filters=filters)
+        else:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        if optimize:
+            data, memory_report = optimize_dtypes(data)
+        else:
+            memory_report = pd.DataFrame()
+        
+        return data, overview, memory_report
+    
+    data, overview, memory_report = _dataset_cache.get_or_compute(key, parse)
+    
+    # Shallow copy so callers adding or dropping columns don't alter the cached frame
+    return data.copy(deep=False), overview, memory_report, key
+
+# Memory-mapped datasets, keyed on path, size and modification time
+_mapped_cache = LRUCache(max_entries=DATASET_CACHE_ENTRIES)
+
+def list_local_datasets(data_dir: str = LOCAL_DATA_DIR) -> List[str]:
+    """
+    List the files in the local data directory that can be memory-mapped.
+    
+    Args:
+        data_dir: Local data directory
+        
+    Returns:
+        Sorted list of file names
+    """
+    if not data_dir or not os.path.isdir(data_dir):
+        return []
+    
+    return sorted(
+        name for name in os.listdir(data_dir)
+        if get_file_extension(name) in MMAP_EXTENSIONS and os.path.isfile(os.path.join(data_dir, name))
+    )
+
+def open_local_dataset(file_name: str, data_dir: str = LOCAL_DATA_DIR) -> Tuple[pd.DataFrame, str]:
+    """
+    Open a dataset from the local data directory through a memory map instead of reading it.
+    
+    Null-free numeric columns of uncompressed, single-batch Arrow files and NumPy .npy
+    arrays are exposed as read-only views of the mapped file. Pages are only read when
+    a preview, summary or chart touches them, and every session opening the same file
+    shares the same physical pages. Other columns are converted to pandas as usual.
+    
+    Args:
+        file_name: Name of a file inside the data directory
+        data_dir: Local data directory
+        
+    Returns:
+        Tuple containing the DataFrame and the dataset key
+    """
+    data_root = os.path.realpath(data_dir)
+    path = os.path.realpath(os.path.join(data_root, file_name))
+    if os.path.dirname(path) != data_root:
+        raise ValueError(f"'{file_name}' is not inside the local data directory")
+    
+    file_stat = os.stat(path)
+    key = f"{path}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+    
+    def open_mapped() -> pd.DataFrame:
+        if get_file_extension(path) == 'npy':
+            return _mapped_numpy_frame(np.load(path, mmap_mode='r'))
+        return _mapped_arrow_frame(pa.ipc.open_file(pa.memory_map(path, 'r')).read_all())
+    
+    data = _mapped_cache.get_or_compute(key, open_mapped)
+    
+    return data.copy(deep=False), key
+
+def _mapped_arrow_frame(table: pa.Table) -> pd.DataFrame:
+    """Build a DataFrame whose primitive columns are zero-copy views of the Arrow buffers."""
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if column.num_chunks == 1 and column.null_count == 0 and _zero_copy_type(column.type):
+            columns[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            columns[name] = column.to_pandas()
+    
+    return pd.DataFrame(columns, copy=False)
+
+def _zero_copy_type(arrow_type: pa.DataType) -> bool:
+    """Whether NumPy can view an Arrow column of this type without converting it."""
+    # Dates, times, decimals and time-zone-aware timestamps need pandas' conversion
+    return (pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+            or (pa.types.is_timestamp(arrow_type) and arrow_type.tz is None))
+
+def _mapped_numpy_frame(array: np.ndarray) -> pd.DataFrame:
+    """Wrap a memory-mapped 2-D or structured NumPy array in a DataFrame without copying."""
+    if array.dtype.names:
+        return pd.DataFrame({name: array[name] for name in array.dtype.names}, copy=False)
+    
+    if array.ndim == 1:
+        array = array.reshape(-1, 1)
+    elif array.ndim != 2:
+        raise ValueError("Only 1-D, 2-D or structured .npy arrays can be opened")
+    
+    return pd.DataFrame(array, columns=[f"column_{i}" for i in range(array.shape[1])], copy=False)
+
+def read_columnar_schema(file: IO, file_extension: str) -> List[str]:
+    """
+    Read the column names of a Parquet or Arrow IPC file without loading any data.
+    
+    Args:
+        file: Binary file-like object or path
+        file_extension: File extension used to pick the reader
+        
+    Returns:
+        List of column names
+    """
+    try:
+        if file_extension in PARQUET_EXTENSIONS:
+            names = pq.read_schema(file).names
+        else:
+            try:
+                names = pa.ipc.open_file(file).schema.names
+            except pa.ArrowInvalid:
+                # Arrow IPC stream format has no footer; only the schema message is read
+                _rewind(file)
+                names = pa.ipc.open_stream(file).schema.names
+    finally:
+        _rewind(file)
+    
+    # Skip index columns stored by pandas
+    return [name for name in names if not name.startswith('__index_level_')]
+
+def read_columnar(file: IO,
+                  file_extension: str,
+                  columns: Optional[List[str]] = None,
+                  filters: Optional[List[Tuple[str, str, Any]]] = None) -> pd.DataFrame:
+    """
+    Read a Parquet, Feather or Arrow IPC file, loading only the requested columns.
+    
+    For Parquet files, row filters are pushed down so row groups whose statistics
+    rule them out are skipped entirely. For Arrow IPC files the filters are applied
+    in Arrow before conversion to pandas.
+    
+    Args:
+        file: Binary file-like object or path
+        file_extension: File extension used to pick the reader
+        columns: Columns to read (all columns if None)
+        filters: Optional row filters as (column, op, value) tuples, e.g. [('year', '>=', 2020)]
+        
+    Returns:
+        DataFrame with the projected columns
+    """
+    _rewind(file)
+    
+    if file_extension in PARQUET_EXTENSIONS:
+        table = pq.read_table(file, columns=columns, filters=filters or None)
+    else:
+        try:
+            table = feather.read_table(file, columns=columns)
+        except pa.ArrowInvalid:
+            _rewind(file)
+            table = pa.ipc.open_stream(file).read_all()
+            if columns is not None:
+                table = table.select(columns)
+        if filters:
+            table = table.filter(pq.filters_to_expression(filters))
+    
+    return table.to_pandas()
+
+def _rewind(file: IO) -> None:
+    """Seek a file-like object back to the start (paths are left untouched)."""
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+def stream_csv(file: IO,
+               chunksize: int = CSV_CHUNK_SIZE,
+               sample_rows: int = STREAM_SAMPLE_ROWS,
+               total_bytes: Optional[int] = None,
+               progress_callback: Optional[Callable[[float], None]] = None,
+               random_state: int = 42) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Read a CSV file in fixed-size chunks, building overview metrics incrementally.
+
+    Only one chunk plus a bounded random sample of rows is held in memory at any
+    time, so peak memory tracks the chunk size rather than the file size.
+
+    Args:
+        file: File-like object (e.g. a Streamlit UploadedFile) or path
+        chunksize: Number of rows parsed per chunk
+        sample_rows: Maximum number of rows kept for analysis (reservoir sample)
+        total_bytes: Size of the file in bytes, used to report progress
+        progress_callback: Optional function called with the fraction read (0-1)
+        random_state: Seed for the reservoir sample
+
+    Returns:
+        Tuple containing the sampled DataFrame and the overview metrics
+    """
+    rng = np.random.default_rng(random_state)
+
+    sample = None
+    row_count = 0
+    missing_counts = None
+    numeric_columns = None
+
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        # Accumulate overview metrics
+        chunk_missing = chunk.isna().sum()
+        missing_counts = chunk_missing if missing_counts is None else missing_counts.add(chunk_missing, fill_value=0)
+
+        # A column only counts as numeric if it parsed as numeric in every chunk
+        chunk_numeric = set(chunk.select_dtypes(include=['number']).columns)
+        numeric_columns = chunk_numeric if numeric_columns is None else numeric_columns & chunk_numeric
+
+        # Update the reservoir sample
+        sample = _update_reservoir(sample, chunk, row_count, sample_rows, rng)
+        row_count += len(chunk)
+
+        if progress_callback is not None and total_bytes:
+            try:
+                progress_callback(min(file.tell() / total_bytes, 1.0))
+            except (AttributeError, OSError):
+                pass
+
+    if sample is None:
+        sample = pd.DataFrame()
+        missing_counts = pd.Series(dtype='int64')
+        numeric_columns = set()
+
+    overview = {
+        'row_count': row_count,
+        'column_count': len(sample.columns),
+        'numeric_columns': [col for col in sample.columns if col in numeric_columns],
+        'missing_values': {col: int(missing_counts.get(col, 0)) for col in sample.columns},
+        'sampled': row_count > len(sample)
+    }
+
+    if progress_callback is not None:
+        progress_callback(1.0)
+
+    return sample, overview
+
+def _update_reservoir(sample: Optional[pd.DataFrame], chunk: pd.DataFrame, seen: int,
+                      capacity: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Merge a chunk into a uniform reservoir sample of at most `capacity` rows."""
+    if sample is None:
+        sample = chunk.iloc[:0]
+
+    # Fill the reservoir first
+    free = max(capacity - len(sample), 0)
+    head = chunk.iloc[:free]
+    rest = chunk.iloc[free:]
+    if len(head) > 0:
+        sample = pd.concat([sample, head], ignore_index=True)
+
+    if len(rest) == 0:
+        return sample
+
+    # Algorithm R, vectorized: row number i replaces a random slot with probability k/(i+1)
+    start = seen + len(head)
+    slots = rng.integers(0, np.arange(start, start + len(rest)) + 1)
+    accepted = np.flatnonzero(slots < capacity)
+    if len(accepted) == 0:
+        return sample
+
+    # When several rows hit the same slot, the last one wins
+    replacements = pd.Series(accepted, index=slots[accepted])
+    replacements = replacements[~replacements.index.duplicated(keep='last')]
+
+    keep = np.ones(len(sample), dtype=bool)
+    keep[replacements.index.to_numpy()] = False
+    return pd.concat([sample[keep], rest.iloc[replacements.to_numpy()]], ignore_index=True)
+
+def overview_metrics(data: pd.DataFrame,
+                     overview: Optional[Dict[str, Any]] = None,
+                     profiles: Optional[Dict[str, ColumnProfile]] = None) -> Dict[str, Any]:
+    """
+    Compute the overview metrics shown at the top of the app.
+
+    When the data was streamed, the full-file row count and missing value counts
+    from the streaming pass are used instead of the in-memory sample.
+
+    Args:
+        data: The DataFrame being analyzed
+        overview: Optional overview metrics returned by stream_csv
+        profiles: Optional column profiles (computed if not given)
+
+    Returns:
+        Dictionary with row, column, numeric column and missing value metrics
+    """
+    columns = data.columns.tolist()
+    if profiles is None:
+        profiles = profile_dataset(data)
+
+    if overview is None:
+        row_count = len(data)
+        missing_values = {col: profiles[col].missing_count for col in columns}
+    else:
+        row_count = overview['row_count']
+        missing_values = {col: overview['missing_values'].get(col, 0) for col in columns}
+
+    total_cells = row_count * len(columns)
+    total_missing = sum(missing_values.values())
+
+    return {
+        'row_count': row_count,
+        'column_count': len(columns),
+        'numeric_columns': len(profiles_of_kind(profiles, 'numeric')),
+        'missing_values': missing_values,
+        'missing_percentage': round(total_missing / total_cells * 100, 2) if total_cells > 0 else 0.0
+    }
@@ -1,14 +1,46 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
+from pandas.tseries.api import guess_datetime_format
 import streamlit as st
 
-def process_data(data: pd.DataFrame) -> pd.DataFrame:
+from utils import LRUCache
+from profiler import ColumnProfile, profile_dataset
+from sketches import sketch_quantiles
+from correlation import correlation_matrix
+
+# Object columns with fewer unique values than this share of rows become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Explicit formats tried when detecting date columns
+DATE_FORMAT_CANDIDATES = [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y/%m/%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%m-%d-%Y',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+]
+
+# Number of values sampled per column when detecting date formats
+DATE_SAMPLE_SIZE = 200
+
+# Date formats detected for previous uploads, keyed by column name
+_date_format_cache = LRUCache(max_entries=1024)
+
+def process_data(data: pd.DataFrame, downcast: bool = True) -> pd.DataFrame:
     """
     Process and clean the uploaded data.
     
     Args:
         data: The input DataFrame
+        downcast: Shrink numeric and low-cardinality text columns (see optimize_dtypes)
         
     Returns:
         Processed DataFrame
@@ -22,18 +54,9 @@ def process_data(data: pd.DataFrame) -> pd.DataFrame:
     for col in df.columns:
         # Try to convert string columns that might be dates
         if df[col].dtype == 'object':
-            try:
-                # Check if it has date-like patterns
-                date_sample = df[col].dropna().iloc[0] if not df[col].dropna().empty else ""
-                if isinstance(date_sample, str) and (
-                    '/' in date_sample or 
-                    '-' in date_sample or 
-                    ':' in date_sample
-                ):
-                    df[col] = pd.to_datetime(df[col], errors='ignore')
-            except:
-                # If conversion fails, keep the original
-                pass
+            parsed = parse_datetime_column(df[col], column_name=str(col))
+            if parsed is not None:
+                df[col] = parsed
     
     # 2. Fix column names (remove spaces, special characters)
     df.columns = [str(col).strip().replace(' ', '_').lower() for col in df.columns]
@@ -42,8 +65,146 @@ def process_data(data: pd.DataFrame) -> pd.DataFrame:
     numeric_cols = df.select_dtypes(include=['number']).columns
     # For this tool, we'll keep nulls as is to allow users to see them
     
+    # 4. Use the smallest dtypes that hold the data
+    if downcast:
+        df, _ = optimize_dtypes(df)
+    
     return df
 
+def detect_datetime_format(series: pd.Series,
+                           column_name: Optional[str] = None,
+                           sample_size: int = DATE_SAMPLE_SIZE) -> Optional[str]:
+    """
+    Detect the explicit datetime format of a text column from a bounded random sample.
+    
+    Each candidate format is tested against the sample with a vectorized parse, and the
+    first format parsing every sampled value wins. Formats detected for a column name
+    are tried first on later uploads with the same schema; a stale format simply fails
+    the sample and the other candidates are tried.
+    
+    Args:
+        series: Column to inspect
+        column_name: Optional name used to cache the detected format
+        sample_size: Maximum number of non-null values tested
+        
+    Returns:
+        The winning strftime format, or None if the column does not look like dates
+    """
+    non_null = series.dropna()
+    if non_null.empty:
+        return None
+    
+    sample = non_null.sample(min(sample_size, len(non_null)), random_state=0)
+    if not all(isinstance(value, str) for value in sample):
+        return None
+    sample = sample.str.strip()
+    
+    # Try the cached format for this column name, then a format guessed from one value
+    candidates = []
+    cached_format = _date_format_cache.get(column_name) if column_name else None
+    if cached_format:
+        candidates.append(cached_format)
+    guessed_format = guess_datetime_format(sample.iloc[0])
+    if guessed_format:
+        candidates.append(guessed_format)
+    candidates.extend(DATE_FORMAT_CANDIDATES)
+    
+    for date_format in dict.fromkeys(candidates):
+        if pd.to_datetime(sample, format=date_format, errors='coerce').notna().all():
+            if column_name:
+                _date_format_cache.put(column_name, date_format)
+            return date_format
+    
+    return None
+
+def parse_datetime_column(series: pd.Series, column_name: Optional[str] = None) -> Optional[pd.Series]:
+    """
+    Convert a text column to datetimes using the format detected from a sample.
+    
+    Args:
+        series: Column to convert
+        column_name: Optional name used to cache the detected format
+        
+    Returns:
+        The converted column, or None if the column is not a date column or any
+        non-null value does not parse (the original values are then kept)
+    """
+    date_format = detect_datetime_format(series, column_name=column_name)
+    if date_format is None:
+        return None
+    
+    parsed = pd.to_datetime(series.str.strip(), format=date_format, errors='coerce')
+    
+    # Reject the conversion rather than lose values that do not parse
+    if parsed.notna().sum() != series.notna().sum():
+        return None
+    
+    return parsed
+
+def optimize_dtypes(data: pd.DataFrame,
+                    category_ratio: float = CATEGORY_MAX_UNIQUE_RATIO) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Downcast numeric columns and convert low-cardinality text columns to categoricals.
+    
+    Integers are downcast to the smallest integer width that holds their range, and
+    floats to float32 only when every value survives the round trip unchanged.
+    
+    Args:
+        data: The input DataFrame
+        category_ratio: Maximum share of unique values for an object column to become categorical
+        
+    Returns:
+        Tuple containing the optimized DataFrame and a per-column memory report
+    """
+    df = data.copy(deep=False)
+    report = []
+    
+    for col in df.columns:
+        series = df[col]
+        before = series.memory_usage(index=False, deep=True)
+        
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        elif pd.api.types.is_integer_dtype(series):
+            optimized = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            optimized = pd.to_numeric(series, downcast='float')
+            if optimized.dtype != series.dtype and not np.array_equal(
+                optimized.to_numpy(dtype='float64'), series.to_numpy(dtype='float64'), equal_nan=True
+            ):
+                optimized = series
+        elif pd.api.types.is_object_dtype(series):
+            try:
+                non_null = series.count()
+                if non_null == 0 or series.nunique() / non_null >= category_ratio:
+                    continue
+            except TypeError:
+                # Unhashable values (e.g. lists) cannot be categorized
+                continue
+            optimized = series.astype('category')
+        else:
+            continue
+        
+        after = optimized.memory_usage(index=False, deep=True)
+        if after >= before:
+            continue
+        
+        df[col] = optimized
+        report.append({
+            'column': col,
+            'original_dtype': str(series.dtype),
+            'optimized_dtype': str(optimized.dtype),
+            'original_bytes': int(before),
+            'optimized_bytes': int(after),
+            'bytes_saved': int(before - after)
+        })
+    
+    report = pd.DataFrame(report, columns=[
+        'column', 'original_dtype', 'optimized_dtype', 'original_bytes', 'optimized_bytes', 'bytes_saved'
+    ])
+    
+    return df, report
+
 def filter_data(data: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
     """
     Filter the DataFrame to include only the selected columns.
@@ -66,24 +227,28 @@ def filter_data(data: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
     
     return data[valid_columns]
 
-def get_basic_stats(data: pd.DataFrame) -> Dict[str, Any]:
+def get_basic_stats(data: pd.DataFrame, profiles: Optional[Dict[str, ColumnProfile]] = None) -> Dict[str, Any]:
     """
     Generate basic statistics for the DataFrame.
     
     Args:
         data: The input DataFrame
+        profiles: Optional column profiles (computed if not given)
         
     Returns:
         Dictionary containing basic statistics
     """
     stats = {}
     
+    if profiles is None:
+        profiles = profile_dataset(data)
+    
     # Basic dataframe info
     stats['row_count'] = len(data)
     stats['column_count'] = len(data.columns)
     
     # Missing values
-    missing_values = data.isna().sum().sum()
+    missing_values = sum(profile.missing_count for profile in profiles.values())
     stats['missing_values'] = missing_values
     stats['missing_percentage'] = (missing_values / (len(data) * len(data.columns))) * 100
     
@@ -101,7 +266,7 @@ def get_basic_stats(data: pd.DataFrame) -> Dict[str, Any]:
         stats['numeric_columns_list'] = []
     
     # Categorical column statistics
-    categorical_cols = data.select_dtypes(include=['object']).columns
+    categorical_cols = data.select_dtypes(include=['object', 'category']).columns
     if len(categorical_cols) > 0:
         stats['categorical_columns'] = len(categorical_cols)
         stats['categorical_columns_list'] = categorical_cols.tolist()
@@ -111,23 +276,28 @@ def get_basic_stats(data: pd.DataFrame) -> Dict[str, Any]:
     
     return stats
 
-def detect_outliers(data: pd.DataFrame, column: str) -> Tuple[pd.DataFrame, float]:
+def detect_outliers(data: pd.DataFrame, column: str, approximate: bool = False) -> Tuple[pd.DataFrame, float]:
     """
     Detect outliers in a numerical column using IQR method.
     
     Args:
         data: Input DataFrame
         column: Column name to analyze
+        approximate: Estimate the quartiles with a KLL sketch (rank error KLLSketch.rank_error)
+            instead of sorting the full column
         
     Returns:
         Tuple containing DataFrame of outlier values and percentage of outliers
     """
-    if column not in data.columns or data[column].dtype not in ['int64', 'float64']:
+    if column not in data.columns or not pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_bool_dtype(data[column]):
         return pd.DataFrame(), 0
     
     # Calculate IQR
-    Q1 = data[column].quantile(0.25)
-    Q3 = data[column].quantile(0.75)
+    if approximate:
+        Q1, Q3 = sketch_quantiles(data[column]).quantiles([0.25, 0.75])
+    else:
+        Q1 = data[column].quantile(0.25)
+        Q3 = data[column].quantile(0.75)
     IQR = Q3 - Q1
     
     # Define outlier bounds
@@ -140,33 +310,58 @@ def detect_outliers(data: pd.DataFrame, column: str) -> Tuple[pd.DataFrame, floa
     
     return outliers, outlier_percentage
 
-def identify_correlated_columns(data: pd.DataFrame, threshold: float = 0.7) -> List[Tuple[str, str, float]]:
+def identify_correlated_columns(data: pd.DataFrame, threshold: float = 0.7,
+                                top_n: Optional[int] = None,
+                                fingerprints: Optional[Dict[str, str]] = None) -> List[Tuple[str, str, float]]:
     """
     Identify highly correlated numerical columns.
     
     Args:
         data: Input DataFrame
         threshold: Correlation coefficient threshold
+        top_n: Optional maximum number of pairs to return
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
     Returns:
-        List of tuples with correlated column pairs and their correlation value
+        List of tuples with correlated column pairs and their absolute correlation value,
+        strongest first
     """
-    numeric_data = data.select_dtypes(include=['number'])
+    # Calculate correlation matrix (cached and shared with the heatmaps)
+    corr_matrix = correlation_matrix(data, fingerprints=fingerprints)
     
-    if numeric_data.shape[1] <= 1:
+    if corr_matrix.shape[1] <= 1:
         return []
     
-    # Calculate correlation matrix
-    corr_matrix = numeric_data.corr().abs()
+    # Pairs are reported with the later column first
+    return [(col2, col1, abs(corr_val))
+            for col1, col2, corr_val in extract_correlated_pairs(corr_matrix, threshold, top_n)]
+
+def extract_correlated_pairs(corr_matrix: pd.DataFrame, threshold: float,
+                             top_n: Optional[int] = None) -> List[Tuple[str, str, float]]:
+    """
+    Extract the column pairs of a correlation matrix whose absolute correlation exceeds a threshold.
+    
+    The upper triangle is masked in one vectorized pass, so the cost does not depend on
+    Python-level indexing of every cell.
     
-    # Get upper triangle of correlation matrix
-    upper = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(bool))
+    Args:
+        corr_matrix: Square correlation matrix
+        threshold: Absolute correlation threshold (pairs must be strictly above it)
+        top_n: Optional maximum number of pairs to return
+        
+    Returns:
+        List of (column, later column, signed correlation) tuples, strongest first
+    """
+    values = corr_matrix.to_numpy()
+    rows, cols = np.triu_indices(len(values), k=1)
+    pair_values = values[rows, cols]
+    strength = np.abs(pair_values)
     
-    # Find index of feature columns with correlation greater than threshold
-    correlated_pairs = []
-    for i, col in enumerate(upper.columns):
-        for j, row in enumerate(upper.index):
-            if upper.iloc[j, i] > threshold:
-                correlated_pairs.append((col, row, upper.iloc[j, i]))
+    # NaN correlations never pass the threshold
+    selected = np.flatnonzero(strength > threshold)
+    if top_n is not None and len(selected) > top_n:
+        selected = selected[np.argpartition(-strength[selected], top_n - 1)[:top_n]]
+    selected = selected[np.argsort(-strength[selected], kind='stable')]
     
-    return correlated_pairs
+    names = corr_matrix.columns
+    return [(names[rows[k]], names[cols[k]], float(pair_values[k])) for k in selected]
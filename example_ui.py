@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 from ui_components import DataVizUI, ModernForm, DataWidgets, ChartBuilder
+from utils import show_chart
 
 # Set page configuration
 st.set_page_config(
@@ -333,7 +334,7 @@ def main():
         
         if fig:
             # Display the chart
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig)
     
     # Tab 5: Data Widgets
     elif selected_tab == 4:
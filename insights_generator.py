@@ -1,18 +1,34 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import scipy.stats as stats
-from data_processor import identify_correlated_columns, detect_outliers
+from data_processor import identify_correlated_columns
+from profiler import PROFILE_EXECUTOR, ColumnProfile, profile_column, profile_dataset, profiles_of_kind
 import os
 import json
 import streamlit as st
 
-def generate_automated_insights(data: pd.DataFrame) -> Dict[str, Any]:
+def generate_automated_insights(data: pd.DataFrame,
+                                profiles: Optional[Dict[str, ColumnProfile]] = None,
+                                workers: Optional[int] = None,
+                                executor: str = PROFILE_EXECUTOR,
+                                approximate: bool = False,
+                                fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Generate automated insights from the data.
     
+    Column profiling, the expensive per-column work, can be spread across a process or
+    thread pool; insights are always merged in column order, so the output does not
+    depend on the number of workers.
+    
     Args:
         data: Input DataFrame
+        profiles: Optional column profiles (computed if not given)
+        workers: Number of parallel profiling workers (defaults to PROFILE_WORKERS for large datasets)
+        executor: 'process' or 'thread'
+        approximate: Estimate distinct counts, top values and quantiles with sketches;
+            estimated figures are reported with their error bounds
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
     Returns:
         Dictionary containing various insights
@@ -23,35 +39,43 @@ def generate_automated_insights(data: pd.DataFrame) -> Dict[str, Any]:
         'correlation_insights': []
     }
     
+    # Profile every column once; all insight generators read from the profiles
+    if profiles is None:
+        profiles = profile_dataset(data, workers=workers, executor=executor, approximate=approximate,
+                                   fingerprints=fingerprints)
+    
     # General dataset insights
-    insights['general_insights'].extend(_generate_general_insights(data))
+    insights['general_insights'].extend(_generate_general_insights(data, profiles))
     
     # Column-specific insights
     for column in data.columns:
-        col_insights = _generate_column_insights(data, column)
+        col_insights = _generate_column_insights(data, column, profiles[column])
         if col_insights:
             insights['column_insights'][column] = col_insights
     
     # Correlation insights
-    insights['correlation_insights'] = _generate_correlation_insights(data)
+    insights['correlation_insights'] = _generate_correlation_insights(data, fingerprints)
     
     return insights
 
-def _generate_general_insights(data: pd.DataFrame) -> List[str]:
+def _generate_general_insights(data: pd.DataFrame, profiles: Optional[Dict[str, ColumnProfile]] = None) -> List[str]:
     """Generate general insights about the dataset."""
     insights = []
     
+    if profiles is None:
+        profiles = profile_dataset(data)
+    
     # Dataset size
     insights.append(f"The dataset contains {data.shape[0]:,} rows and {data.shape[1]} columns.")
     
     # Missing values
-    missing_count = data.isna().sum().sum()
+    missing_by_col = pd.Series({col: profile.missing_count for col, profile in profiles.items()}, dtype='int64')
+    missing_count = missing_by_col.sum()
     if missing_count > 0:
         missing_pct = (missing_count / (data.shape[0] * data.shape[1])) * 100
         insights.append(f"The dataset contains {missing_count:,} missing values ({missing_pct:.2f}% of all data points).")
         
         # Columns with most missing values
-        missing_by_col = data.isna().sum()
         high_missing_cols = missing_by_col[missing_by_col > 0].sort_values(ascending=False)
         if not high_missing_cols.empty:
             top_missing_cols = high_missing_cols.head(3)
@@ -62,17 +86,14 @@ def _generate_general_insights(data: pd.DataFrame) -> List[str]:
         insights.append("The dataset is complete with no missing values.")
     
     # Numeric vs categorical columns
-    num_cols = data.select_dtypes(include=['number']).columns
-    cat_cols = data.select_dtypes(include=['object']).columns
-    date_cols = data.select_dtypes(include=['datetime']).columns
+    num_cols = profiles_of_kind(profiles, 'numeric')
+    cat_cols = profiles_of_kind(profiles, 'categorical')
+    date_cols = profiles_of_kind(profiles, 'datetime')
     
     insights.append(f"The dataset has {len(num_cols)} numeric columns, {len(cat_cols)} categorical columns, and {len(date_cols)} date columns.")
     
     # Potential ID columns
-    potential_id_cols = []
-    for col in data.columns:
-        if data[col].nunique() == data.shape[0]:
-            potential_id_cols.append(col)
+    potential_id_cols = [col for col, profile in profiles.items() if profile.is_all_unique]
     
     if potential_id_cols:
         if len(potential_id_cols) == 1:
@@ -89,48 +110,48 @@ def _generate_general_insights(data: pd.DataFrame) -> List[str]:
     
     return insights
 
-def _generate_column_insights(data: pd.DataFrame, column: str) -> List[str]:
+def _generate_column_insights(data: pd.DataFrame, column: str, profile: Optional[ColumnProfile] = None) -> List[str]:
     """Generate insights for a specific column."""
     insights = []
     
+    if profile is None:
+        profile = profile_column(data[column])
+    
     # Skip columns with too many unique values (likely IDs)
-    if data[column].nunique() == data.shape[0] and data.shape[0] > 100:
+    if profile.is_all_unique and data.shape[0] > 100:
         insights.append(f"This column has unique values for every row and might be an identifier column.")
         return insights
     
-    # Handle different column types
-    dtype = data[column].dtype
-    
     # Numeric columns
-    if pd.api.types.is_numeric_dtype(dtype):
-        insights.extend(_analyze_numeric_column(data, column))
+    if profile.is_numeric:
+        insights.extend(_analyze_numeric_column(data, column, profile))
     
     # Categorical/text columns
-    elif pd.api.types.is_object_dtype(dtype):
-        insights.extend(_analyze_categorical_column(data, column))
+    elif profile.kind == 'categorical':
+        insights.extend(_analyze_categorical_column(data, column, profile))
     
     # Date columns
-    elif pd.api.types.is_datetime64_dtype(dtype):
-        insights.extend(_analyze_datetime_column(data, column))
+    elif profile.kind == 'datetime':
+        insights.extend(_analyze_datetime_column(data, column, profile))
     
     return insights
 
-def _analyze_numeric_column(data: pd.DataFrame, column: str) -> List[str]:
+def _analyze_numeric_column(data: pd.DataFrame, column: str, profile: Optional[ColumnProfile] = None) -> List[str]:
     """Analyze a numeric column and generate insights."""
     insights = []
     
-    # Basic stats
-    col_data = data[column].dropna()
+    if profile is None:
+        profile = profile_column(data[column])
     
-    if col_data.empty:
+    if profile.non_null_count == 0:
         insights.append("This column has no valid numeric data (all values are missing).")
         return insights
     
-    # Calculate statistics
-    mean_val = col_data.mean()
-    median_val = col_data.median()
-    min_val = col_data.min()
-    max_val = col_data.max()
+    # Statistics from the column profile
+    mean_val = profile.mean
+    median_val = profile.median
+    min_val = profile.min
+    max_val = profile.max
     
     # Format numbers properly
     if abs(mean_val) < 0.01 or abs(mean_val) > 1000:
@@ -141,7 +162,7 @@ def _analyze_numeric_column(data: pd.DataFrame, column: str) -> List[str]:
     insights.append(f"Average value is {mean_str}, with range from {min_val:,} to {max_val:,}.")
     
     # Skewness
-    skewness = col_data.skew()
+    skewness = profile.skew
     if abs(skewness) > 1:
         skew_direction = "positively" if skewness > 0 else "negatively"
         insights.append(f"The distribution is strongly {skew_direction} skewed (skewness = {skewness:.2f}).")
@@ -152,60 +173,65 @@ def _analyze_numeric_column(data: pd.DataFrame, column: str) -> List[str]:
     # Mean vs Median
     mean_median_diff_pct = abs(mean_val - median_val) / max(abs(median_val), 1e-10) * 100
     if mean_median_diff_pct > 20:
-        insights.append(f"The mean ({mean_str}) is significantly different from the median ({median_val:,}), suggesting potential outliers or a skewed distribution.")
+        median_str = _with_bounds(f"{median_val:,}", profile.error_bounds.get('median'))
+        insights.append(f"The mean ({mean_str}) is significantly different from the median ({median_str}), suggesting potential outliers or a skewed distribution.")
     
-    # Detect outliers
-    outliers, outlier_pct = detect_outliers(data, column)
-    if outlier_pct > 0:
-        insights.append(f"Found {len(outliers):,} outliers ({outlier_pct:.1f}% of values) based on the IQR method.")
+    # Outliers (IQR method)
+    if profile.outlier_count > 0:
+        outlier_pct = (profile.outlier_count / len(data)) * 100
+        outlier_str = _with_bounds(f"{profile.outlier_count:,}", profile.error_bounds.get('outlier_count'))
+        insights.append(f"Found {outlier_str} outliers ({outlier_pct:.1f}% of values) based on the IQR method.")
     
     # Zero values
-    zero_count = (col_data == 0).sum()
+    zero_count = profile.zeros_count
     if zero_count > 0:
-        zero_pct = (zero_count / len(col_data)) * 100
+        zero_pct = (zero_count / profile.non_null_count) * 100
         if zero_pct > 25:
             insights.append(f"High number of zero values: {zero_count:,} ({zero_pct:.1f}% of the data).")
     
     # Missing values
-    missing_count = data[column].isna().sum()
+    missing_count = profile.missing_count
     if missing_count > 0:
-        missing_pct = (missing_count / len(data)) * 100
+        missing_pct = profile.missing_percentage
         insights.append(f"Contains {missing_count:,} missing values ({missing_pct:.1f}% of the data).")
     
     return insights
 
-def _analyze_categorical_column(data: pd.DataFrame, column: str) -> List[str]:
+def _analyze_categorical_column(data: pd.DataFrame, column: str, profile: Optional[ColumnProfile] = None) -> List[str]:
     """Analyze a categorical/text column and generate insights."""
     insights = []
     
+    if profile is None:
+        profile = profile_column(data[column])
+    
     # Unique values
-    unique_count = data[column].nunique()
-    total_count = len(data[column].dropna())
+    unique_count = profile.unique_count
+    total_count = profile.non_null_count
     
     if total_count == 0:
         insights.append("This column has no valid data (all values are missing).")
         return insights
     
     # Missing values
-    missing_count = data[column].isna().sum()
+    missing_count = profile.missing_count
     if missing_count > 0:
-        missing_pct = (missing_count / len(data)) * 100
+        missing_pct = profile.missing_percentage
         insights.append(f"Contains {missing_count:,} missing values ({missing_pct:.1f}% of the data).")
     
     # Unique value analysis
     if unique_count == 1:
-        only_value = data[column].dropna().iloc[0]
+        only_value = next(iter(profile.top_values))
         insights.append(f"This column contains only one value: '{only_value}'.")
     else:
-        insights.append(f"Contains {unique_count:,} unique values.")
+        insights.append(f"Contains {_with_bounds(f'{unique_count:,}', profile.error_bounds.get('unique_count'))} unique values.")
         
         # Get value frequency
-        value_counts = data[column].value_counts()
-        top_values = value_counts.head(3)
+        top_values = list(profile.top_values.items())[:3]
+        top_value_bounds = profile.error_bounds.get('top_values', {})
         
         # Format the output for top values
-        top_values_str = ", ".join([f"'{val}' ({count:,}, {(count/total_count)*100:.1f}%)" 
-                                  for val, count in top_values.items()])
+        top_values_str = ", ".join([f"'{val}' ({_with_bounds(f'{count:,}', top_value_bounds.get(val))}, {(count/total_count)*100:.1f}%)" 
+                                  for val, count in top_values])
         
         insights.append(f"Most common values: {top_values_str}.")
         
@@ -221,38 +247,39 @@ def _analyze_categorical_column(data: pd.DataFrame, column: str) -> List[str]:
     
     return insights
 
-def _analyze_datetime_column(data: pd.DataFrame, column: str) -> List[str]:
+def _analyze_datetime_column(data: pd.DataFrame, column: str, profile: Optional[ColumnProfile] = None) -> List[str]:
     """Analyze a datetime column and generate insights."""
     insights = []
     
-    # Filter out NaT values
-    date_data = data[column].dropna()
+    if profile is None:
+        profile = profile_column(data[column])
     
-    if date_data.empty:
+    if profile.non_null_count == 0:
         insights.append("This column has no valid date data (all values are missing or invalid).")
         return insights
     
     # Date range
-    min_date = date_data.min()
-    max_date = date_data.max()
+    min_date = profile.min
+    max_date = profile.max
     date_range = max_date - min_date
     
     insights.append(f"Date range from {min_date.date()} to {max_date.date()} (spanning {date_range.days} days).")
     
     # Check for gaps
-    if len(date_data) > 1 and date_range.days > 0:
-        unique_dates = date_data.dt.date.nunique()
+    if profile.non_null_count > 1 and date_range.days > 0:
+        unique_dates = profile.unique_dates
         coverage = unique_dates / date_range.days
         
+        unique_dates_str = _with_bounds(f"{unique_dates:,}", profile.error_bounds.get('unique_dates'))
         if coverage < 0.1:
-            insights.append(f"Sparse date coverage: only {unique_dates:,} unique dates out of {date_range.days:,} days in the range.")
+            insights.append(f"Sparse date coverage: only {unique_dates_str} unique dates out of {date_range.days:,} days in the range.")
         elif coverage > 0.9:
-            insights.append(f"Dense date coverage: {unique_dates:,} unique dates out of {date_range.days:,} days in the range.")
+            insights.append(f"Dense date coverage: {unique_dates_str} unique dates out of {date_range.days:,} days in the range.")
     
     # Look for patterns in the data
-    if len(date_data) >= 10:
+    if profile.non_null_count >= 10:
         # Check for weekday patterns
-        weekday_counts = date_data.dt.dayofweek.value_counts().sort_index()
+        weekday_counts = pd.Series(profile.weekday_counts)
         weekday_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         weekday_counts.index = [weekday_names[i] for i in weekday_counts.index]
         
@@ -267,14 +294,21 @@ def _analyze_datetime_column(data: pd.DataFrame, column: str) -> List[str]:
             insights.append(f"Date pattern detected: {most_common_day} is the most common day, while {least_common_day} is the least common.")
     
     # Missing values
-    missing_count = data[column].isna().sum()
+    missing_count = profile.missing_count
     if missing_count > 0:
-        missing_pct = (missing_count / len(data)) * 100
+        missing_pct = profile.missing_percentage
         insights.append(f"Contains {missing_count:,} missing or invalid dates ({missing_pct:.1f}% of the data).")
     
     return insights
 
-def _generate_correlation_insights(data: pd.DataFrame) -> List[str]:
+def _with_bounds(value: str, bounds: Optional[Tuple[Any, Any]]) -> str:
+    """Mark a formatted figure as approximate and append its error bounds, if it has any."""
+    if bounds is None:
+        return value
+    low, high = [f"{bound:,}" if isinstance(bound, (int, np.integer)) else f"{bound:,.6g}" for bound in bounds]
+    return f"~{value} (between {low} and {high})"
+
+def _generate_correlation_insights(data: pd.DataFrame, fingerprints: Optional[Dict[str, str]] = None) -> List[str]:
     """Generate insights about correlations between columns."""
     insights = []
     
@@ -285,16 +319,11 @@ def _generate_correlation_insights(data: pd.DataFrame) -> List[str]:
         return insights
     
     # Find highly correlated pairs
-    correlated_pairs = identify_correlated_columns(data, threshold=0.7)
+    # Top 5, already sorted by correlation strength
+    correlated_pairs = identify_correlated_columns(data, threshold=0.7, top_n=5, fingerprints=fingerprints)
     
     if correlated_pairs:
-        # Sort by correlation strength
-        correlated_pairs.sort(key=lambda x: x[2], reverse=True)
-        
-        # Top correlations
-        top_correlations = correlated_pairs[:5]  # Limit to top 5
-        
-        for col1, col2, corr_val in top_correlations:
+        for col1, col2, corr_val in correlated_pairs:
             corr_strength = "strong positive" if corr_val > 0.8 else "moderate positive"
             insights.append(f"Found {corr_strength} correlation ({corr_val:.2f}) between '{col1}' and '{col2}'.")
     else:
@@ -302,56 +331,57 @@ def _generate_correlation_insights(data: pd.DataFrame) -> List[str]:
     
     return insights
 
-def extract_key_metrics(data: pd.DataFrame) -> Dict[str, Any]:
+def extract_key_metrics(data: pd.DataFrame, profiles: Optional[Dict[str, ColumnProfile]] = None) -> Dict[str, Any]:
     """
     Extract key metrics that can be displayed on a dashboard.
     
     Args:
         data: Input DataFrame
+        profiles: Optional column profiles (computed if not given)
         
     Returns:
         Dictionary of key metrics
     """
     metrics = {}
     
+    if profiles is None:
+        profiles = profile_dataset(data)
+    
     # Basic data metrics
     metrics['row_count'] = len(data)
     metrics['column_count'] = len(data.columns)
     
     # Missing data percentage
     total_cells = data.size
-    total_missing = data.isna().sum().sum()
+    total_missing = sum(profile.missing_count for profile in profiles.values())
     metrics['missing_percentage'] = (total_missing / total_cells) * 100 if total_cells > 0 else 0
     
     # Summary stats for numeric columns
-    numeric_data = data.select_dtypes(include=['number'])
+    numeric_profiles = profiles_of_kind(profiles, 'numeric')
     
-    if not numeric_data.empty:
+    if numeric_profiles:
         # Calculate averages and standard deviations for each column
         metrics['column_stats'] = {}
         
-        for col in numeric_data.columns:
-            col_data = numeric_data[col].dropna()
-            
-            if not col_data.empty:
-                metrics['column_stats'][col] = {
-                    'mean': col_data.mean(),
-                    'median': col_data.median(),
-                    'std': col_data.std(),
-                    'min': col_data.min(),
-                    'max': col_data.max()
+        for profile in numeric_profiles:
+            if profile.non_null_count > 0:
+                metrics['column_stats'][profile.name] = {
+                    'mean': profile.mean,
+                    'median': profile.median,
+                    'std': profile.std,
+                    'min': profile.min,
+                    'max': profile.max
                 }
     
     # Top categories for categorical data
-    categorical_data = data.select_dtypes(include=['object'])
+    categorical_profiles = profiles_of_kind(profiles, 'categorical')
     
-    if not categorical_data.empty:
+    if categorical_profiles:
         metrics['categorical_stats'] = {}
         
-        for col in categorical_data.columns:
+        for profile in categorical_profiles:
             # Skip columns with high cardinality
-            if categorical_data[col].nunique() <= 10:
-                value_counts = categorical_data[col].value_counts().head(5).to_dict()
-                metrics['categorical_stats'][col] = value_counts
+            if profile.unique_count <= 10:
+                metrics['categorical_stats'][profile.name] = dict(profile.top_values)
     
     return metrics
@@ -0,0 +1,503 @@
+"""
+Asynchronous client layer for the OpenAI and Anthropic chat APIs.
+
+All requests run on one event loop in a background thread shared by every Streamlit
+session. Concurrency is bounded by a semaphore, and identical requests that are already
+in flight are coalesced so the API is called once and every caller gets the result.
+Responses can also be streamed chunk by chunk as they arrive.
+
+Responses are kept in an on-disk SQLite cache shared across sessions and restarts. A
+local fake provider answers every request when DATA_INSIGHTS_FAKE_LLM=1, so the app
+and its tests can run offline.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from prompt_context import estimate_tokens
+
+# API keys of the supported providers
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
+
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+# do not change this unless explicitly requested by the user
+OPENAI_MODEL = "gpt-4o"
+
+# the newest Anthropic model is "claude-3-5-sonnet-20241022" which was released October 22, 2024
+ANTHROPIC_MODEL = "claude-3-5-sonnet-20241022"
+
+# API calls in flight at once across all sessions
+LLM_MAX_CONCURRENCY = int(os.environ.get("DATA_INSIGHTS_LLM_CONCURRENCY", 4))
+
+# Seconds a caller waits for a response
+LLM_TIMEOUT = float(os.environ.get("DATA_INSIGHTS_LLM_TIMEOUT", 120))
+
+# Response cache file (disabled if empty), entry lifetime in seconds and total size limit
+LLM_CACHE_PATH = os.environ.get(
+    "DATA_INSIGHTS_LLM_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "data_insights", "llm_responses.sqlite3")
+)
+LLM_CACHE_TTL = float(os.environ.get("DATA_INSIGHTS_LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("DATA_INSIGHTS_LLM_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Answer every request with the local fake provider instead of calling an API
+LLM_FAKE = os.environ.get("DATA_INSIGHTS_FAKE_LLM", "") == "1"
+
+# Number of recent calls kept in the call log
+LLM_CALL_LOG_SIZE = 200
+
+@dataclass(frozen=True)
+class LLMRequest:
+    """A single chat completion request."""
+    provider: str
+    model: str
+    messages: Tuple[Tuple[str, str], ...]
+    temperature: float = 0.2
+    max_tokens: int = 1000
+    system: Optional[str] = None
+    json_mode: bool = False
+
+    @classmethod
+    def create(cls, provider: str, prompt: str, system: Optional[str] = None, **kwargs) -> 'LLMRequest':
+        """
+        Create a single-turn request for a provider's default model.
+
+        Args:
+            provider: "openai" or "anthropic"
+            prompt: User message
+            system: Optional system message
+            **kwargs: Other request fields (model, temperature, max_tokens, json_mode)
+
+        Returns:
+            LLMRequest
+        """
+        kwargs.setdefault('model', ANTHROPIC_MODEL if provider == "anthropic" else OPENAI_MODEL)
+        return cls(provider=provider, messages=(("user", prompt),), system=system, **kwargs)
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Estimated number of prompt tokens (system and messages)."""
+        return estimate_tokens((self.system or "") + "\n".join(content for _, content in self.messages))
+
+    def key(self) -> str:
+        """
+        Hash identifying the request, used to coalesce and cache identical requests.
+
+        Prompts are normalized first, so whitespace and indentation differences between
+        otherwise identical prompts map to the same key.
+        """
+        prompt = [[role, _normalize(content)] for role, content in self.messages]
+        system = _normalize(self.system) if self.system else None
+        payload = json.dumps([self.provider, self.model, self.temperature, prompt,
+                              system, self.max_tokens, self.json_mode])
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+class ResponseCache:
+    """SQLite-backed response cache with time-to-live and least-recently-used size eviction."""
+
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite database file
+            ttl: Seconds an entry stays valid
+            max_bytes: Limit on the total size of the cached responses
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, provider TEXT, model TEXT, temperature REAL, "
+            "response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, request: LLMRequest) -> Optional[str]:
+        """Return the cached response to a request, if present and not expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM responses WHERE key = ? AND created >= ?",
+                (request.key(), now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, request.key()))
+        return row[0]
+
+    def put(self, request: LLMRequest, response: str) -> None:
+        """Store a response, then evict expired and least recently used entries."""
+        now = time.time()
+        size = len(response.encode())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (request.key(), request.provider, request.model, request.temperature, response, size, now, now)
+            )
+            self._connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop the least recently used entries until the rest fit
+                excess = total - self.max_bytes
+                keys = []
+                for key, entry_size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    keys.append((key,))
+                    excess -= entry_size
+                    if excess <= 0:
+                        break
+                self._connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+def recent_calls() -> List[Dict[str, Any]]:
+    """
+    Return the most recent requests with their prompt size, newest last.
+
+    Returns:
+        List of dictionaries with provider, model, prompt_tokens, response_chars, seconds and
+        source ('api', 'stream', 'cache' or 'coalesced')
+    """
+    return list(_call_log)
+
+def provider_available(provider: str) -> bool:
+    """Whether the API key of a provider is configured (always true with the fake provider)."""
+    if LLM_FAKE:
+        return True
+    return bool(ANTHROPIC_API_KEY if provider == "anthropic" else OPENAI_API_KEY)
+
+def default_provider() -> Optional[str]:
+    """The provider used when none is chosen: Anthropic if configured, then OpenAI."""
+    for provider in ("anthropic", "openai"):
+        if provider_available(provider):
+            return provider
+    return None
+
+def complete(request: LLMRequest, timeout: Optional[float] = None) -> str:
+    """
+    Run a request on the shared event loop and wait for its response text.
+
+    Args:
+        request: Chat completion request
+        timeout: Seconds to wait (defaults to LLM_TIMEOUT)
+
+    Returns:
+        Response text
+    """
+    future = asyncio.run_coroutine_threadsafe(complete_async(request), _event_loop())
+    return future.result(LLM_TIMEOUT if timeout is None else timeout)
+
+def complete_many(requests: List[LLMRequest], timeout: Optional[float] = None) -> List[Union[str, Exception]]:
+    """
+    Run requests concurrently on the shared event loop.
+
+    Args:
+        requests: Chat completion requests
+        timeout: Seconds to wait for all responses (defaults to LLM_TIMEOUT)
+
+    Returns:
+        Response text or the raised exception, in request order
+    """
+    async def gather():
+        return await asyncio.gather(*(complete_async(request) for request in requests), return_exceptions=True)
+
+    future = asyncio.run_coroutine_threadsafe(gather(), _event_loop())
+    return future.result(LLM_TIMEOUT if timeout is None else timeout)
+
+def stream(request: LLMRequest, timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Run a request on the shared event loop and yield its response text as it arrives.
+
+    A cached response is yielded as a single chunk, and a completed stream is stored in
+    the response cache. Streams count against the concurrency limit but are not coalesced.
+
+    Args:
+        request: Chat completion request
+        timeout: Seconds to wait for each chunk (defaults to LLM_TIMEOUT)
+
+    Yields:
+        Successive pieces of the response text
+    """
+    chunks = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(_stream_to_queue(request, chunks), _event_loop())
+    try:
+        while True:
+            chunk = chunks.get(timeout=LLM_TIMEOUT if timeout is None else timeout)
+            if chunk is _END_OF_STREAM:
+                break
+            yield chunk
+        # Re-raise any error of the provider stream
+        future.result()
+    finally:
+        # Stop the provider stream when the consumer stops early
+        future.cancel()
+
+async def complete_async(request: LLMRequest) -> str:
+    """
+    Run a request, answering from the response cache or joining an identical request
+    already in flight.
+
+    Must be awaited on the shared event loop (see complete and complete_many).
+
+    Args:
+        request: Chat completion request
+
+    Returns:
+        Response text
+    """
+    request = _resolve(request)
+    started = time.perf_counter()
+
+    cache = response_cache()
+    if cache is not None:
+        response = cache.get(request)
+        if response is not None:
+            _record_call(request, response, started, 'cache')
+            return response
+
+    key = request.key()
+    task = _in_flight.get(key)
+    source = 'coalesced'
+    if task is None:
+        task = asyncio.ensure_future(_call(request))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+        source = 'api'
+
+    # A cancelled caller must not cancel the call the others are waiting for
+    response = await asyncio.shield(task)
+    _record_call(request, response, started, source)
+    return response
+
+def response_cache() -> Optional[ResponseCache]:
+    """Return the shared response cache, opening it on first use (None if disabled or unavailable)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None and LLM_CACHE_PATH and LLM_CACHE_TTL > 0:
+            try:
+                _cache = ResponseCache(LLM_CACHE_PATH)
+            except (OSError, sqlite3.Error):
+                # An unwritable cache location only disables caching
+                _cache = False
+    return _cache if isinstance(_cache, ResponseCache) else None
+
+# Shared response cache, opened on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+# Marks the end of a streamed response in the chunk queue
+_END_OF_STREAM = object()
+
+# Recent calls, newest last
+_call_log = deque(maxlen=LLM_CALL_LOG_SIZE)
+
+# Shared event loop, its semaphore and the tasks of in-flight requests (loop thread only)
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+_in_flight: Dict[str, asyncio.Future] = {}
+_clients: Dict[str, Any] = {}
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-client", daemon=True).start()
+    return _loop
+
+def _record_call(request: LLMRequest, response: str, started: float, source: str) -> None:
+    """Append a call and its prompt size to the call log."""
+    _call_log.append({
+        "provider": request.provider,
+        "model": request.model,
+        "prompt_tokens": request.prompt_tokens,
+        "response_chars": len(response or ""),
+        "seconds": round(time.perf_counter() - started, 3),
+        "source": source
+    })
+
+def _resolve(request: LLMRequest) -> LLMRequest:
+    """The request as sent: routed to the fake provider when it is enabled."""
+    if LLM_FAKE:
+        return replace(request, provider="fake")
+    return request
+
+def _limit() -> asyncio.Semaphore:
+    """Semaphore bounding the API calls in flight, created on the shared loop."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+async def _call(request: LLMRequest) -> str:
+    """Call the provider API once the concurrency limit allows it."""
+    provider = _PROVIDERS.get(request.provider)
+    if provider is None:
+        raise ValueError(f"Unsupported AI provider: {request.provider}")
+
+    async with _limit():
+        response = await provider(request)
+
+    cache = response_cache()
+    if cache is not None and response:
+        cache.put(request, response)
+    return response
+
+async def _stream_to_queue(request: LLMRequest, chunks: queue.Queue) -> None:
+    """Stream a response from the cache or the provider API into a queue, then mark its end."""
+    try:
+        request = _resolve(request)
+        started = time.perf_counter()
+        cache = response_cache()
+        response = cache.get(request) if cache is not None else None
+        if response is not None:
+            chunks.put(response)
+            _record_call(request, response, started, 'cache')
+            return
+
+        streamer = _STREAMERS.get(request.provider)
+        if streamer is None:
+            raise ValueError(f"Unsupported AI provider: {request.provider}")
+
+        parts = []
+        async with _limit():
+            async for chunk in streamer(request):
+                parts.append(chunk)
+                chunks.put(chunk)
+
+        response = "".join(parts)
+        _record_call(request, response, started, 'stream')
+        if cache is not None and response:
+            cache.put(request, response)
+    finally:
+        chunks.put(_END_OF_STREAM)
+
+def _normalize(text: str) -> str:
+    """Collapse runs of whitespace, which do not change the meaning of a prompt."""
+    return re.sub(r"\s+", " ", text).strip()
+
+def _client(provider: str) -> Any:
+    """Async API client of a provider, created on the shared loop."""
+    if provider not in _clients:
+        if provider == "anthropic":
+            import anthropic
+            _clients[provider] = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        else:
+            from openai import AsyncOpenAI
+            _clients[provider] = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _clients[provider]
+
+def _openai_arguments(request: LLMRequest) -> Dict[str, Any]:
+    """Keyword arguments of an OpenAI chat completion call."""
+    messages = [{"role": "system", "content": request.system}] if request.system else []
+    messages += [{"role": role, "content": content} for role, content in request.messages]
+
+    arguments = {
+        "model": request.model,
+        "messages": messages,
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens
+    }
+    if request.json_mode:
+        arguments["response_format"] = {"type": "json_object"}
+    return arguments
+
+def _anthropic_arguments(request: LLMRequest) -> Dict[str, Any]:
+    """Keyword arguments of an Anthropic messages call."""
+    arguments = {
+        "model": request.model,
+        "max_tokens": request.max_tokens,
+        "temperature": request.temperature,
+        "messages": [{"role": role, "content": content} for role, content in request.messages]
+    }
+    if request.system:
+        arguments["system"] = request.system
+    return arguments
+
+async def _openai_complete(request: LLMRequest) -> str:
+    """Chat completion through the OpenAI API."""
+    response = await _client("openai").chat.completions.create(**_openai_arguments(request))
+    return response.choices[0].message.content
+
+async def _anthropic_complete(request: LLMRequest) -> str:
+    """Message completion through the Anthropic API."""
+    message = await _client("anthropic").messages.create(**_anthropic_arguments(request))
+    return message.content[0].text
+
+async def _openai_stream(request: LLMRequest) -> AsyncIterator[str]:
+    """Streamed chat completion through the OpenAI API."""
+    response = await _client("openai").chat.completions.create(stream=True, **_openai_arguments(request))
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def _anthropic_stream(request: LLMRequest) -> AsyncIterator[str]:
+    """Streamed message completion through the Anthropic API."""
+    async with _client("anthropic").messages.stream(**_anthropic_arguments(request)) as response:
+        async for text in response.text_stream:
+            yield text
+
+async def _fake_complete(request: LLMRequest) -> str:
+    """Deterministic offline responses, in the formats the callers parse."""
+    digest = request.key()[:8]
+    prompt = (request.system or "") + "".join(content for _, content in request.messages)
+    if request.json_mode or '"general_insights"' in prompt:
+        categories = ["general_insights", "data_quality_insights", "statistical_insights",
+                      "trend_insights", "correlation_insights", "recommendations"]
+        insights = {name: [f"Offline {name.replace('_', ' ')} placeholder ({digest})."] for name in categories}
+        insights["potential_visualizations"] = []
+        return json.dumps(insights)
+
+    return "\n".join([
+        f"1. Offline placeholder response ({digest}), generated without calling an API.",
+        "2. Set DATA_INSIGHTS_FAKE_LLM=0 and configure an API key for real answers."
+    ])
+
+async def _fake_stream(request: LLMRequest) -> AsyncIterator[str]:
+    """The fake provider's response, one word at a time."""
+    for token in re.findall(r"\S+\s*|\s+", await _fake_complete(request)):
+        yield token
+
+# Completion and streaming functions by provider name
+_PROVIDERS: Dict[str, Callable] = {
+    "openai": _openai_complete,
+    "anthropic": _anthropic_complete,
+    "fake": _fake_complete,
+}
+_STREAMERS: Dict[str, Callable] = {
+    "openai": _openai_stream,
+    "anthropic": _anthropic_stream,
+    "fake": _fake_stream,
+}
@@ -0,0 +1,363 @@
+import os
+import multiprocessing
+import threading
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, List, Any, Optional, Tuple
+
+from sketches import ColumnSketch, HyperLogLog, hash_values
+from utils import LRUCache, column_fingerprints
+
+# Number of most frequent values kept per column
+TOP_VALUES_COUNT = 5
+
+# Maximum number of column profiles kept across datasets and sessions
+PROFILE_CACHE_ENTRIES = 4096
+
+# Workers used to profile large datasets, and whether they are threads or processes.
+# Processes pay for spawning and re-importing the app in every worker, which measured
+# slower than serial profiling on million-row frames, so they are opt-in.
+PROFILE_WORKERS = int(os.environ.get("DATA_INSIGHTS_WORKERS", os.cpu_count() or 1))
+PROFILE_EXECUTOR = os.environ.get("DATA_INSIGHTS_EXECUTOR", "thread")
+
+# Datasets with fewer cells than this are always profiled serially
+PARALLEL_MIN_CELLS = 5_000_000
+
+@dataclass
+class ColumnProfile:
+    """Statistics for a single column, computed in one pass over its values."""
+
+    name: str
+    dtype: str
+    kind: str  # 'numeric', 'boolean', 'categorical', 'datetime' or 'other'
+    count: int
+    missing_count: int
+    unique_count: int
+    top_values: Dict[Any, int] = field(default_factory=dict)
+
+    # Numeric and boolean columns
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    std: Optional[float] = None
+    skew: Optional[float] = None
+    q1: Optional[float] = None
+    q3: Optional[float] = None
+    zeros_count: int = 0
+    outlier_count: int = 0
+
+    # Numeric and datetime columns
+    min: Any = None
+    max: Any = None
+
+    # Datetime columns
+    unique_dates: Optional[int] = None
+    weekday_counts: Dict[int, int] = field(default_factory=dict)
+
+    # Approximate profiles: (low, high) interval of each estimated statistic;
+    # 'top_values' maps each value to the interval of its count
+    approximate: bool = False
+    error_bounds: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def is_numeric(self) -> bool:
+        """Whether numeric statistics are available (numeric and boolean columns)."""
+        return self.kind in ('numeric', 'boolean')
+
+    @property
+    def non_null_count(self) -> int:
+        """Number of non-missing values."""
+        return self.count - self.missing_count
+
+    @property
+    def missing_percentage(self) -> float:
+        """Share of missing values, in percent."""
+        return (self.missing_count / self.count) * 100 if self.count > 0 else 0.0
+
+    @property
+    def unique_percentage(self) -> float:
+        """Share of unique values among non-missing values, in percent."""
+        return (self.unique_count / self.non_null_count) * 100 if self.non_null_count > 0 else 0.0
+
+    @property
+    def is_all_unique(self) -> bool:
+        """Whether every row holds a distinct value (within the error bounds for approximate profiles)."""
+        if 'unique_count' in self.error_bounds:
+            low, high = self.error_bounds['unique_count']
+            return low <= self.count <= high
+        return self.unique_count == self.count
+
+def column_kind(series: pd.Series) -> str:
+    """Classify a column as 'numeric', 'boolean', 'categorical', 'datetime' or 'other'."""
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    if pd.api.types.is_object_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return 'categorical'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    return 'other'
+
+def profile_column(series: pd.Series, approximate: bool = False) -> ColumnProfile:
+    """
+    Compute all statistics for a column in a single pass.
+
+    Missing values are dropped once, a single value_counts provides the distinct count
+    and the top values, and numeric statistics are derived from one NumPy array.
+
+    In approximate mode the distinct count, top values and quantiles (the costly parts
+    on very large columns) are estimated with mergeable sketches instead, and each
+    estimate's interval is recorded in `error_bounds`.
+
+    Args:
+        series: Column to profile
+        approximate: Estimate distinct counts, top values and quantiles with sketches
+
+    Returns:
+        ColumnProfile for the column
+    """
+    kind = column_kind(series)
+    non_null = series.dropna()
+
+    sketch = None
+    error_bounds = {}
+    try:
+        if approximate and not non_null.empty:
+            sketch = ColumnSketch.from_series(non_null, quantiles=kind in ('numeric', 'boolean'))
+            unique_count, error_bounds['unique_count'] = sketch.distinct_count()
+            top_values, error_bounds['top_values'] = sketch.top_values(TOP_VALUES_COUNT)
+        else:
+            value_counts = non_null.value_counts()
+            # Categoricals report unused categories with a zero count
+            value_counts = value_counts[value_counts > 0]
+            unique_count = len(value_counts)
+            top_values = value_counts.head(TOP_VALUES_COUNT).to_dict()
+    except TypeError:
+        # Unhashable values (e.g. lists) cannot be counted
+        sketch = None
+        error_bounds = {}
+        unique_count = 0
+        top_values = {}
+
+    profile = ColumnProfile(
+        name=series.name,
+        dtype=str(series.dtype),
+        kind=kind,
+        count=len(series),
+        missing_count=len(series) - len(non_null),
+        unique_count=unique_count,
+        top_values=top_values,
+        approximate=approximate,
+        error_bounds=error_bounds
+    )
+
+    if non_null.empty:
+        return profile
+
+    if profile.is_numeric:
+        _profile_numeric(profile, non_null.to_numpy(), sketch)
+    elif kind == 'datetime':
+        profile.min = non_null.min()
+        profile.max = non_null.max()
+        dates = non_null.dt.normalize()
+        if approximate:
+            distinct = HyperLogLog()
+            distinct.update(hash_values(dates))
+            low, high = distinct.bounds()
+            profile.unique_dates = min(round(distinct.estimate()), len(dates))
+            profile.error_bounds['unique_dates'] = (max(int(low), 1), min(int(np.ceil(high)), len(dates)))
+        else:
+            profile.unique_dates = int(dates.nunique())
+        profile.weekday_counts = non_null.dt.dayofweek.value_counts().sort_index().to_dict()
+
+    return profile
+
+def _profile_numeric(profile: ColumnProfile, values: np.ndarray, sketch: Optional[ColumnSketch] = None) -> None:
+    """Fill in the numeric statistics of a profile from its non-null values (quantiles from the sketch if given)."""
+    profile.min = values.min()
+    profile.max = values.max()
+
+    values = values.astype('float64')
+    n = len(values)
+
+    mean = values.mean()
+    deviations = values - mean
+    m2 = np.mean(deviations ** 2)
+    m3 = np.mean(deviations ** 3)
+
+    profile.mean = float(mean)
+    profile.std = float(np.sqrt(m2 * n / (n - 1))) if n > 1 else float('nan')
+
+    # Adjusted Fisher-Pearson skewness, matching pandas' Series.skew
+    if n < 3:
+        profile.skew = float('nan')
+    elif m2 == 0:
+        profile.skew = 0.0
+    else:
+        profile.skew = float(m3 / m2 ** 1.5 * np.sqrt(n * (n - 1)) / (n - 2))
+
+    if sketch is not None:
+        q1, median, q3 = sketch.quantiles.quantiles([0.25, 0.5, 0.75])
+        bounds = sketch.quantiles.quantile_bounds([0.25, 0.5, 0.75])
+        profile.error_bounds.update(zip(['q1', 'median', 'q3'], bounds))
+    else:
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+    profile.q1, profile.median, profile.q3 = float(q1), float(median), float(q3)
+
+    # Outliers by the IQR method, as in data_processor.detect_outliers (not meaningful for booleans)
+    if profile.kind == 'numeric':
+        profile.outlier_count = _count_outliers(values, q1, q3)
+        if sketch is not None:
+            # The widest and narrowest fences the quantile intervals allow bound the count
+            (q1_low, q1_high), _, (q3_low, q3_high) = bounds
+            profile.error_bounds['outlier_count'] = (_count_outliers(values, q1_low, q3_high),
+                                                     _count_outliers(values, q1_high, q3_low))
+    profile.zeros_count = int((values == 0).sum())
+
+def _count_outliers(values: np.ndarray, q1: float, q3: float) -> int:
+    """Count values outside the 1.5 * IQR fences."""
+    iqr = q3 - q1
+    return int(((values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)).sum())
+
+# Column profiles keyed by (column name, column fingerprint, approximate)
+_profile_cache = LRUCache(max_entries=PROFILE_CACHE_ENTRIES)
+
+def profile_dataset(data: pd.DataFrame,
+                    use_cache: bool = True,
+                    workers: Optional[int] = None,
+                    executor: str = PROFILE_EXECUTOR,
+                    approximate: bool = False,
+                    fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, ColumnProfile]:
+    """
+    Profile every column of a DataFrame.
+
+    Profiles are cached per column content, so a column subset of a profiled dataset
+    (e.g. after the sidebar column filter) reuses the existing profiles, and after a
+    row filter only the columns whose values actually changed are recomputed.
+
+    Args:
+        data: Input DataFrame
+        use_cache: Reuse and store profiles in the shared profile cache
+        workers: Number of parallel workers (defaults to PROFILE_WORKERS for large datasets)
+        executor: 'process' or 'thread' (see profile_columns)
+        approximate: Estimate distinct counts, top values and quantiles with sketches
+        fingerprints: Column fingerprints already computed for this version of the data
+
+    Returns:
+        Dictionary mapping column names to their profiles, in column order
+    """
+    if workers is None:
+        workers = PROFILE_WORKERS if data.size >= PARALLEL_MIN_CELLS else 1
+
+    if not use_cache:
+        return dict(zip(data.columns, profile_columns(data, list(data.columns), workers, executor, approximate)))
+
+    fingerprints = column_fingerprints(data, fingerprints)
+    profiles = {}
+    for col in data.columns:
+        cached = _profile_cache.get((col, fingerprints[col], approximate))
+        if cached is not None:
+            profiles[col] = cached
+
+    # Only columns without a cached profile are computed
+    missing = [col for col in data.columns if col not in profiles]
+    for col, profile in zip(missing, profile_columns(data, missing, workers, executor, approximate)):
+        _profile_cache.put((col, fingerprints[col], approximate), profile)
+        profiles[col] = profile
+
+    return {col: profiles[col] for col in data.columns}
+
+def profile_columns(data: pd.DataFrame,
+                    columns: List[str],
+                    workers: int = 1,
+                    executor: str = PROFILE_EXECUTOR,
+                    approximate: bool = False) -> List[ColumnProfile]:
+    """
+    Profile a list of columns, optionally in parallel.
+
+    With executor='thread' columns are profiled in a thread pool, which helps where
+    NumPy releases the GIL. With executor='process' columns are partitioned across a
+    long-lived process pool; fixed-width columns are shipped through shared memory rather than
+    pickled, and only text and other object columns are pickled per column.
+
+    Args:
+        data: Input DataFrame
+        columns: Columns to profile
+        workers: Number of parallel workers (1 profiles serially)
+        executor: 'process' or 'thread'
+        approximate: Estimate distinct counts, top values and quantiles with sketches
+
+    Returns:
+        Profiles in the same order as `columns`
+    """
+    workers = min(workers, len(columns))
+    if workers <= 1:
+        return [profile_column(data[col], approximate) for col in columns]
+
+    # Contiguous blocks of columns per worker
+    chunksize = -(-len(columns) // workers)
+
+    if executor == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(profile_column, [data[col] for col in columns],
+                                 [approximate] * len(columns), chunksize=chunksize))
+
+    if executor != 'process':
+        raise ValueError(f"Unknown executor: {executor}")
+
+    blocks = []
+    try:
+        tasks = []
+        for col in columns:
+            series = data[col]
+            if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+                block = shared_memory.SharedMemory(create=True, size=max(series.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(len(series), dtype=series.dtype, buffer=block.buf)[:] = series.to_numpy()
+                tasks.append(('shared', approximate, block.name, series.dtype.str, len(series), col))
+            else:
+                tasks.append(('series', approximate, series))
+
+        # The shared pool keeps PROFILE_WORKERS processes; the chunk size spreads tasks over `workers` of them
+        return list(_process_pool().map(_profile_task, tasks, chunksize=chunksize))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+# Long-lived worker processes shared by all sessions, so reruns do not spawn a new pool
+_pool = None
+_pool_lock = threading.Lock()
+
+def _process_pool() -> ProcessPoolExecutor:
+    """Return the shared pool of PROFILE_WORKERS processes, replacing it only if it broke."""
+    global _pool
+    with _pool_lock:
+        # A broken pool rejects every task, so no running map can still be using it
+        if _pool is None or getattr(_pool, '_broken', False):
+            # Spawned workers avoid forking the multi-threaded Streamlit server
+            _pool = ProcessPoolExecutor(max_workers=max(PROFILE_WORKERS, 1),
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _profile_task(task: Tuple) -> ColumnProfile:
+    """Profile one column in a worker process, attaching to shared memory when possible."""
+    if task[0] == 'series':
+        return profile_column(task[2], task[1])
+
+    _, approximate, block_name, dtype, length, name = task
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        values = np.ndarray(length, dtype=np.dtype(dtype), buffer=block.buf)
+        profile = profile_column(pd.Series(values, name=name, copy=False), approximate)
+        del values
+        return profile
+    finally:
+        block.close()
+
+def profiles_of_kind(profiles: Dict[str, ColumnProfile], kind: str) -> List[ColumnProfile]:
+    """Return the profiles of a given kind, in column order."""
+    return [profile for profile in profiles.values() if profile.kind == kind]
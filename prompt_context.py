@@ -0,0 +1,324 @@
+"""
+Token-budgeted dataset context for LLM prompts.
+
+Columns are ranked by their relevance to the question (or, without one, by how much
+there is to say about them), their statistics are written as compact one-line JSON with
+abbreviated keys, and columns are added until a token budget is reached. Token counts
+are estimated locally with a regular expression that approximates BPE tokenizers.
+
+The data summary the context is written from is built once per dataset version and
+shared by the chat and the AI insights.
+"""
+
+import os
+import re
+import json
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from correlation import correlation_matrix
+from data_processor import extract_correlated_pairs
+from profiler import ColumnProfile, profile_dataset
+from utils import LRUCache, dataset_fingerprint
+
+# Tokens of dataset context included in a prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get("DATA_INSIGHTS_PROMPT_TOKENS", 3000))
+
+# Sample rows and the widest sample included, and the longest sample cell
+PROMPT_SAMPLE_ROWS = 5
+PROMPT_SAMPLE_COLUMNS = 12
+PROMPT_CELL_CHARS = 40
+
+# Abbreviated names of the statistics sent to the model
+STAT_ABBREVIATIONS = {
+    "min": "min", "max": "max", "mean": "mean", "median": "med", "std": "std", "skew": "skew",
+    "unique_count": "uniq", "unique_values": "uniq", "unique_percentage": "uniq%",
+    "zeros_count": "zeros", "zeros_percentage": "zeros%", "missing_count": "miss",
+    "missing_percentage": "miss%", "missing": "miss", "top_values": "top", "most_common": "top",
+    "range_days": "days", "unique_dates": "dates", "weekday_distribution": "weekdays"
+}
+
+# Maximum number of correlated pairs kept in a data summary
+MAX_PROMPT_CORRELATIONS = 50
+
+# Data summaries kept across chat turns, insight requests and sessions
+SUMMARY_CACHE_ENTRIES = 8
+
+# Roughly one token per short word piece or punctuation mark
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+@dataclass
+class PromptContext:
+    """Dataset context for a prompt and what it covers."""
+    text: str
+    tokens: int
+    columns: List[str] = field(default_factory=list)
+    total_columns: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        """Whether columns were left out to stay within the budget."""
+        return len(self.columns) < self.total_columns
+
+# Data summaries keyed by (dataset fingerprint, approximate profiles)
+_summary_cache = LRUCache(max_entries=SUMMARY_CACHE_ENTRIES)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without a tokenizer.
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Approximate token count
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+def summarize_dataset(data: pd.DataFrame, profiles: Optional[Dict[str, ColumnProfile]] = None,
+                      fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Summarize the DataFrame structure for the prompts of the chat and the AI insights.
+
+    The summary is memoized per dataset version and shared by both, across requests
+    and sessions. The returned dictionary is shared and must not be modified.
+
+    Args:
+        data: Input DataFrame
+        profiles: Optional column profiles (computed if not given)
+        fingerprints: Optional column fingerprints already computed for this version of the data
+
+    Returns:
+        Data summary with 'rows', 'columns', 'column_types', 'column_stats',
+        'missing_values', 'missing_percentage' and 'correlations'
+    """
+    approximate = profiles is not None and any(profile.approximate for profile in profiles.values())
+    key = (dataset_fingerprint(data, fingerprints), approximate)
+    info = _summary_cache.get(key)
+    if info is None:
+        info = _summarize_data(data, profiles, fingerprints)
+        _summary_cache.put(key, info)
+    return info
+
+def rank_columns(data_info: Dict[str, Any], query: Optional[str] = None) -> List[str]:
+    """
+    Order columns by relevance to a question.
+
+    Columns named in the question come first, then columns sharing words with it. Ties
+    (and every column when there is no question) are ordered by how notable they are:
+    involvement in correlations, then missing values, then dataset order.
+
+    Args:
+        data_info: Data summary with 'columns' and optionally 'correlations' and 'missing_percentage'
+        query: Optional user question
+
+    Returns:
+        Column names, most relevant first
+    """
+    columns = data_info["columns"]
+    query_text = (query or "").lower()
+    query_words = set(re.findall(r"[a-z0-9]+", query_text))
+
+    correlated = {}
+    for corr in data_info.get("correlations", []):
+        for col in (corr["col1"], corr["col2"]):
+            correlated[col] = correlated.get(col, 0) + abs(corr["correlation"])
+    missing = data_info.get("missing_percentage", {})
+
+    def score(position_col):
+        position, col = position_col
+        name = str(col).lower()
+        name_words = set(re.findall(r"[a-z0-9]+", name))
+        mentioned = bool(query_text) and re.search(rf"(?<!\w){re.escape(name)}(?!\w)", query_text) is not None
+        overlap = len(name_words & query_words) / len(name_words) if name_words else 0
+        return (-mentioned, -overlap, -correlated.get(col, 0), -(missing.get(col) or 0), position)
+
+    return [col for _, col in sorted(enumerate(columns), key=score)]
+
+def build_context(data_info: Dict[str, Any], data: pd.DataFrame, query: Optional[str] = None,
+                  budget: Optional[int] = None) -> PromptContext:
+    """
+    Write the dataset summary for a prompt within a token budget.
+
+    Args:
+        data_info: Data summary with 'rows', 'columns', 'column_types', 'column_stats' and
+            optionally 'missing_percentage' and 'correlations'
+        data: The DataFrame, for sample rows
+        query: Optional user question used to rank the columns
+        budget: Token budget (defaults to PROMPT_TOKEN_BUDGET)
+
+    Returns:
+        PromptContext with the text and its estimated size
+    """
+    if budget is None:
+        budget = PROMPT_TOKEN_BUDGET
+
+    columns = rank_columns(data_info, query)
+    header = f"Dataset: {data_info['rows']} rows, {len(columns)} columns."
+    lines = [header, "Columns (name|type|stats), most relevant first:"]
+    used = estimate_tokens("\n".join(lines))
+
+    # Sample rows of the top columns are reserved up front, unless they take over a quarter of the budget
+    sample = _sample_rows(data, columns[:PROMPT_SAMPLE_COLUMNS])
+    sample_tokens = estimate_tokens(sample)
+    if sample_tokens > budget // 4:
+        sample, sample_tokens = "", 0
+
+    included = []
+    for col in columns:
+        line = _column_line(col, data_info)
+        tokens = estimate_tokens(line)
+        if used + tokens + sample_tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+        included.append(col)
+
+    if len(included) < len(columns):
+        omitted = columns[len(included):]
+        names = ", ".join(str(col) for col in omitted)
+        note = f"{len(omitted)} more columns omitted: {names}"
+        # Drop trailing names until the note fits
+        while estimate_tokens(note) > max(budget - used - sample_tokens, 0) and names:
+            names = names.rsplit(", ", 1)[0] if ", " in names else ""
+            note = f"{len(omitted)} more columns omitted: {names}, ..." if names else f"{len(omitted)} more columns omitted."
+        lines.append(note)
+        used += estimate_tokens(note)
+
+    included_set = set(included)
+    correlations = [
+        f"{corr['col1']}~{corr['col2']}:{corr['correlation']}"
+        for corr in data_info.get("correlations", [])
+        if corr["col1"] in included_set and corr["col2"] in included_set
+    ]
+    if correlations:
+        section = "Correlations (|r|>0.5): " + ", ".join(correlations)
+        while estimate_tokens(section) > budget - used - sample_tokens and correlations:
+            correlations = correlations[:len(correlations) // 2]
+            section = "Correlations (|r|>0.5): " + ", ".join(correlations)
+        if correlations:
+            lines.append(section)
+            used += estimate_tokens(section)
+
+    if sample:
+        lines.append("Sample rows (CSV):\n" + sample)
+
+    text = "\n".join(lines)
+    return PromptContext(text=text, tokens=estimate_tokens(text), columns=included, total_columns=len(columns))
+
+def _column_line(col: str, data_info: Dict[str, Any]) -> str:
+    """One line describing a column: name, dtype and abbreviated statistics."""
+    stats = dict(data_info.get("column_stats", {}).get(col, {}))
+    missing = data_info.get("missing_percentage", {}).get(col)
+    if missing and "missing_percentage" not in stats:
+        stats["missing_percentage"] = missing
+
+    # Columns without missing values need no missing-value stats
+    for name in ("missing_count", "missing_percentage", "missing"):
+        if stats.get(name) == 0:
+            stats.pop(name)
+
+    compact = {STAT_ABBREVIATIONS.get(name, name): _compact_value(value) for name, value in stats.items()
+               if value is not None}
+    return f"{col}|{data_info['column_types'].get(col, '')}|{json.dumps(compact, separators=(',', ':'), default=str)}"
+
+def _compact_value(value: Any) -> Any:
+    """Round numbers to four significant digits, recursively."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        return float(f"{value:.4g}")
+    if isinstance(value, dict):
+        return {str(key): _compact_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact_value(item) for item in value]
+    return value
+
+def _sample_rows(data: pd.DataFrame, columns: List[str]) -> str:
+    """First rows of the given columns as CSV, with long cells shortened."""
+    if not columns or data.empty:
+        return ""
+    sample = data[columns].head(PROMPT_SAMPLE_ROWS).astype(str)
+    sample = sample.apply(lambda col: col.str.slice(0, PROMPT_CELL_CHARS))
+    return sample.to_csv(index=False).strip()
+
+def _summarize_data(data: pd.DataFrame, profiles: Optional[Dict[str, ColumnProfile]] = None,
+                    fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Compute the data summary memoized by summarize_dataset."""
+    if profiles is None:
+        profiles = profile_dataset(data, fingerprints=fingerprints)
+
+    # Basic DataFrame info
+    info = {
+        "rows": len(data),
+        "columns": list(data.columns),
+        "column_types": {col: str(dtype) for col, dtype in data.dtypes.items()},
+        "column_stats": {},
+        "missing_values": {col: profile.missing_count for col, profile in profiles.items()},
+        "missing_percentage": {col: profile.missing_percentage for col, profile in profiles.items()}
+    }
+
+    # Generate stats for each column
+    for col in data.columns:
+        profile = profiles[col]
+
+        if profile.non_null_count == 0:
+            continue
+
+        # Generate stats for numeric columns
+        if profile.is_numeric:
+            info["column_stats"][col] = {
+                "min": float(profile.min),
+                "max": float(profile.max),
+                "mean": profile.mean,
+                "median": profile.median,
+                "std": profile.std,
+                "skew": profile.skew if profile.non_null_count > 2 else 0,
+                "unique_count": profile.unique_count,
+                "zeros_count": profile.zeros_count,
+                "zeros_percentage": (profile.zeros_count / profile.non_null_count) * 100
+            }
+
+        # Generate stats for categorical columns
+        elif profile.kind == 'categorical':
+            info["column_stats"][col] = {
+                "unique_count": profile.unique_count,
+                "top_values": {str(k): int(v) for k, v in profile.top_values.items()},
+                "unique_percentage": profile.unique_percentage
+            }
+
+        # Generate stats for datetime columns
+        elif profile.kind == 'datetime':
+            info["column_stats"][col] = {
+                "min": str(profile.min),
+                "max": str(profile.max),
+                "range_days": int((profile.max - profile.min).days),
+                "unique_dates": profile.unique_dates,
+                "weekday_distribution": profile.weekday_counts,
+                "unique_percentage": profile.unique_percentage
+            }
+
+    # Calculate correlations for numeric columns
+    numeric_cols = data.select_dtypes(include=['number']).columns.tolist()
+    if len(numeric_cols) > 1:
+        try:
+            corr_matrix = correlation_matrix(data, numeric_cols, fingerprints=fingerprints).round(2)
+            # Filter to significant correlations (absolute value > 0.5), strongest first
+            significant_corrs = [
+                {
+                    "col1": col1,
+                    "col2": col2,
+                    "correlation": corr_val,
+                    "correlation_type": "positive" if corr_val > 0 else "negative"
+                }
+                for col1, col2, corr_val in extract_correlated_pairs(corr_matrix, 0.5, top_n=MAX_PROMPT_CORRELATIONS)
+            ]
+
+            info["correlations"] = significant_corrs
+        except Exception:
+            info["correlations"] = []
+    else:
+        info["correlations"] = []
+
+    return info
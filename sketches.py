@@ -0,0 +1,347 @@
+"""
+Mergeable sketches for approximate column statistics on very large tables.
+
+Every sketch is updated in batches with vectorized NumPy operations, uses memory
+independent of the number of rows, and can be merged with another sketch of the
+same kind (e.g. one built per partition). Each estimate comes with its error bound.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rows fed to the sketches at a time, bounding the temporary memory per column
+SKETCH_BATCH_ROWS = 1_000_000
+
+# KLL compactor size; the rank error shrinks roughly as 1/k
+KLL_K = 200
+
+# HyperLogLog uses 2**precision one-byte registers
+HLL_PRECISION = 14
+
+# z-score of the distinct-count interval (~95%)
+HLL_INTERVAL_Z = 2.0
+
+# Count-Min table shape; width must be a power of two
+COUNT_MIN_WIDTH = 2048
+COUNT_MIN_DEPTH = 4
+
+# Candidate values tracked for the top-k, and rows per batch sampled to discover them
+FREQUENT_ITEMS_CAPACITY = 64
+CANDIDATE_SAMPLE_ROWS = 10_000
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """Return 64-bit hashes of a Series' values (stable across batches of the same dtype)."""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+class KLLSketch:
+    """
+    KLL quantile sketch.
+
+    Items live in a hierarchy of compactors where level h holds items of weight 2**h.
+    When a level exceeds its capacity it is sorted and every other item (from a random
+    offset) is promoted to the next level, so memory stays O(k log(n / k)).
+    """
+
+    def __init__(self, k: int = KLL_K, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self) -> float:
+        """Normalized rank error of a single quantile query (99% confidence)."""
+        # Empirical fit published with the Apache DataSketches KLL implementation
+        return 2.296 / self.k ** 0.9723
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a batch of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch') -> None:
+        """Merge another KLL sketch into this one."""
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantiles(self, qs: List[float]) -> np.ndarray:
+        """Estimate the values at the given quantiles (0 to 1)."""
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level, dtype='int64')
+                                  for level, level_items in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        values = items[np.clip(positions, 0, len(items) - 1)]
+
+        # The extremes are tracked exactly
+        values = np.where(np.asarray(qs) <= 0, self.min, values)
+        return np.where(np.asarray(qs) >= 1, self.max, values)
+
+    def quantile_bounds(self, qs: List[float]) -> List[Tuple[float, float]]:
+        """Return a (low, high) value interval for each quantile, from the rank error."""
+        qs = np.asarray(qs)
+        low = self.quantiles(np.clip(qs - self.rank_error, 0, 1))
+        high = self.quantiles(np.clip(qs + self.rank_error, 0, 1))
+        return [(float(lo), float(hi)) for lo, hi in zip(low, high)]
+
+    def _capacity(self, level: int) -> int:
+        """Capacity of a compactor; lower levels get geometrically smaller compactors."""
+        depth = len(self._levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        """Compact every level that is over capacity, from the bottom up."""
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+
+                # An odd item out stays at this level
+                items = np.sort(items)
+                odd = len(items) % 2
+                self._levels[level] = items[:odd]
+                promoted = items[odd + self._rng.integers(2)::2]
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+            level += 1
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of the estimate."""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, hashes: np.ndarray) -> None:
+        """Add a batch of hashed values."""
+        if len(hashes) == 0:
+            return
+
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+
+        # Position of the leftmost 1-bit in the remaining bits (exact, since they fit in a float64 mantissa)
+        _, bit_length = np.frexp(rest.astype('float64'))
+        rank = (64 - p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        """Merge another HyperLogLog of the same precision into this one."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        """Estimate the number of distinct values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+
+        # Linear counting is more accurate while many registers are still empty
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros > 0:
+            return m * np.log(m / zeros)
+        return raw
+
+    def bounds(self) -> Tuple[float, float]:
+        """Return a (low, high) interval for the distinct count (~95%)."""
+        estimate = self.estimate()
+        margin = HLL_INTERVAL_Z * self.relative_error * estimate
+        return max(estimate - margin, 0.0), estimate + margin
+
+class CountMinSketch:
+    """
+    Count-Min frequency sketch over 64-bit hashes.
+
+    The pandas hashes are already well mixed, so each row takes its bucket from its own
+    slice of bits of the hash instead of rehashing.
+    """
+
+    def __init__(self, width: int = COUNT_MIN_WIDTH, depth: int = COUNT_MIN_DEPTH):
+        self.width = width
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype='int64')
+        self._bits = int(np.log2(width))
+        if self._bits * depth > 64:
+            raise ValueError("Count-Min width and depth need more than 64 hash bits")
+
+    @property
+    def epsilon(self) -> float:
+        """Overestimate bound as a fraction of the total count (holds with probability 1 - e**-depth)."""
+        return np.e / self.width
+
+    def update(self, hashes: np.ndarray) -> None:
+        """Add one occurrence of each hashed value."""
+        for row in range(len(self.table)):
+            self.table[row] += np.bincount(self._buckets(hashes, row), minlength=self.width)
+        self.total += len(hashes)
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        """Merge another Count-Min sketch of the same shape."""
+        self.table += other.table
+        self.total += other.total
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimate the counts of hashed values (never an underestimate)."""
+        return np.min([self.table[row][self._buckets(hashes, row)] for row in range(len(self.table))], axis=0)
+
+    def _buckets(self, hashes: np.ndarray, row: int) -> np.ndarray:
+        """Bucket of each hash in one row of the table."""
+        return ((hashes >> np.uint64(row * self._bits)) & np.uint64(self.width - 1)).astype(np.intp)
+
+class FrequentItems:
+    """
+    Approximate top-k values.
+
+    Counts come from a Count-Min sketch; candidate values are discovered from a uniform
+    sample of each batch, in which any value frequent enough to rank is very likely to
+    appear, and only the `capacity` candidates with the highest counts are kept.
+    """
+
+    def __init__(self, capacity: int = FREQUENT_ITEMS_CAPACITY, seed: Optional[int] = None):
+        self.capacity = capacity
+        self.counts = CountMinSketch()
+        self.candidates: Dict[int, Any] = {}
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: pd.Series, hashes: np.ndarray) -> None:
+        """Add a batch of values along with their hashes."""
+        if len(hashes) == 0:
+            return
+        self.counts.update(hashes)
+
+        if len(hashes) > CANDIDATE_SAMPLE_ROWS:
+            positions = self._rng.integers(0, len(hashes), CANDIDATE_SAMPLE_ROWS)
+        else:
+            positions = np.arange(len(hashes))
+        sampled, first, sample_counts = np.unique(hashes[positions], return_index=True, return_counts=True)
+        top = np.argsort(-sample_counts, kind='stable')[:self.capacity]
+        for value_hash, position in zip(sampled[top], positions[first[top]]):
+            self.candidates.setdefault(int(value_hash), values.iloc[position])
+
+        self._prune()
+
+    def merge(self, other: 'FrequentItems') -> None:
+        """Merge another FrequentItems sketch into this one."""
+        self.counts.merge(other.counts)
+        for value_hash, value in other.candidates.items():
+            self.candidates.setdefault(value_hash, value)
+        self._prune()
+
+    def top(self, n: int) -> List[Tuple[Any, int, Tuple[int, int]]]:
+        """Return up to n (value, estimated count, (low, high) count interval) tuples, most frequent first."""
+        if not self.candidates:
+            return []
+
+        hashes = np.fromiter(self.candidates.keys(), dtype=np.uint64, count=len(self.candidates))
+        estimates = self.counts.estimate(hashes)
+        error = int(np.ceil(self.counts.epsilon * self.counts.total))
+
+        result = []
+        for i in np.argsort(-estimates, kind='stable')[:n]:
+            estimate = int(estimates[i])
+            result.append((self.candidates[int(hashes[i])], estimate, (max(estimate - error, 0), estimate)))
+        return result
+
+    def _prune(self) -> None:
+        """Keep only the candidates with the highest estimated counts."""
+        if len(self.candidates) <= self.capacity:
+            return
+        hashes = np.fromiter(self.candidates.keys(), dtype=np.uint64, count=len(self.candidates))
+        keep = hashes[np.argsort(-self.counts.estimate(hashes), kind='stable')[:self.capacity]]
+        self.candidates = {int(value_hash): self.candidates[int(value_hash)] for value_hash in keep}
+
+class ColumnSketch:
+    """Distinct count, top values and (optionally) quantiles of one column, built in batches."""
+
+    def __init__(self, quantiles: bool = False, seed: int = 0):
+        self.count = 0
+        self.distinct = HyperLogLog()
+        self.frequent = FrequentItems(seed=seed)
+        self.quantiles = KLLSketch(seed=seed) if quantiles else None
+
+    @classmethod
+    def from_series(cls, series: pd.Series, quantiles: bool = False,
+                    batch_rows: int = SKETCH_BATCH_ROWS, seed: int = 0) -> 'ColumnSketch':
+        """
+        Sketch the non-missing values of a Series.
+
+        Args:
+            series: Column to sketch
+            quantiles: Also build a quantile sketch (numeric columns only)
+            batch_rows: Rows processed per batch
+            seed: Random seed for reproducible estimates
+
+        Returns:
+            ColumnSketch of the column
+        """
+        sketch = cls(quantiles=quantiles, seed=seed)
+        for start in range(0, len(series), batch_rows):
+            sketch.update(series.iloc[start:start + batch_rows].dropna())
+        return sketch
+
+    def update(self, values: pd.Series) -> None:
+        """Add a batch of non-missing values."""
+        hashes = hash_values(values)
+        self.count += len(values)
+        self.distinct.update(hashes)
+        self.frequent.update(values, hashes)
+        if self.quantiles is not None:
+            self.quantiles.update(values.to_numpy(dtype='float64'))
+
+    def merge(self, other: 'ColumnSketch') -> None:
+        """Merge the sketch of another partition of the same column."""
+        self.count += other.count
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+        if self.quantiles is not None and other.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+
+    def distinct_count(self) -> Tuple[int, Tuple[int, int]]:
+        """Return the estimated distinct count and its (low, high) interval, clamped to the value count."""
+        limit = self.count
+        floor = min(1, limit)
+        low, high = self.distinct.bounds()
+        estimate = int(np.clip(round(self.distinct.estimate()), floor, limit))
+        return estimate, (int(np.clip(np.floor(low), floor, limit)), int(np.clip(np.ceil(high), floor, limit)))
+
+    def top_values(self, n: int) -> Tuple[Dict[Any, int], Dict[Any, Tuple[int, int]]]:
+        """Return the top n values with estimated counts, and the (low, high) interval of each count."""
+        top = self.frequent.top(n)
+        return {value: count for value, count, _ in top}, {value: bounds for value, _, bounds in top}
+
+def sketch_quantiles(values: pd.Series, batch_rows: int = SKETCH_BATCH_ROWS, seed: int = 0) -> KLLSketch:
+    """Build a KLL quantile sketch of a numeric Series in batches."""
+    sketch = KLLSketch(seed=seed)
+    for start in range(0, len(values), batch_rows):
+        sketch.update(values.iloc[start:start + batch_rows].to_numpy(dtype='float64', na_value=np.nan))
+    return sketch
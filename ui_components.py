@@ -2,11 +2,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from typing import List, Dict, Any, Union, Optional
+from typing import List, Dict, Any, Union, Optional, Callable, Tuple
 import base64
 from PIL import Image
 import io
 
+from correlation import correlation_matrix
+from utils import column_fingerprints, dataset_fingerprint
+from visualization import aggregated_bar_figure, box_figure, encode_figure, figure_payload_bytes, line_figure, scatter_figure
+
 class DataVizUI:
     """A modern UI component library for data visualization and dashboard creation in Streamlit."""
     
@@ -973,7 +977,7 @@ class DataWidgets:
                 st.warning("No numeric columns found in the dataset")
                 return []
         elif categorical_only:
-            available_cols = data.select_dtypes(include=['object']).columns.tolist()
+            available_cols = data.select_dtypes(include=['object', 'category']).columns.tolist()
             if not available_cols:
                 st.warning("No categorical columns found in the dataset")
                 return []
@@ -1122,16 +1126,19 @@ class DataWidgets:
 class ChartBuilder:
     """Interactive chart builder for creating visualizations."""
     
-    def __init__(self, data: pd.DataFrame):
+    def __init__(self, data: pd.DataFrame, fingerprints: Optional[Dict[str, str]] = None):
         """
         Initialize the chart builder with a DataFrame.
         
         Args:
             data: Pandas DataFrame
+            fingerprints: Optional column fingerprints already computed for this version of the data
         """
         self.data = data
+        # Hashed once per builder; every chart and cache key below reuses them
+        self.fingerprints = column_fingerprints(data, fingerprints)
         self.numeric_columns = data.select_dtypes(include=['number']).columns.tolist()
-        self.categorical_columns = data.select_dtypes(include=['object']).columns.tolist()
+        self.categorical_columns = data.select_dtypes(include=['object', 'category']).columns.tolist()
         self.datetime_columns = data.select_dtypes(include=['datetime']).columns.tolist()
         self.all_columns = data.columns.tolist()
     
@@ -1195,18 +1202,52 @@ class ChartBuilder:
                 with col2:
                     width = st.slider("Width", 400, 1200, 700, 50, key=f"{key_prefix}_width")
                 
-                # Apply settings
-                fig.update_layout(
-                    title=title,
-                    height=height,
-                    width=width,
-                    template="plotly_white"
-                )
+                # Apply only the settings that changed since the figure was last shown
+                self._update_layout(key_prefix, fig, {
+                    'title': title,
+                    'height': height,
+                    'width': width,
+                    'template': "plotly_white"
+                })
             
             return fig
         
         return None
     
+    def _traces(self, key_prefix: str, inputs: Tuple, create: Callable[[], go.Figure]) -> go.Figure:
+        """
+        Return the chart for the given data-affecting inputs, rebuilding its traces only when they change.
+        
+        Args:
+            key_prefix: Prefix for component keys
+            inputs: Chart type and the widget values that affect the traces
+            create: Function building the figure
+            
+        Returns:
+            Plotly figure object, kept in the session state across reruns
+        """
+        state_key = f"{key_prefix}_figure_state"
+        signature = (dataset_fingerprint(self.data, self.fingerprints),) + tuple(inputs)
+        
+        state = st.session_state.get(state_key)
+        if state is None or state['signature'] != signature:
+            # Cached builders already recorded the payload size; other figures are measured once here
+            fig = create()
+            state = {'signature': signature, 'figure': encode_figure(fig, measure=figure_payload_bytes(fig) is None), 'layout': {}}
+            st.session_state[state_key] = state
+        
+        return state['figure']
+    
+    def _update_layout(self, key_prefix: str, fig: go.Figure, settings: Dict[str, Any]) -> None:
+        """Apply the layout settings that differ from those already applied to the cached figure."""
+        state = st.session_state.get(f"{key_prefix}_figure_state")
+        applied = state['layout'] if state is not None and state['figure'] is fig else {}
+        
+        changes = {name: value for name, value in settings.items() if name not in applied or applied[name] != value}
+        if changes:
+            fig.update_layout(**changes)
+            applied.update(changes)
+    
     def _create_bar_chart(self, key_prefix: str):
         """Create a bar chart configuration."""
         st.markdown("#### Bar Chart Settings")
@@ -1230,26 +1271,29 @@ class ChartBuilder:
         )
         color_col = None if color_col == "None" else color_col
         
-        # Create the chart
-        if y_selection == "Count":
-            # Count-based bar chart
-            fig = px.bar(
+        # Create the chart from per-category aggregates
+        def create():
+            if y_selection == "Count":
+                # Count-based bar chart
+                return aggregated_bar_figure(
+                    self.data,
+                    x_col,
+                    color_column=color_col,
+                    title=f"Count by {x_col}",
+                    fingerprints=self.fingerprints
+                )
+            
+            # Value-based bar chart (bars stack to the per-category sum)
+            return aggregated_bar_figure(
                 self.data,
-                x=x_col,
-                color=color_col,
-                title=f"Count by {x_col}"
-            )
-        else:
-            # Value-based bar chart
-            fig = px.bar(
-                self.data,
-                x=x_col,
-                y=y_selection,
-                color=color_col,
-                title=f"{y_selection} by {x_col}"
+                x_col,
+                y_selection,
+                color_col,
+                title=f"{y_selection} by {x_col}",
+                fingerprints=self.fingerprints
             )
         
-        return fig
+        return self._traces(key_prefix, ("bar", x_col, y_selection, color_col), create)
     
     def _create_line_chart(self, key_prefix: str):
         """Create a line chart configuration."""
@@ -1278,16 +1322,15 @@ class ChartBuilder:
         )
         color_col = None if color_col == "None" else color_col
         
-        # Create the chart
-        fig = px.line(
+        # Create the chart (downsampled for large datasets)
+        return self._traces(key_prefix, ("line", x_col, y_col, color_col), lambda: line_figure(
             self.data,
-            x=x_col,
-            y=y_col,
-            color=color_col,
-            title=f"{y_col} vs {x_col}"
-        )
-        
-        return fig
+            x_col,
+            y_col,
+            color_col,
+            title=f"{y_col} vs {x_col}",
+            fingerprints=self.fingerprints
+        ))
     
     def _create_scatter_chart(self, key_prefix: str):
         """Create a scatter plot configuration."""
@@ -1322,17 +1365,16 @@ class ChartBuilder:
             )
             size_col = None if size_col == "None" else size_col
         
-        # Create the chart
-        fig = px.scatter(
+        # Create the chart (a binned density for large datasets)
+        return self._traces(key_prefix, ("scatter", x_col, y_col, color_col, size_col), lambda: scatter_figure(
             self.data,
-            x=x_col,
-            y=y_col,
-            color=color_col,
-            size=size_col,
-            title=f"{y_col} vs {x_col}"
-        )
-        
-        return fig
+            x_col,
+            y_col,
+            color_col,
+            size_col,
+            title=f"{y_col} vs {x_col}",
+            fingerprints=self.fingerprints
+        ))
     
     def _create_histogram(self, key_prefix: str):
         """Create a histogram configuration."""
@@ -1355,15 +1397,13 @@ class ChartBuilder:
             color_col = None if color_col == "None" else color_col
         
         # Create the chart
-        fig = px.histogram(
+        return self._traces(key_prefix, ("histogram", col, bins, color_col), lambda: px.histogram(
             self.data,
             x=col,
             color=color_col,
             nbins=bins,
             title=f"Distribution of {col}"
-        )
-        
-        return fig
+        ))
     
     def _create_box_plot(self, key_prefix: str):
         """Create a box plot configuration."""
@@ -1391,16 +1431,15 @@ class ChartBuilder:
         )
         color_col = None if color_col == "None" else color_col
         
-        # Create the chart
-        fig = px.box(
+        # Create the chart from precomputed box statistics
+        return self._traces(key_prefix, ("box", x_col, y_col, color_col), lambda: box_figure(
             self.data,
-            y=y_col,
-            x=x_col,
-            color=color_col,
-            title=f"Distribution of {y_col}" + (f" by {x_col}" if x_col else "")
-        )
-        
-        return fig
+            x_col,
+            y_col,
+            color_col,
+            title=f"Distribution of {y_col}" + (f" by {x_col}" if x_col else ""),
+            fingerprints=self.fingerprints
+        ))
     
     def _create_heatmap(self, key_prefix: str):
         """Create a heatmap configuration."""
@@ -1430,17 +1469,14 @@ class ChartBuilder:
                 st.warning("Please select at least two columns")
                 return None
             
-            # Calculate correlation matrix
-            corr_matrix = self.data[corr_columns].corr()
-            
-            # Create the heatmap
-            fig = px.imshow(
-                corr_matrix,
+            # Create the heatmap of the correlation matrix
+            fig = self._traces(key_prefix, ("correlation", tuple(corr_columns)), lambda: px.imshow(
+                correlation_matrix(self.data, corr_columns, fingerprints=self.fingerprints),
                 text_auto='.2f',
                 aspect="auto",
                 color_continuous_scale="RdBu_r",
                 title="Correlation Matrix"
-            )
+            ))
             
         else:  # Two-Column Heatmap
             if not self.categorical_columns:
@@ -1458,12 +1494,12 @@ class ChartBuilder:
             y_col = st.selectbox("Y-axis", y_options, key=f"{key_prefix}_heatmap_y")
             
             # Create the heatmap
-            fig = px.density_heatmap(
+            fig = self._traces(key_prefix, ("density_heatmap", x_col, y_col), lambda: px.density_heatmap(
                 self.data,
                 x=x_col,
                 y=y_col,
                 title=f"Heatmap of {y_col} vs {x_col}"
-            )
+            ))
         
         return fig
     
@@ -1486,27 +1522,30 @@ class ChartBuilder:
             key=f"{key_prefix}_pie_values"
         )
         
-        if values_selection == "Count":
-            # Count occurrences of each category
-            value_counts = self.data[names_col].value_counts().reset_index()
-            value_counts.columns = [names_col, 'count']
+        def create():
+            if values_selection == "Count":
+                # Count occurrences of each category
+                value_counts = self.data[names_col].value_counts().reset_index()
+                value_counts.columns = [names_col, 'count']
+                
+                return px.pie(
+                    value_counts,
+                    names=names_col,
+                    values='count',
+                    title=f"Distribution of {names_col}"
+                )
             
-            fig = px.pie(
-                value_counts,
-                names=names_col,
-                values='count',
-                title=f"Distribution of {names_col}"
-            )
-        else:
             # Use the selected numeric column
-            fig = px.pie(
+            return px.pie(
                 self.data,
                 names=names_col,
                 values=values_selection,
                 title=f"Distribution of {values_selection} by {names_col}"
             )
         
-        # Additional options
+        fig = self._traces(key_prefix, ("pie", names_col, values_selection), create)
+        
+        # Additional options (a style change applied to the cached traces)
         hole = st.slider("Donut hole size", 0.0, 0.8, 0.0, 0.1, key=f"{key_prefix}_pie_hole")
         fig.update_traces(hole=hole)
         
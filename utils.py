@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Callable, Hashable, IO
 
 def get_file_extension(filename: str) -> str:
     """
@@ -52,6 +55,22 @@ def show_warning(message: str) -> None:
     """
     st.warning(message)
 
+def show_chart(fig: Any, container: Any = None) -> None:
+    """
+    Display a Plotly chart with the size of its serialized payload, when recorded.
+    
+    Args:
+        fig: Plotly figure object
+        container: Optional Streamlit container to render into (defaults to the page)
+    """
+    target = container if container is not None else st
+    target.plotly_chart(fig, use_container_width=True)
+    
+    meta = fig.layout.meta
+    payload_bytes = meta.get('payload_bytes') if isinstance(meta, dict) else None
+    if payload_bytes is not None:
+        target.caption(f"Chart payload: {payload_bytes / 1024:,.1f} KB")
+
 def format_number(number: float, decimals: int = 2) -> str:
     """
     Format a number for display.
@@ -104,7 +123,7 @@ def get_column_dtype_info(data: pd.DataFrame) -> Dict[str, List[str]]:
                 dtype_info['numeric'].append(col)
         elif pd.api.types.is_datetime64_dtype(data[col]):
             dtype_info['datetime'].append(col)
-        elif pd.api.types.is_object_dtype(data[col]):
+        elif pd.api.types.is_object_dtype(data[col]) or isinstance(data[col].dtype, pd.CategoricalDtype):
             if data[col].nunique() < min(20, len(data) * 0.1):
                 dtype_info['categorical'].append(col)
             else:
@@ -180,3 +199,177 @@ def truncate_string(text: str, max_length: int = 50) -> str:
         return text
     
     return text[:max_length-3] + "..."
+
+
+def hash_file(file: IO, options: Optional[Dict[str, Any]] = None, block_size: int = 8 * 1024 * 1024) -> str:
+    """
+    Compute a content hash of a file-like object, optionally combined with parse options.
+    
+    The file is read in blocks and rewound afterwards, so large uploads are never
+    copied into a single buffer.
+    
+    Args:
+        file: Binary file-like object (e.g. a Streamlit UploadedFile)
+        options: Optional parse options that affect the loaded result
+        block_size: Number of bytes hashed per read
+        
+    Returns:
+        Hex digest identifying the file contents and options
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    
+    file.seek(0)
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        hasher.update(block)
+    file.seek(0)
+    
+    if options:
+        hasher.update(repr(sorted(options.items())).encode())
+    
+    return hasher.hexdigest()
+
+def column_fingerprint(series: pd.Series) -> str:
+    """
+    Compute a content hash of a column's name, dtype and values.
+    
+    Args:
+        series: Input column
+        
+    Returns:
+        Hex digest identifying the column contents
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(repr((series.name, str(series.dtype), len(series))).encode())
+    
+    values = series.to_numpy()
+    if values.dtype.kind in 'biufcmM':
+        # Fixed-width values are hashed straight from their buffer
+        hasher.update(np.ascontiguousarray(values).view(np.uint8).data)
+    else:
+        hasher.update(pd.util.hash_pandas_object(series, index=False).to_numpy().data)
+    
+    return hasher.hexdigest()
+
+def column_fingerprints(data: pd.DataFrame, fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Compute the fingerprint of every column.
+    
+    DataFrames can be modified in place without any cheap signal (the block buffers
+    stay the same), so fingerprints are not memoized per object. Instead the app
+    computes them once per loaded dataset version and passes them down.
+    
+    Args:
+        data: Input DataFrame
+        fingerprints: Fingerprints already computed for this version of the data;
+            only the columns they do not cover are hashed
+        
+    Returns:
+        Dictionary mapping column names to column fingerprints
+    """
+    fingerprints = fingerprints or {}
+    return {col: fingerprints[col] if col in fingerprints else column_fingerprint(data[col]) for col in data.columns}
+
+def dataset_fingerprint(data: pd.DataFrame, fingerprints: Optional[Dict[str, str]] = None) -> str:
+    """
+    Compute a fingerprint identifying a DataFrame's columns and contents.
+    
+    Args:
+        data: Input DataFrame
+        fingerprints: Column fingerprints already computed for this version of the data
+        
+    Returns:
+        Hex digest combining the column fingerprints in column order
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for col, fingerprint in column_fingerprints(data, fingerprints).items():
+        hasher.update(repr(col).encode())
+        hasher.update(fingerprint.encode())
+    return hasher.hexdigest()
+
+class LRUCache:
+    """Thread-safe cache with least-recently-used eviction, bounded by entry count and total size."""
+    
+    def __init__(self, max_entries: int = 16, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of entries kept
+            max_bytes: Optional limit on the total size of the cached values
+            sizeof: Function returning the size of a value in bytes (required with max_bytes)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for a key and mark it as recently used."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting least recently used entries to stay within bounds."""
+        size = self.sizeof(value)
+        
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            
+            # Values larger than the whole budget are not cached
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.total_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for a key, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key from the cache and return its value."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, size = self._entries.pop(key)
+            self.total_bytes -= size
+            return value
+    
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -1,9 +1,209 @@
+import functools
+import inspect
+import os
+import threading
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from typing import List, Dict, Any, Tuple, Optional
+import plotly.io as pio
+from plotly.subplots import make_subplots
+from typing import List, Dict, Any, Tuple, Optional, Callable
 import numpy as np
 
+from correlation import correlation_matrix
+from utils import LRUCache, dataset_fingerprint
+
+# Scatter plots above this many rows are drawn as a binned density
+SCATTER_MAX_POINTS = 100_000
+
+# Bins per axis of the density view (coarser when each category gets its own layer)
+DENSITY_BINS = 200
+DENSITY_CATEGORY_BINS = 100
+
+# Categories drawn as separate layers in the density view; the rest are grouped
+DENSITY_MAX_CATEGORIES = 10
+
+# Line charts above this many rows are downsampled to it
+LINE_MAX_POINTS = 5_000
+
+# Aggregations offered for bar charts
+BAR_AGGREGATIONS = ['sum', 'mean', 'count']
+
+# Outlier points drawn per box plot at most; the rest are sampled away
+BOX_MAX_OUTLIERS = 2_000
+
+# Upper limit on automatically chosen histogram bins
+DISTRIBUTION_MAX_BINS = 200
+
+# Point traces larger than this are drawn with WebGL instead of SVG
+WEBGL_MIN_POINTS = int(os.environ.get("DATA_INSIGHTS_WEBGL_POINTS", 1_000))
+
+# Trace properties sent to the browser as typed arrays when they hold numbers or dates
+TYPED_ARRAY_PROPERTIES = ['x', 'y', 'z', 'customdata', 'values', 'q1', 'median', 'q3', 'lowerfence', 'upperfence']
+
+# Serialize uncached figures once more to record their size (cached figures are always measured)
+MEASURE_PAYLOAD = os.environ.get("DATA_INSIGHTS_MEASURE_PAYLOAD", "").lower() in ("1", "true", "yes")
+
+# Figures kept across reruns, bounded by their serialized size
+FIGURE_CACHE_ENTRIES = 64
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Serialized figures keyed by (builder, dataset fingerprint, arguments)
+_figure_cache = LRUCache(max_entries=FIGURE_CACHE_ENTRIES, max_bytes=FIGURE_CACHE_BYTES, sizeof=len)
+
+# Nesting depth of cached builders per thread; only the outermost call is cached
+_figure_cache_state = threading.local()
+
+def cached_figure(builder: Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+    """
+    Cache the figures returned by a builder taking a DataFrame as its first argument.
+    
+    Figures are keyed on the builder name, the dataset fingerprint and the remaining
+    arguments, and stored as JSON so every call returns an independent copy that callers
+    can restyle. Pass use_cache=False to bypass the cache, and fingerprints= (column
+    fingerprints of this version of the data) to avoid hashing the data again; builders
+    with a `fingerprints` parameter receive them too. Returned
+    figures are encoded with encode_figure, and the size of the stored JSON is recorded
+    in layout.meta['payload_bytes'].
+    
+    Args:
+        builder: Figure builder function
+        
+    Returns:
+        Wrapped builder
+    """
+    forwards_fingerprints = 'fingerprints' in inspect.signature(builder).parameters
+    
+    @functools.wraps(builder)
+    def wrapper(data: pd.DataFrame, *args, use_cache: bool = True,
+                fingerprints: Optional[Dict[str, str]] = None, **kwargs) -> go.Figure:
+        if forwards_fingerprints:
+            kwargs['fingerprints'] = fingerprints
+        depth = getattr(_figure_cache_state, 'depth', 0)
+        if depth > 0:
+            return builder(data, *args, **kwargs)
+        
+        arguments = {name: value for name, value in kwargs.items() if name != 'fingerprints'}
+        key = (builder.__name__, dataset_fingerprint(data, fingerprints) if use_cache else None,
+               repr(args), repr(sorted(arguments.items())))
+        payload = _figure_cache.get(key) if use_cache else None
+        if payload is None:
+            _figure_cache_state.depth = depth + 1
+            try:
+                fig = encode_figure(builder(data, *args, **kwargs), measure=False if use_cache else None)
+            finally:
+                _figure_cache_state.depth = depth
+            if not use_cache:
+                return fig
+            payload = fig.to_json()
+            _figure_cache.put(key, payload)
+        
+        # The stored JSON is the payload, so its size costs no extra serialization
+        fig = pio.from_json(payload)
+        meta = fig.layout.meta if isinstance(fig.layout.meta, dict) else {}
+        fig.update_layout(meta={**meta, 'payload_bytes': len(payload)})
+        return fig
+    
+    return wrapper
+
+def clear_figure_cache() -> None:
+    """Remove all cached figures."""
+    _figure_cache.clear()
+
+def encode_figure(fig: go.Figure, measure: Optional[bool] = None) -> go.Figure:
+    """
+    Prepare a figure for transport to the browser.
+    
+    Numeric arrays are serialized by Plotly as base64 typed arrays, but dates and plain
+    lists of numbers are sent as JSON text. Dates are converted to milliseconds since
+    the epoch on date-typed axes and lists of numbers to NumPy arrays. Measuring the
+    serialized size takes a full serialization, so it is only recorded on request.
+    
+    Args:
+        fig: Plotly figure, modified in place
+        measure: Record the serialized size as layout.meta['payload_bytes']
+            (defaults to MEASURE_PAYLOAD)
+        
+    Returns:
+        The same figure
+    """
+    date_axes = set()
+    for trace in fig.data:
+        for name in TYPED_ARRAY_PROPERTIES:
+            if name not in trace or trace[name] is None or isinstance(trace[name], (str, dict)):
+                continue
+            values, is_date = _typed_array(trace[name])
+            if values is None:
+                continue
+            # Plotly skips assignments equal to the stored tuple, so the property is cleared first
+            trace[name] = None
+            trace[name] = values
+            if is_date and name in ('x', 'y'):
+                date_axes.add(_axis_name(name, trace[f'{name}axis'] if f'{name}axis' in trace else None))
+    
+    for axis in date_axes:
+        fig.layout[axis].type = 'date'
+    
+    if measure is None:
+        measure = MEASURE_PAYLOAD
+    return record_payload_bytes(fig) if measure else fig
+
+def record_payload_bytes(fig: go.Figure) -> go.Figure:
+    """Record the size of the serialized figure in layout.meta['payload_bytes']."""
+    meta = fig.layout.meta if isinstance(fig.layout.meta, dict) else {}
+    payload_bytes = len(pio.to_json(fig, validate=False))
+    fig.update_layout(meta={**meta, 'payload_bytes': payload_bytes})
+    return fig
+
+def figure_payload_bytes(fig: go.Figure) -> Optional[int]:
+    """Serialized size of a figure as recorded by cached_figure or encode_figure, if any."""
+    meta = fig.layout.meta
+    return meta.get('payload_bytes') if isinstance(meta, dict) else None
+
+def _typed_array(values: Any) -> Tuple[Optional[np.ndarray], bool]:
+    """Values as a numeric array (dates as epoch milliseconds) and whether they were dates, or None."""
+    array = np.asarray(values)
+    if array.dtype.kind == 'M':
+        # NaT becomes NaN, which Plotly draws as a gap
+        epoch_ms = array.astype('datetime64[ms]').astype('int64').astype('float64')
+        epoch_ms[np.isnat(array)] = np.nan
+        return epoch_ms, True
+    if array.ndim == 0 or array.dtype.kind not in 'biuf' or isinstance(values, np.ndarray):
+        return None, False
+    return array, False
+
+def _axis_name(letter: str, reference: Optional[str]) -> str:
+    """Layout key of the axis a trace refers to, e.g. 'x2' -> 'xaxis2'."""
+    return f"{letter}axis{(reference or letter)[1:]}"
+
+def render_mode(point_count: int) -> str:
+    """
+    Choose the renderer for point and line traces.
+    
+    Args:
+        point_count: Number of points drawn
+        
+    Returns:
+        'webgl' above WEBGL_MIN_POINTS points, 'svg' otherwise
+    """
+    return 'webgl' if point_count > WEBGL_MIN_POINTS else 'svg'
+
+def scatter_trace(point_count: int, **kwargs) -> go.Scatter:
+    """
+    Create a scatter trace, using Scattergl when the render mode calls for WebGL.
+    
+    Args:
+        point_count: Number of points in the trace
+        **kwargs: Trace properties
+        
+    Returns:
+        go.Scatter or go.Scattergl trace
+    """
+    if render_mode(point_count) == 'webgl':
+        return go.Scattergl(**kwargs)
+    return go.Scatter(**kwargs)
+
+@cached_figure
 def create_trend_chart(data: pd.DataFrame, x_column: str, y_column: str) -> go.Figure:
     """
     Create a trend chart for the given columns.
@@ -18,16 +218,16 @@ def create_trend_chart(data: pd.DataFrame, x_column: str, y_column: str) -> go.F
     """
     # Check if x_column might be a date
     if data[x_column].dtype == 'datetime64[ns]':
-        # For datetime x-axis, create a line chart
-        fig = px.line(
+        # For datetime x-axis, create a line chart (downsampled for large datasets)
+        fig = line_figure(
             data, 
-            x=x_column, 
-            y=y_column,
+            x_column, 
+            y_column,
             title=f"Trend of {y_column} over {x_column}"
         )
     else:
         # For categorical x-axis, calculate aggregated y values
-        agg_data = data.groupby(x_column)[y_column].agg(['mean', 'count']).reset_index()
+        agg_data = data.groupby(x_column, observed=True)[y_column].agg(['mean', 'count']).reset_index()
         agg_data.columns = [x_column, 'mean', 'count']
         
         # Sort by mean value for better visualization
@@ -58,25 +258,22 @@ def create_trend_chart(data: pd.DataFrame, x_column: str, y_column: str) -> go.F
     
     return fig
 
-def create_correlation_heatmap(data: pd.DataFrame, columns: List[str] = None) -> go.Figure:
+@cached_figure
+def create_correlation_heatmap(data: pd.DataFrame, columns: List[str] = None,
+                               fingerprints: Optional[Dict[str, str]] = None) -> go.Figure:
     """
     Create a correlation heatmap for numerical columns.
     
     Args:
         data: Input DataFrame
         columns: List of columns to include (defaults to all numeric columns)
+        fingerprints: Optional column fingerprints already computed for this version of the data
         
     Returns:
         Plotly figure object
     """
-    # Select numeric columns if not specified
-    if columns is None:
-        numeric_data = data.select_dtypes(include=['number'])
-    else:
-        numeric_data = data[columns].select_dtypes(include=['number'])
-    
-    # Compute correlation matrix
-    corr_matrix = numeric_data.corr(numeric_only=True)
+    # Compute correlation matrix over the numeric columns (cached and shared with the insights)
+    corr_matrix = correlation_matrix(data, columns, fingerprints=fingerprints)
     
     # Create heatmap
     fig = px.imshow(
@@ -95,18 +292,23 @@ def create_correlation_heatmap(data: pd.DataFrame, columns: List[str] = None) ->
     
     return fig
 
-def create_distribution_plot(data: pd.DataFrame, column: str) -> go.Figure:
+@cached_figure
+def create_distribution_plot(data: pd.DataFrame, column: str, bins: Optional[int] = None) -> go.Figure:
     """
     Create a distribution plot for a numeric column.
     
+    Bin counts and the marginal box statistics are computed with NumPy, so the figure
+    size depends on the number of bins, not rows.
+    
     Args:
         data: Input DataFrame
         column: The column to visualize
+        bins: Number of bins (defaults to the Freedman-Diaconis rule)
         
     Returns:
         Plotly figure object
     """
-    if column not in data.columns or data[column].dtype not in ['int64', 'float64']:
+    if column not in data.columns or not pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_bool_dtype(data[column]):
         fig = go.Figure()
         fig.add_annotation(
             text="Selected column is not numeric",
@@ -131,20 +333,38 @@ def create_distribution_plot(data: pd.DataFrame, column: str) -> go.Figure:
         )
         return fig
     
-    # Create a subplot with two y-axes
-    fig = px.histogram(
-        col_data, 
-        x=column,
-        histnorm='probability density',
-        title=f'Distribution of {column}',
-        color_discrete_sequence=['rgba(0, 123, 255, 0.5)'],
-        marginal='box',
-    )
+    # Bin the values and normalize the counts to a probability density
+    values = col_data.to_numpy(dtype='float64')
+    counts, edges = np.histogram(values, bins=histogram_bins(values, bins))
+    widths = np.diff(edges)
+    density = counts / (len(values) * widths)
+    
+    # Histogram below a marginal box plot, as in px.histogram(marginal='box')
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.02)
+    fig.add_trace(go.Bar(
+        x=edges[:-1] + widths / 2,
+        y=density,
+        customdata=np.column_stack([edges[:-1], edges[1:], counts]),
+        marker_color='rgba(0, 123, 255, 0.5)',
+        hovertemplate=f"{column}: %{{customdata[0]:.4g}} to %{{customdata[1]:.4g}}<br>Count: %{{customdata[2]}}<br>Density: %{{y:.4g}}<extra></extra>"
+    ), row=2, col=1)
+    
+    stats, outliers, _ = box_statistics(col_data.to_frame(), column, [])
+    fig.add_trace(go.Box(
+        y=[column], q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+        lowerfence=stats['lowerfence'], upperfence=stats['upperfence'],
+        orientation='h', boxpoints=False, marker_color='rgba(0, 123, 255, 0.5)'
+    ), row=1, col=1)
+    if len(outliers):
+        fig.add_trace(scatter_trace(
+            len(outliers), x=outliers[column], y=[column] * len(outliers), mode='markers',
+            marker=dict(color='rgba(0, 123, 255, 0.5)', size=4)
+        ), row=1, col=1)
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
     
     # Calculate basic statistics for annotations
-    mean_val = col_data.mean()
-    median_val = col_data.median()
-    std_val = col_data.std()
+    mean_val = values.mean()
+    median_val = stats['median'].iloc[0]
     
     # Add vertical lines for mean and median
     fig.add_vline(
@@ -165,15 +385,41 @@ def create_distribution_plot(data: pd.DataFrame, column: str) -> go.Figure:
     
     # Update layout
     fig.update_layout(
-        xaxis_title=column,
-        yaxis_title='Density',
+        title=f'Distribution of {column}',
         plot_bgcolor='white',
         bargap=0.1,
         showlegend=False
     )
+    fig.update_xaxes(title_text=column, row=2, col=1)
+    fig.update_yaxes(title_text='Density', row=2, col=1)
     
-    return fig
+    return _record_level_of_detail(fig, len(data), len(counts) + 1 + len(outliers), 'aggregate')
 
+def histogram_bins(values: np.ndarray, bins: Optional[int] = None) -> np.ndarray:
+    """
+    Compute histogram bin edges.
+    
+    Args:
+        values: Finite numeric values
+        bins: Number of bins (defaults to the Freedman-Diaconis rule, capped at DISTRIBUTION_MAX_BINS)
+        
+    Returns:
+        Array of bin edges
+    """
+    if bins is not None:
+        return np.histogram_bin_edges(values, bins)
+    
+    # Freedman-Diaconis bin width, 2 * IQR / n^(1/3); Sturges when the IQR is zero
+    q1, q3 = np.percentile(values, [25, 75])
+    width = 2 * (q3 - q1) / len(values) ** (1 / 3)
+    value_range = values.max() - values.min()
+    if width <= 0 or value_range <= 0:
+        return np.histogram_bin_edges(values, 'sturges')
+    
+    count = int(np.clip(np.ceil(value_range / width), 1, DISTRIBUTION_MAX_BINS))
+    return np.histogram_bin_edges(values, count)
+
+@cached_figure
 def create_scatter_plot(data: pd.DataFrame, x_column: str, y_column: str, color_column: Optional[str] = None) -> go.Figure:
     """
     Create a scatter plot for two numeric columns.
@@ -187,12 +433,12 @@ def create_scatter_plot(data: pd.DataFrame, x_column: str, y_column: str, color_
     Returns:
         Plotly figure object
     """
-    # Create the scatter plot
-    fig = px.scatter(
+    # Create the scatter plot (a binned density for large datasets)
+    fig = scatter_figure(
         data,
-        x=x_column,
-        y=y_column,
-        color=color_column,
+        x_column,
+        y_column,
+        color_column,
         title=f"{y_column} vs {x_column}",
         opacity=0.7,
         size_max=10
@@ -222,6 +468,7 @@ def create_scatter_plot(data: pd.DataFrame, x_column: str, y_column: str, color_
     
     return fig
 
+@cached_figure
 def create_bar_chart(data: pd.DataFrame, x_column: str, y_column: Optional[str] = None) -> go.Figure:
     """
     Create a bar chart for a categorical column.
@@ -256,7 +503,7 @@ def create_bar_chart(data: pd.DataFrame, x_column: str, y_column: Optional[str]
         )
     else:
         # Group by categorical column and calculate mean of numeric column
-        agg_data = data.groupby(x_column)[y_column].mean().reset_index()
+        agg_data = data.groupby(x_column, observed=True)[y_column].mean().reset_index()
         
         # Only take top 20 categories for readability
         if len(agg_data) > 20:
@@ -283,6 +530,7 @@ def create_bar_chart(data: pd.DataFrame, x_column: str, y_column: Optional[str]
     
     return fig
 
+@cached_figure
 def create_box_plot(data: pd.DataFrame, x_column: str, y_column: str) -> go.Figure:
     """
     Create a box plot for a numeric column grouped by a categorical column.
@@ -295,33 +543,20 @@ def create_box_plot(data: pd.DataFrame, x_column: str, y_column: str) -> go.Figu
     Returns:
         Plotly figure object
     """
-    # Calculate category counts for hover info
-    category_counts = data[x_column].value_counts().to_dict()
-    
-    # Create box plot
-    fig = px.box(
+    # Create box plot from precomputed statistics
+    fig = box_figure(
         data,
-        x=x_column,
-        y=y_column,
-        title=f"Distribution of {y_column} by {x_column}",
-        points="outliers"
+        x_column,
+        y_column,
+        title=f"Distribution of {y_column} by {x_column}"
     )
     
-    # Add category counts as annotations
-    annotations = []
-    for i, category in enumerate(fig.data[0].x):
-        if category in category_counts:
-            annotations.append(
-                dict(
-                    x=i,
-                    y=data[y_column].max(),
-                    text=f"n={category_counts[category]}",
-                    showarrow=False,
-                    yshift=10
-                )
-            )
-    
-    fig.update_layout(annotations=annotations)
+    # Add category counts as annotations, one per box
+    categories = pd.unique(fig.data[0].x)
+    category_counts = data[x_column].value_counts().reindex(categories, fill_value=0)
+    y_max = data[y_column].max()
+    for category, count in category_counts.items():
+        fig.add_annotation(x=category, y=y_max, text=f"n={count}", showarrow=False, yshift=10)
     
     # Update layout
     fig.update_layout(
@@ -332,3 +567,459 @@ def create_box_plot(data: pd.DataFrame, x_column: str, y_column: str) -> go.Figu
     )
     
     return fig
+
+@cached_figure
+def scatter_figure(data: pd.DataFrame, x_column: str, y_column: str,
+                   color_column: Optional[str] = None, size_column: Optional[str] = None,
+                   title: Optional[str] = None, max_points: Optional[int] = None, **kwargs) -> go.Figure:
+    """
+    Create a scatter plot, switching to a binned density view for large datasets.
+    
+    Up to `max_points` rows are drawn as individual markers. Above it, numeric and datetime
+    axes are aggregated on the server into a 2D-binned raster (row counts, the mean of a numeric
+    color column, or one binned layer per category), and other axes are sampled. Traces
+    above WEBGL_MIN_POINTS points are drawn with WebGL. The figure's layout.meta records
+    the number of rows it represents.
+    
+    Args:
+        data: Input DataFrame
+        x_column: Column for x-axis
+        y_column: Column for y-axis
+        color_column: Optional column for color encoding
+        size_column: Optional column for marker size (individual markers only)
+        title: Chart title
+        max_points: Row count above which the density view is used (defaults to SCATTER_MAX_POINTS)
+        **kwargs: Extra arguments passed to px.scatter
+        
+    Returns:
+        Plotly figure object
+    """
+    if max_points is None:
+        max_points = SCATTER_MAX_POINTS
+    row_count = len(data)
+    
+    if row_count <= max_points:
+        kwargs.setdefault('render_mode', render_mode(row_count))
+        fig = px.scatter(data, x=x_column, y=y_column, color=color_column, size=size_column, title=title, **kwargs)
+        return _record_level_of_detail(fig, row_count, row_count, 'full')
+    
+    if not (_is_binnable(data[x_column]) and _is_binnable(data[y_column])):
+        # Other axes cannot be binned; draw a reproducible random sample instead
+        kwargs.setdefault('render_mode', render_mode(max_points))
+        sample = data.sample(max_points, random_state=0)
+        fig = px.scatter(sample, x=x_column, y=y_column, color=color_column, size=size_column, title=title, **kwargs)
+        return _record_level_of_detail(fig, row_count, max_points, 'sample')
+    
+    fig, cells = _density_figure(data, x_column, y_column, color_column)
+    fig.update_layout(title=title, xaxis_title=x_column, yaxis_title=y_column)
+    return _record_level_of_detail(fig, row_count, cells, 'density')
+
+@cached_figure
+def line_figure(data: pd.DataFrame, x_column: str, y_column: str,
+                color_column: Optional[str] = None, title: Optional[str] = None,
+                max_points: Optional[int] = None, method: str = 'lttb', **kwargs) -> go.Figure:
+    """
+    Create a line chart, downsampling each line on the server for large datasets.
+    
+    Above `max_points` rows each line (one per color group) is sorted by x and reduced
+    with Largest-Triangle-Three-Buckets or min-max bucketing, which keep the visual
+    shape, peaks included. Lines above WEBGL_MIN_POINTS points are drawn with WebGL. The
+    figure's layout.meta records the number of rows it represents.
+    
+    Args:
+        data: Input DataFrame
+        x_column: Column for x-axis
+        y_column: Column for y-axis
+        color_column: Optional column to split lines by
+        title: Chart title
+        max_points: Total points drawn at most (defaults to LINE_MAX_POINTS)
+        method: 'lttb' or 'minmax'
+        **kwargs: Extra arguments passed to px.line
+        
+    Returns:
+        Plotly figure object
+    """
+    if max_points is None:
+        max_points = LINE_MAX_POINTS
+    row_count = len(data)
+    
+    if row_count <= max_points:
+        kwargs.setdefault('render_mode', render_mode(row_count))
+        fig = px.line(data, x=x_column, y=y_column, color=color_column, title=title, **kwargs)
+        return _record_level_of_detail(fig, row_count, row_count, 'full')
+    
+    columns = list(dict.fromkeys([x_column, y_column] + ([color_column] if color_column else [])))
+    frame = data[columns].dropna(subset=[x_column, y_column])
+    groups = list(frame.groupby(color_column, observed=True, sort=False)) if color_column else [(None, frame)]
+    budget = max(max_points // max(len(groups), 1), 4)
+    
+    parts = []
+    for _, group in groups:
+        # Lines over numbers or dates are drawn in x order
+        ordered = _is_numeric(group[x_column]) or pd.api.types.is_datetime64_any_dtype(group[x_column])
+        if ordered:
+            group = group.sort_values(x_column, kind='stable')
+        x_values = _as_float(group[x_column]) if ordered else np.arange(len(group), dtype='float64')
+        y_values = group[y_column].to_numpy(dtype='float64', na_value=np.nan)
+        
+        if method == 'minmax':
+            indices = minmax_indices(y_values, budget)
+        else:
+            indices = lttb_indices(x_values, y_values, budget)
+        parts.append(group.iloc[indices])
+    
+    reduced = pd.concat(parts) if parts else frame
+    kwargs.setdefault('render_mode', render_mode(len(reduced)))
+    fig = px.line(reduced, x=x_column, y=y_column, color=color_column, title=title, **kwargs)
+    return _record_level_of_detail(fig, row_count, len(reduced), method)
+
+@cached_figure
+def aggregated_bar_figure(data: pd.DataFrame, x_column: str, y_column: Optional[str] = None,
+                          color_column: Optional[str] = None, agg: str = 'sum',
+                          title: Optional[str] = None, **kwargs) -> go.Figure:
+    """
+    Create a bar chart from per-category aggregates instead of raw rows.
+    
+    Rows are grouped by category (and color) in pandas first, so the figure holds one bar
+    per group and its size depends on the number of categories, not rows. Summed and
+    counted bars stack by color like a raw-row bar chart; mean bars are grouped.
+    
+    Args:
+        data: Input DataFrame
+        x_column: Category column
+        y_column: Value column (rows are counted if not given)
+        color_column: Optional column to split bars by
+        agg: 'sum', 'mean' or 'count'
+        title: Chart title
+        **kwargs: Extra arguments passed to px.bar
+        
+    Returns:
+        Plotly figure object
+    """
+    if agg not in BAR_AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation: {agg}")
+    
+    keys = [x_column] + ([color_column] if color_column and color_column != x_column else [])
+    grouped = data.groupby(keys, observed=True, sort=False)
+    
+    if y_column is None:
+        agg_data = grouped.size().rename('count').reset_index()
+        value_column = 'count'
+    elif agg == 'count':
+        agg_data = grouped[y_column].count().rename('count').reset_index()
+        value_column = 'count'
+    else:
+        agg_data = grouped[y_column].agg(agg).reset_index()
+        value_column = y_column
+    
+    fig = px.bar(
+        agg_data,
+        x=x_column,
+        y=value_column,
+        color=color_column,
+        title=title,
+        barmode='group' if agg == 'mean' else 'relative',
+        **kwargs
+    )
+    return _record_level_of_detail(fig, len(data), len(agg_data), 'aggregate')
+
+@cached_figure
+def box_figure(data: pd.DataFrame, x_column: Optional[str], y_column: str,
+               color_column: Optional[str] = None, title: Optional[str] = None,
+               max_outliers: Optional[int] = None) -> go.Figure:
+    """
+    Create a box plot from statistics computed on the server.
+    
+    Quartiles and Tukey whiskers are computed per group in pandas and passed to Plotly
+    as precomputed boxes, so no raw values are serialized. Only outliers are drawn as
+    points, capped at `max_outliers` by sampling while keeping each group's extremes.
+    
+    Args:
+        data: Input DataFrame
+        x_column: Optional category column (one box per category)
+        y_column: Numeric column
+        color_column: Optional column to split boxes by
+        title: Chart title
+        max_outliers: Outlier points drawn at most (defaults to BOX_MAX_OUTLIERS)
+        
+    Returns:
+        Plotly figure object
+    """
+    if max_outliers is None:
+        max_outliers = BOX_MAX_OUTLIERS
+    
+    keys = [col for col in dict.fromkeys([x_column, color_column]) if col]
+    stats, outliers, outlier_count = box_statistics(data, y_column, keys, max_outliers)
+    palette = px.colors.qualitative.Plotly
+    
+    fig = go.Figure()
+    color_groups = stats.groupby(color_column, observed=True, sort=False) if color_column else [(None, stats)]
+    for i, (color_value, group) in enumerate(color_groups):
+        name = str(color_value) if color_column else y_column
+        color = palette[i % len(palette)]
+        positions = group[x_column] if x_column else [y_column] * len(group)
+        fig.add_trace(go.Box(
+            x=positions, q1=group['q1'], median=group['median'], q3=group['q3'],
+            lowerfence=group['lowerfence'], upperfence=group['upperfence'],
+            name=name, legendgroup=name, offsetgroup=name, marker_color=color, boxpoints=False
+        ))
+        
+        points = outliers[outliers[color_column] == color_value] if color_column else outliers
+        if len(points):
+            fig.add_trace(go.Scatter(
+                x=points[x_column] if x_column else [y_column] * len(points), y=points[y_column],
+                mode='markers', name=name, legendgroup=name, offsetgroup=name, showlegend=False,
+                marker=dict(color=color, size=4)
+            ))
+    
+    fig.update_layout(title=title, boxmode='group', scattermode='group', xaxis_title=x_column, yaxis_title=y_column)
+    if len(outliers) < outlier_count:
+        fig.add_annotation(
+            text=f"{len(outliers):,} of {outlier_count:,} outliers shown", xref='paper', yref='paper',
+            x=1, y=1.02, xanchor='right', yanchor='bottom', showarrow=False, font=dict(size=11, color='gray')
+        )
+    return _record_level_of_detail(fig, len(data), len(stats) + len(outliers), 'aggregate')
+
+def box_statistics(data: pd.DataFrame, y_column: str, keys: List[str],
+                   max_outliers: int = BOX_MAX_OUTLIERS) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
+    """
+    Compute box plot statistics per group.
+    
+    Args:
+        data: Input DataFrame
+        y_column: Numeric column
+        keys: Columns to group by (empty for a single box)
+        max_outliers: Outlier rows returned at most
+        
+    Returns:
+        Tuple of (statistics with the key columns and q1, median, q3, lowerfence,
+        upperfence and count per group; sampled outlier rows; total outlier count)
+    """
+    frame = data[list(dict.fromkeys(keys + [y_column]))].dropna(subset=list(dict.fromkeys(keys + [y_column])))
+    # Infinite values have no quartiles; groups without finite values get no box
+    frame = frame[np.isfinite(frame[y_column].to_numpy(dtype='float64'))]
+    
+    if keys:
+        groups = frame.groupby(keys, observed=True, sort=False)
+        codes = groups.ngroup().to_numpy()
+        stats = groups.size().rename('count').reset_index()
+    else:
+        codes = np.zeros(len(frame), dtype=np.intp)
+        stats = pd.DataFrame({'count': [len(frame)] if len(frame) else []}, dtype='int64')
+    
+    values = pd.Series(frame[y_column].to_numpy(dtype='float64'))
+    quartiles = (values.groupby(codes).quantile([0.25, 0.5, 0.75]).unstack()
+                 .reindex(index=range(len(stats)), columns=[0.25, 0.5, 0.75]))
+    q1, median, q3 = (quartiles[q].to_numpy() for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    
+    # Whiskers reach the most extreme values within 1.5 IQR of the box
+    inside = ((values >= (q1 - 1.5 * iqr)[codes]) & (values <= (q3 + 1.5 * iqr)[codes])).to_numpy()
+    stats['q1'], stats['median'], stats['q3'] = q1, median, q3
+    stats['lowerfence'] = values[inside].groupby(codes[inside]).min().reindex(range(len(stats))).to_numpy()
+    stats['upperfence'] = values[inside].groupby(codes[inside]).max().reindex(range(len(stats))).to_numpy()
+    
+    outliers = frame[~inside]
+    outlier_count = len(outliers)
+    if outlier_count > max_outliers:
+        outliers = _sample_outliers(outliers, codes[~inside], y_column, max_outliers)
+    
+    return stats, outliers, outlier_count
+
+def _sample_outliers(outliers: pd.DataFrame, codes: np.ndarray, y_column: str, max_outliers: int) -> pd.DataFrame:
+    """Sample outliers evenly across groups, always keeping each group's lowest and highest."""
+    values = outliers[y_column].to_numpy(dtype='float64')
+    by_group = pd.Series(values).groupby(codes)
+    keep = np.zeros(len(outliers), dtype=bool)
+    keep[by_group.idxmin().to_numpy()] = True
+    keep[by_group.idxmax().to_numpy()] = True
+    
+    # A random rank within each group picks an equal share per group
+    per_group = max((max_outliers - int(keep.sum())) // by_group.ngroups, 0)
+    order = np.lexsort((np.random.default_rng(0).random(len(outliers)), codes))
+    group_starts = np.searchsorted(codes[order], codes[order], side='left')
+    rank = np.arange(len(order)) - group_starts
+    keep[order[rank < per_group]] = True
+    
+    return outliers[keep]
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select points with Largest-Triangle-Three-Buckets downsampling.
+    
+    Args:
+        x: X values, sorted ascending
+        y: Y values
+        n_out: Number of points to keep (at least 3)
+        
+    Returns:
+        Sorted indices of the kept points, always including the first and last point
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    # The first and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        
+        # Keep the point forming the largest triangle with the previous pick and the next bucket's mean
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    
+    return selected
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select the minimum and maximum of each of n_out / 2 equal buckets.
+    
+    Args:
+        y: Y values, ordered along x
+        n_out: Number of points to keep, at most
+        
+    Returns:
+        Sorted indices of the kept points
+    """
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if n_out >= n:
+        return np.arange(n)
+    
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    
+    # Padding never wins the minimum or the maximum
+    lows = offsets + np.where(np.isnan(padded), np.inf, padded).argmin(axis=1)
+    highs = offsets + np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)
+    return np.unique(np.clip(np.concatenate([lows, highs]), 0, n - 1))
+
+def _density_figure(data: pd.DataFrame, x_column: str, y_column: str,
+                    color_column: Optional[str]) -> Tuple[go.Figure, int]:
+    """Aggregate two numeric or datetime columns into a 2D-binned density figure; returns it with the number of cells drawn."""
+    columns = list(dict.fromkeys([x_column, y_column] + ([color_column] if color_column else [])))
+    frame = data[columns].dropna(subset=[x_column, y_column])
+    # Infinite values have no bin, and would stretch the edges to an infinite range
+    frame = frame[np.isfinite(_as_float(frame[x_column])) & np.isfinite(_as_float(frame[y_column]))]
+    colors = frame[color_column] if color_column else None
+    categorical = colors is not None and not _is_numeric(colors)
+    
+    # Every row is binned once into a cell index
+    bins = DENSITY_CATEGORY_BINS if categorical else DENSITY_BINS
+    x_edges, x_index = _bin(_as_float(frame[x_column]), bins)
+    y_edges, y_index = _bin(_as_float(frame[y_column]), bins)
+    cells = x_index * bins + y_index
+    x_centers = _bin_centers(x_edges, frame[x_column])
+    y_centers = _bin_centers(y_edges, frame[y_column])
+    hover = f"{x_column}: %{{x}}<br>{y_column}: %{{y}}<br>"
+    
+    if colors is None:
+        counts = np.bincount(cells, minlength=bins * bins).reshape(bins, bins)
+        # Empty bins stay transparent
+        fig = go.Figure(go.Heatmap(
+            x=x_centers, y=y_centers, z=np.where(counts > 0, counts, np.nan).T,
+            colorscale='Viridis', colorbar=dict(title='Rows'),
+            hovertemplate=hover + "Rows: %{z}<extra></extra>"
+        ))
+        return fig, int(np.count_nonzero(counts))
+    
+    if not categorical:
+        # Numeric colors become the per-bin mean
+        values = colors.to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(values)
+        sums = np.bincount(cells[valid], weights=values[valid], minlength=bins * bins).reshape(bins, bins)
+        counts = np.bincount(cells[valid], minlength=bins * bins).reshape(bins, bins)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        fig = go.Figure(go.Heatmap(
+            x=x_centers, y=y_centers, z=means.T,
+            colorscale='Viridis', colorbar=dict(title=f"Mean {color_column}"),
+            hovertemplate=hover + f"Mean {color_column}: %{{z}}<extra></extra>"
+        ))
+        return fig, int(np.count_nonzero(counts))
+    
+    # One layer of occupied bins per category; rare categories are grouped together
+    codes, categories = pd.factorize(colors)
+    labels = [str(category) for category in categories] + ['Missing']
+    codes = np.where(codes < 0, len(categories), codes)
+    frequency = np.bincount(codes, minlength=len(labels))
+    top = np.argsort(-frequency, kind='stable')[:DENSITY_MAX_CATEGORIES]
+    top = top[frequency[top] > 0]
+    layer_of = np.full(len(labels), len(top))
+    layer_of[top] = np.arange(len(top))
+    layer_labels = [labels[code] for code in top] + ['Other']
+    
+    layers = np.bincount(layer_of[codes] * bins * bins + cells,
+                         minlength=len(layer_labels) * bins * bins).reshape(len(layer_labels), bins, bins)
+    
+    fig = go.Figure()
+    for label, layer in zip(layer_labels, layers):
+        x_cell, y_cell = np.nonzero(layer)
+        if len(x_cell) == 0:
+            continue
+        fig.add_trace(scatter_trace(
+            len(x_cell), x=x_centers[x_cell], y=y_centers[y_cell], mode='markers', name=label,
+            marker=dict(size=5, opacity=0.6), customdata=layer[x_cell, y_cell],
+            hovertemplate=hover + f"{color_column}: {label}<br>Rows: %{{customdata}}<extra></extra>"
+        ))
+    fig.update_layout(legend_title_text=color_column)
+    return fig, int(np.count_nonzero(layers))
+
+def _bin(values: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Equal-width bin edges of values and the bin index of each value."""
+    edges = np.histogram_bin_edges(values, bins)
+    index = ((values - edges[0]) / (edges[-1] - edges[0]) * bins).astype(np.intp)
+    return edges, np.clip(index, 0, bins - 1)
+
+def _bin_centers(edges: np.ndarray, series: pd.Series) -> np.ndarray:
+    """Centers of bins over the values of a column, as datetimes for datetime columns."""
+    centers = (edges[:-1] + edges[1:]) / 2
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Reverses _as_float, in the column's own unit and time zone
+        return pd.DatetimeIndex(pd.Series(centers.astype("int64")).astype(series.dtype))
+    return centers
+
+def _record_level_of_detail(fig: go.Figure, row_count: int, rendered_points: int, mode: str) -> go.Figure:
+    """Record the rows a figure represents in layout.meta and note any reduction on the chart."""
+    fig.update_layout(meta={'row_count': int(row_count), 'rendered_points': int(rendered_points), 'level_of_detail': mode})
+    
+    # Full and aggregated figures are exact and need no note
+    if mode not in ('full', 'aggregate'):
+        descriptions = {
+            'density': f"Binned density of {row_count:,} rows ({rendered_points:,} cells)",
+            'sample': f"Random sample of {rendered_points:,} of {row_count:,} rows",
+            'lttb': f"{rendered_points:,} of {row_count:,} points (LTTB downsampled)",
+            'minmax': f"{rendered_points:,} of {row_count:,} points (min-max downsampled)"
+        }
+        fig.add_annotation(
+            text=descriptions.get(mode, mode), xref='paper', yref='paper', x=1, y=1.02,
+            xanchor='right', yanchor='bottom', showarrow=False, font=dict(size=11, color='gray')
+        )
+    
+    return fig
+
+def _is_numeric(series: pd.Series) -> bool:
+    """Whether a column holds numbers (booleans excluded)."""
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+def _is_binnable(series: pd.Series) -> bool:
+    """Whether a column can be binned into a density view (numbers or datetimes)."""
+    return _is_numeric(series) or pd.api.types.is_datetime64_any_dtype(series)
+
+def _as_float(series: pd.Series) -> np.ndarray:
+    """Numeric or datetime values as a float64 array."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('int64').to_numpy(dtype='float64')
+    return series.to_numpy(dtype='float64', na_value=np.nan)